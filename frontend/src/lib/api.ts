@@ -117,6 +117,34 @@ class ApiClient {
     return this.handleResponse(response);
   }
 
+  async getUsageHistory(
+    start?: string,
+    end?: string
+  ): Promise<{ start: string; end: string; days: Array<{ day: string; endpoint: string; success: boolean; count: number }> }> {
+    const params = new URLSearchParams();
+    if (start) params.set('start', start);
+    if (end) params.set('end', end);
+    const response = await fetch(`${API_BASE_URL}/api/v1/usage/history/?${params}`, {
+      method: 'GET',
+      headers: this.getHeaders(),
+      credentials: 'include',
+    });
+    return this.handleResponse(response);
+  }
+
+  async getUsageEvents(
+    cursor?: string | null
+  ): Promise<{ results: Array<{ id: number; used_at: string; endpoint: string; success: boolean }>; next: string | null }> {
+    const params = new URLSearchParams();
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${API_BASE_URL}/api/v1/usage/history/events/?${params}`, {
+      method: 'GET',
+      headers: this.getHeaders(),
+      credentials: 'include',
+    });
+    return this.handleResponse(response);
+  }
+
   // ============= API Key Management Endpoints =============
 
   async listAPIKeys(): Promise<Array<{ id: number; masked_key: string; created_at: string; last_used_at: string | null }>> {
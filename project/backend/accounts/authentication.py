@@ -1,14 +1,27 @@
 import secrets
 from datetime import datetime, timezone as dt_timezone
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
+from django.db import connection
 from rest_framework import authentication, exceptions
 from rest_framework.exceptions import Throttled
 
-from accounts.models import APIKey, UsageLog
+from accounts.models import APIKey, UsageLog, User
+from accounts.services import api_key_cache
+from accounts.services.api_key import hash_key, record_last_used
 
-DAILY_TAGGING_LIMIT = 15
+
+def get_daily_limit(user):
+    """The user's own daily tagging limit, or the site-wide default."""
+    if user.daily_tagging_limit is not None:
+        return user.daily_tagging_limit
+    return settings.TAGGING_DAILY_LIMIT
+
+
+def limit_reached_detail(limit):
+    return f"Daily tagging limit reached ({limit} requests per day)."
 
 
 def get_utc_midnight():
@@ -44,8 +57,7 @@ class APIKeyAuthentication(authentication.BaseAuthentication):
 
         self._enforce_daily_limit(user)
 
-        api_key.last_used_at = timezone.now()
-        api_key.save(update_fields=["last_used_at"])
+        record_last_used(api_key, timezone.now())
 
         return user, None
 
@@ -76,46 +88,39 @@ class APIKeyAuthentication(authentication.BaseAuthentication):
         if not raw_key:
             return None
 
+        digest = self._hash_key(raw_key)
+        cached, epoch = api_key_cache.get(digest)
+        if cached is not None:
+            return cached
+
         prefix = raw_key[:16]
         try:
             stored = APIKey.objects.select_related("user").get(prefix=prefix)
         except APIKey.DoesNotExist:
             return None
 
-        if not secrets.compare_digest(stored.key, self._hash_key(raw_key)):
+        if not secrets.compare_digest(stored.key, digest):
             return None
 
+        if stored.user.is_active:
+            api_key_cache.set(digest, stored, epoch)
         return stored
 
     def _hash_key(self, raw_key: str) -> str:
-        from accounts.services.api_key import hash_key
         return hash_key(raw_key)
 
     def _enforce_daily_limit(self, user):
-        """Enforce daily 15-request limit per user (UTC midnight reset)."""
-        now = timezone.now()
-
-        with transaction.atomic():
-            locked_user = (
-                type(user)
-                .objects.select_for_update()
-                .get(pk=user.pk)
-            )
-
-            # Check if we need to reset the daily count
-            today_midnight = get_utc_midnight()
-            if should_reset_daily_count(locked_user.daily_count_reset_at):
-                locked_user.daily_tagging_count = 0
-                locked_user.daily_count_reset_at = today_midnight
-                locked_user.save(update_fields=["daily_tagging_count", "daily_count_reset_at"])
-
-            # Check if limit would be exceeded
-            if locked_user.daily_tagging_count >= DAILY_TAGGING_LIMIT:
-                raise Throttled(detail="Daily tagging limit reached (15 requests per day).")
+        """Reject keys whose user has already used up today's quota.
 
-            # Increment count for this request
-            locked_user.daily_tagging_count += 1
-            locked_user.save(update_fields=["daily_tagging_count"])
+        Read-only: ``user`` was loaded with the key, so this costs no query.
+        The quota itself is charged once, by ``DailyLimitChecker`` in the
+        tagging views.
+        """
+        if should_reset_daily_count(user.daily_count_reset_at):
+            return
+        limit = get_daily_limit(user)
+        if user.daily_tagging_count >= limit:
+            raise Throttled(detail=limit_reached_detail(limit))
 
 
 class CsrfExemptSessionAuthentication(authentication.SessionAuthentication):
@@ -129,39 +134,115 @@ class CsrfExemptSessionAuthentication(authentication.SessionAuthentication):
         return
 
 
+def raise_limit_exceeded(limit, remaining):
+    """Raise the ``Throttled`` error for a charge that does not fit."""
+    if remaining <= 0:
+        raise Throttled(detail=limit_reached_detail(limit))
+    raise Throttled(detail=f"Daily tagging limit would be exceeded ({remaining} requests left today).")
+
+
+def _charge_sql(returning):
+    """Conditional UPDATE that resets a stale count and charges ``count``.
+
+    The row only changes when the charge fits in today's quota, so the
+    check and the increment happen in one statement under the row lock the
+    UPDATE takes anyway; nothing is held across round trips.
+    """
+    qn = connection.ops.quote_name
+    count_col = qn(User._meta.get_field("daily_tagging_count").column)
+    reset_col = qn(User._meta.get_field("daily_count_reset_at").column)
+    limit_col = qn(User._meta.get_field("daily_tagging_limit").column)
+    stale = f"({reset_col} IS NULL OR {reset_col} < %(midnight)s)"
+    sql = (
+        f"UPDATE {qn(User._meta.db_table)} SET "
+        f"{count_col} = CASE WHEN {stale} THEN %(count)s ELSE {count_col} + %(count)s END, "
+        f"{reset_col} = CASE WHEN {stale} THEN %(midnight)s ELSE {reset_col} END "
+        f"WHERE {qn(User._meta.pk.column)} = %(pk)s "
+        f"AND (CASE WHEN {stale} THEN 0 ELSE {count_col} END) + %(count)s <= COALESCE({limit_col}, %(limit)s)"
+    )
+    if returning:
+        sql += f" RETURNING {count_col}"
+    return sql
+
+
+def _update_can_return() -> bool:
+    """Whether the database supports ``UPDATE ... RETURNING``.
+
+    Django's ``can_return_columns_from_insert`` only describes INSERT:
+    MariaDB returns columns from INSERT but not from UPDATE. PostgreSQL and
+    SQLite 3.35+ support both; elsewhere the count is re-read after the UPDATE.
+    """
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+
 class DailyLimitChecker:
     """Helper to check and enforce daily tagging limit for session-authenticated users."""
 
     @staticmethod
-    def check_and_increment(user):
+    def check_and_increment(user, count=1):
         """Check if user has remaining daily quota and increment count.
         
+        ``count`` charges several taggings at once (batch requests); the
+        whole charge is refused if it does not fit in today's quota.
         Raises Throttled if limit exceeded.
         Returns the updated count.
+
+        With ``TAGGING_LOCAL_QUOTA_ENABLED`` the charge goes to the node-local
+        store in ``api_gateway.throttling``, which flushes to the database.
+        """
+        if settings.TAGGING_LOCAL_QUOTA_ENABLED:
+            from api_gateway.throttling import local_quota
+
+            return local_quota().charge(user, count)
+
+        params = {
+            "midnight": connection.ops.adapt_datetimefield_value(get_utc_midnight()),
+            "count": count,
+            "limit": settings.TAGGING_DAILY_LIMIT,
+            "pk": user.pk,
+        }
+        returning = _update_can_return()
+        with connection.cursor() as cursor:
+            cursor.execute(_charge_sql(returning), params)
+            if returning:
+                row = cursor.fetchone()
+                charged = row is not None
+            else:
+                charged = cursor.rowcount == 1
+        if not charged:
+            usage = DailyLimitChecker.get_usage_info(user)
+            raise_limit_exceeded(usage["limit"], usage["remaining"])
+        if returning:
+            return row[0]
+        return DailyLimitChecker.get_usage_info(user)["used"]
+
+    @staticmethod
+    def check_remaining(user, count=1):
+        """Raise Throttled unless ``count`` more taggings fit today, without charging them.
+
+        For streamed responses, which are charged once they have finished.
+        """
+        usage = DailyLimitChecker.get_usage_info(user)
+        if usage["remaining"] < count:
+            raise_limit_exceeded(usage["limit"], usage["remaining"])
+
+    @staticmethod
+    async def acheck_remaining(user, count=1):
+        """Async variant of ``check_remaining``."""
+        await sync_to_async(DailyLimitChecker.check_remaining)(user, count)
+
+    @staticmethod
+    async def acheck_and_increment(user, count=1):
+        """Async variant of ``check_and_increment`` for async views.
+
+        The UPDATE runs in a worker thread so the event loop is not blocked
+        while waiting on the database.
         """
-        with transaction.atomic():
-            locked_user = (
-                type(user)
-                .objects.select_for_update()
-                .get(pk=user.pk)
-            )
-
-            # Check if we need to reset the daily count
-            today_midnight = get_utc_midnight()
-            if should_reset_daily_count(locked_user.daily_count_reset_at):
-                locked_user.daily_tagging_count = 0
-                locked_user.daily_count_reset_at = today_midnight
-                locked_user.save(update_fields=["daily_tagging_count", "daily_count_reset_at"])
-
-            # Check if limit would be exceeded
-            if locked_user.daily_tagging_count >= DAILY_TAGGING_LIMIT:
-                raise Throttled(detail="Daily tagging limit reached (15 requests per day).")
-
-            # Increment count for this request
-            locked_user.daily_tagging_count += 1
-            locked_user.save(update_fields=["daily_tagging_count"])
-
-            return locked_user.daily_tagging_count
+        return await sync_to_async(DailyLimitChecker.check_and_increment)(user, count)
 
     @staticmethod
     def get_usage_info(user):
@@ -169,23 +250,24 @@ class DailyLimitChecker:
         
         Returns: {"used": int, "limit": int, "remaining": int}
         """
-        with transaction.atomic():
-            locked_user = (
-                type(user)
-                .objects.select_for_update()
-                .get(pk=user.pk)
-            )
-
-            # Check if we need to reset the daily count
-            today_midnight = get_utc_midnight()
-            if should_reset_daily_count(locked_user.daily_count_reset_at):
-                locked_user.daily_tagging_count = 0
-                locked_user.daily_count_reset_at = today_midnight
-                locked_user.save(update_fields=["daily_tagging_count", "daily_count_reset_at"])
-
-            used = locked_user.daily_tagging_count
-            return {
-                "used": used,
-                "limit": DAILY_TAGGING_LIMIT,
-                "remaining": max(0, DAILY_TAGGING_LIMIT - used),
-            }
+        if settings.TAGGING_LOCAL_QUOTA_ENABLED:
+            from api_gateway.throttling import local_quota
+
+            return local_quota().usage(user)
+
+        used, reset_at, limit = (
+            type(user)
+            .objects.filter(pk=user.pk)
+            .values_list("daily_tagging_count", "daily_count_reset_at", "daily_tagging_limit")
+            .get()
+        )
+        # A count from before today's UTC midnight is reset by the next charge.
+        if should_reset_daily_count(reset_at):
+            used = 0
+        if limit is None:
+            limit = settings.TAGGING_DAILY_LIMIT
+        return {
+            "used": used,
+            "limit": limit,
+            "remaining": max(0, limit - used),
+        }
@@ -0,0 +1,18 @@
+# Generated migration for per-user daily tagging limits
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_add_daily_tagging_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='daily_tagging_limit',
+            field=models.PositiveIntegerField(blank=True, help_text='Daily tagging limit for this user (TAGGING_DAILY_LIMIT when empty)', null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated migration for the usage history keyset index
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_daily_tagging_limit'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usagelog',
+            index=models.Index(fields=['user', '-used_at', '-id'], name='usagelog_user_used_at_id'),
+        ),
+    ]
@@ -36,6 +36,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     # Daily tagging limit tracking
     daily_tagging_count = models.PositiveIntegerField(default=0, help_text="Number of tagging requests used today")
     daily_count_reset_at = models.DateTimeField(null=True, blank=True, help_text="UTC timestamp of last daily reset")
+    daily_tagging_limit = models.PositiveIntegerField(
+        null=True, blank=True, help_text="Daily tagging limit for this user (TAGGING_DAILY_LIMIT when empty)"
+    )
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS: list[str] = []
@@ -63,5 +66,11 @@ class UsageLog(models.Model):
     endpoint = models.CharField(max_length=255)
     success = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a user's history (logs.views.UsageEventsView).
+            models.Index(fields=["user", "-used_at", "-id"], name="usagelog_user_used_at_id"),
+        ]
+
     def __str__(self):
         return f"{self.user.email} - {self.endpoint} at {self.used_at}"
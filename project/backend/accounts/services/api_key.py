@@ -1,6 +1,11 @@
 import secrets
 import hashlib
+
+from django.conf import settings
+from django.db import connection
+
 from accounts.models import APIKey, User
+from common.utils import BufferedWriter
 
 
 def hash_key(raw_key: str) -> str:
@@ -8,6 +13,14 @@ def hash_key(raw_key: str) -> str:
     return hashlib.sha256(raw_key.encode()).hexdigest()
 
 
+def generate_key() -> tuple:
+    """Return a new ``(raw_key, prefix, hashed_key)``; only the last two are stored."""
+    # Generate random key: fk_live_<16 random chars>
+    random_part = secrets.token_urlsafe(12)[:16]
+    raw_key = f"fk_live_{random_part}"
+    return raw_key, raw_key[:16], hash_key(raw_key)
+
+
 def generate_api_key(user: User) -> tuple:
     """
     Generate a new API key for a user.
@@ -19,13 +32,8 @@ def generate_api_key(user: User) -> tuple:
     # if APIKey.objects.filter(user=user).exists():
     #     raise ValueError("User already has an API key. Revoke the existing one first.")
     
-    # Generate random key: fk_live_<16 random chars>
-    random_part = secrets.token_urlsafe(12)[:16]
-    raw_key = f"fk_live_{random_part}"
-    
     # Store only hashed key + prefix
-    prefix = raw_key[:16]
-    hashed_key = hash_key(raw_key)
+    raw_key, prefix, hashed_key = generate_key()
     
     api_key = APIKey.objects.create(
         user=user,
@@ -34,3 +42,30 @@ def generate_api_key(user: User) -> tuple:
     )
     
     return raw_key, api_key
+
+
+def _write_last_used(batch: dict) -> None:
+    """One bulk UPDATE for every key used since the last flush."""
+    if not connection.in_atomic_block:
+        # Flushes usually run on the buffer's thread, outside any request cycle.
+        connection.close_if_unusable_or_obsolete()
+    APIKey.objects.bulk_update(
+        [APIKey(pk=pk, last_used_at=used_at) for pk, used_at in batch.items()],
+        ["last_used_at"],
+    )
+
+
+# last_used_at is shown with minute precision, so it is written behind the
+# request: at most API_KEY_LAST_USED_FLUSH_INTERVAL seconds late.
+last_used = BufferedWriter(
+    _write_last_used,
+    max_items=settings.API_KEY_LAST_USED_MAX_BATCH,
+    max_age=settings.API_KEY_LAST_USED_FLUSH_INTERVAL,
+    name="api_key_last_used",
+)
+
+
+def record_last_used(api_key: APIKey, used_at) -> None:
+    """Queue an ``APIKey.last_used_at`` update for the next bulk write."""
+    api_key.last_used_at = used_at
+    last_used.add(api_key.pk, used_at)
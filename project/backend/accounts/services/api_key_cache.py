@@ -0,0 +1,99 @@
+"""In-process cache of verified API keys.
+
+Maps the SHA-256 digest of a raw key to the ``APIKey`` row (with its user)
+it was verified against, so repeat requests skip the prefix lookup and the
+digest compare. Entries live for ``API_KEY_CACHE_TTL`` seconds in an LRU of
+``API_KEY_CACHE_MAX_ENTRIES``.
+
+Revoking a key, changing one, deactivating or deleting a user, or saving
+a user's quota fields calls ``invalidate()`` (see ``accounts.signals``). That appends a byte to the
+epoch file at ``API_KEY_CACHE_EPOCH_PATH``. Every lookup compares the
+file's size with the size seen at the last lookup and clears the whole
+cache when it has grown, so all workers on the node drop the key before
+their next request. Other nodes drop it when the TTL runs out. Bulk
+``QuerySet.update()`` calls send no signals; call ``invalidate()`` after
+them.
+"""
+
+import copy
+import os
+import threading
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from accounts.models import APIKey
+from common import metrics
+from common.utils import TTLCache
+
+_cache = TTLCache(settings.API_KEY_CACHE_MAX_ENTRIES, settings.API_KEY_CACHE_TTL, name="api_keys")
+_epoch_lock = threading.Lock()
+_seen_epoch: Optional[int] = None
+
+
+def _epoch() -> int:
+    try:
+        return os.stat(settings.API_KEY_CACHE_EPOCH_PATH).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _check_epoch() -> int:
+    global _seen_epoch
+    epoch = _epoch()
+    if epoch == _seen_epoch:
+        return epoch
+    with _epoch_lock:
+        if _seen_epoch is not None and epoch != _seen_epoch:
+            _cache.clear()
+            metrics.incr("api_key_cache_invalidations_total")
+        _seen_epoch = epoch
+    return epoch
+
+
+def get(digest: str) -> Tuple[Optional[APIKey], int]:
+    """Return a private copy of the cached key for ``digest`` (or ``None``) and the epoch.
+
+    Pass the epoch to ``set()`` after verifying a miss against the database.
+    """
+    if not settings.API_KEY_CACHE_ENABLED:
+        return None, 0
+    epoch = _check_epoch()
+    cached = _cache.get(digest)
+    if cached is None:
+        return None, epoch
+    # Callers update last_used_at and may touch the user; keep the cached row clean.
+    api_key = copy.copy(cached)
+    api_key.user = copy.copy(cached.user)
+    return api_key, epoch
+
+
+def set(digest: str, api_key: APIKey, epoch: int) -> None:
+    """Cache ``api_key`` unless an invalidation happened since ``get()`` returned ``epoch``.
+
+    A later invalidation still reaches it: the next lookup sees the epoch move.
+    """
+    if not settings.API_KEY_CACHE_ENABLED or _epoch() != epoch:
+        return
+    _cache.set(digest, api_key)
+
+
+def _bump_epoch() -> None:
+    # O_APPEND writes are atomic, so concurrent bumps never get lost.
+    fd = os.open(settings.API_KEY_CACHE_EPOCH_PATH, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, b".")
+    finally:
+        os.close(fd)
+    _cache.clear()
+
+
+def invalidate() -> None:
+    """Drop every cached key in all workers on this node once the transaction commits."""
+    transaction.on_commit(_bump_epoch)
+
+
+def clear() -> None:
+    """Forget this process's entries (tests)."""
+    _cache.clear()
@@ -0,0 +1,170 @@
+"""Buffered usage logging.
+
+``record()`` appends a ``UsageLog`` row to an in-memory buffer instead of
+inserting it on the request path. The buffer's thread writes it with
+``bulk_create`` every ``USAGE_LOG_FLUSH_INTERVAL`` seconds, or once
+``USAGE_LOG_MAX_BATCH`` events are waiting.
+
+When the database is down or too slow the events are not lost. A failed
+write is appended to the JSONL file at ``USAGE_LOG_SPILL_PATH``. If more
+than ``USAGE_LOG_MAX_PENDING`` events pile up while a write is still
+running, ``record()`` spills them too. The next successful flush in any
+worker on the node replays the file. Lines that cannot be parsed (a write
+cut short by a crash, say) are moved to ``<USAGE_LOG_SPILL_PATH>.quarantine``
+for inspection instead of blocking the replay.
+"""
+
+import itertools
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection
+from django.utils import timezone
+
+from accounts.models import UsageLog, User
+from common import metrics
+from common.utils import BufferedWriter
+
+logger = logging.getLogger(__name__)
+
+_sequence = itertools.count()
+
+
+def _event(row: UsageLog) -> Dict:
+    return {
+        "user_id": row.user_id,
+        "used_at": row.used_at.isoformat(),
+        "endpoint": row.endpoint,
+        "success": row.success,
+    }
+
+
+def _row(event: Dict) -> UsageLog:
+    return UsageLog(
+        user_id=event["user_id"],
+        used_at=datetime.fromisoformat(event["used_at"]),
+        endpoint=event["endpoint"],
+        success=event["success"],
+    )
+
+
+def _insert(rows: List[UsageLog]) -> None:
+    try:
+        UsageLog.objects.bulk_create(rows, batch_size=settings.USAGE_LOG_MAX_BATCH)
+    except IntegrityError:
+        # A user was deleted while their events waited; keep everyone else's.
+        live = set(User.objects.filter(pk__in={row.user_id for row in rows}).values_list("pk", flat=True))
+        kept = [row for row in rows if row.user_id in live]
+        metrics.incr("usage_log_events_total", len(rows) - len(kept), outcome="dropped")
+        UsageLog.objects.bulk_create(kept, batch_size=settings.USAGE_LOG_MAX_BATCH)
+
+
+def _append(path: str, lines: str) -> None:
+    # One O_APPEND write per batch, so batches from several workers never interleave.
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, lines.encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def spill(rows: Iterable[UsageLog]) -> None:
+    """Append rows to the spill file for a later replay."""
+    lines = "".join(json.dumps(_event(row)) + "\n" for row in rows)
+    if not lines:
+        return
+    _append(settings.USAGE_LOG_SPILL_PATH, lines)
+    metrics.incr("usage_log_events_total", lines.count("\n"), outcome="spilled")
+
+
+def _read_spill(claimed: str) -> List[UsageLog]:
+    rows, bad = [], []
+    with open(claimed, encoding="utf-8", errors="replace") as spilled:
+        for line in spilled:
+            if not line.strip():
+                continue
+            try:
+                rows.append(_row(json.loads(line)))
+            except (ValueError, KeyError, TypeError):
+                bad.append(line if line.endswith("\n") else line + "\n")
+    if bad:
+        logger.error("Quarantined %s unreadable spilled usage events", len(bad))
+        _append(f"{settings.USAGE_LOG_SPILL_PATH}.quarantine", "".join(bad))
+        metrics.incr("usage_log_events_total", len(bad), outcome="quarantined")
+    return rows
+
+
+def replay_spill() -> int:
+    """Insert spilled events; return how many were written.
+
+    The file is renamed before reading, so only one worker replays it.
+    Events that fail again go back into a new spill file. If the claimed
+    file cannot be read it is left in place (and logged) rather than lost.
+    """
+    path = settings.USAGE_LOG_SPILL_PATH
+    claimed = f"{path}.{os.getpid()}.{next(_sequence)}.replay"
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        return 0
+    try:
+        rows = _read_spill(claimed)
+    except OSError:
+        logger.exception("Reading spilled usage events failed; they are left in %s", claimed)
+        return 0
+    try:
+        _insert(rows)
+    except DatabaseError:
+        logger.exception("Replaying %s spilled usage events failed", len(rows))
+        spill(rows)
+        os.remove(claimed)
+        return 0
+    os.remove(claimed)
+    metrics.incr("usage_log_events_total", len(rows), outcome="replayed")
+    return len(rows)
+
+
+def _write(batch: Dict[int, UsageLog]) -> None:
+    rows = list(batch.values())
+    if not connection.in_atomic_block:
+        # Flushes usually run on the buffer's thread, outside any request cycle.
+        connection.close_if_unusable_or_obsolete()
+    try:
+        _insert(rows)
+    except DatabaseError:
+        logger.exception("Writing %s usage events failed; spilling them to disk", len(rows))
+        spill(rows)
+        return
+    metrics.incr("usage_log_events_total", len(rows), outcome="written")
+    if os.path.exists(settings.USAGE_LOG_SPILL_PATH):
+        try:
+            replay_spill()
+        except Exception:
+            # The batch is already written; raising would make the buffer insert it again.
+            logger.exception("Replaying spilled usage events failed")
+
+
+buffer = BufferedWriter(
+    _write,
+    max_items=settings.USAGE_LOG_MAX_BATCH,
+    max_age=settings.USAGE_LOG_FLUSH_INTERVAL,
+    name="usage_log",
+)
+
+
+def record(user, endpoint: str, success: bool) -> None:
+    """Queue a ``UsageLog`` row; it is written within ``USAGE_LOG_FLUSH_INTERVAL`` seconds."""
+    row = UsageLog(user_id=user.pk, used_at=timezone.now(), endpoint=endpoint, success=success)
+    buffer.add(next(_sequence), row)
+    if len(buffer) > settings.USAGE_LOG_MAX_PENDING:
+        # The database is not keeping up; move the backlog to disk.
+        spill(buffer.drain().values())
+
+
+def flush() -> int:
+    """Write (or spill) buffered events now; return how many there were."""
+    return buffer.flush()
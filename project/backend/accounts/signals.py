@@ -0,0 +1,42 @@
+"""Drop cached API keys when a key or its user stops being valid or changes quota.
+
+Charges made with ``QuerySet.update()`` send no signal; a cached count that
+lags behind them only lets a request reach the authoritative charge in
+``DailyLimitChecker``, which refuses it.
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.models import APIKey, User
+from accounts.services import api_key_cache
+
+
+@receiver(post_delete, sender=APIKey)
+def api_key_deleted(sender, instance, **kwargs):
+    api_key_cache.invalidate()
+
+
+@receiver(post_save, sender=APIKey)
+def api_key_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    api_key_cache.invalidate()
+
+
+# Cached keys carry their user, and the quota pre-check in
+# ``APIKeyAuthentication`` reads these fields from it.
+_QUOTA_FIELDS = {"daily_tagging_limit", "daily_tagging_count", "daily_count_reset_at"}
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if not instance.is_active or update_fields is None or _QUOTA_FIELDS & set(update_fields):
+        api_key_cache.invalidate()
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    api_key_cache.invalidate()
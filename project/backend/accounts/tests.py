@@ -0,0 +1,227 @@
+import os
+import tempfile
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import DatabaseError
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed, Throttled
+from rest_framework.test import APIClient, APITestCase
+
+from .authentication import APIKeyAuthentication, DailyLimitChecker, get_utc_midnight
+from .models import APIKey, UsageLog, User
+from .services import api_key_cache, usage
+from .services.api_key import generate_api_key, last_used
+
+# Tests flush the write-behind buffers themselves; a background flush would
+# write from another connection, outside the test's transaction.
+usage.buffer.max_age = 0
+last_used.max_age = 0
+
+
+class TestDailyLimitChecker(APITestCase):
+    """The daily quota is charged by one conditional UPDATE per request."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="quota@example.com", password="testpass123")
+
+    def test_api_key_request_is_charged_once(self):
+        raw_key, _ = generate_api_key(self.user)
+        with patch("fashion_tagger.views.generate_tags", return_value={"english": {}}):
+            response = APIClient().post(
+                "/api/v1/tag/", {"image_url": "https://example.com/a.jpg"}, HTTP_API_KEY=raw_key
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 1)
+
+    def test_stale_count_is_reset_by_the_charge(self):
+        self.user.daily_tagging_count = 15
+        self.user.daily_count_reset_at = timezone.now() - timedelta(days=1)
+        self.user.save()
+
+        self.assertEqual(DailyLimitChecker.check_and_increment(self.user, count=2), 2)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.daily_count_reset_at, get_utc_midnight())
+
+    def test_charge_that_does_not_fit_leaves_count_unchanged(self):
+        DailyLimitChecker.check_and_increment(self.user, count=14)
+        with self.assertRaisesMessage(Throttled, "1 requests left today"):
+            DailyLimitChecker.check_and_increment(self.user, count=2)
+        self.assertEqual(DailyLimitChecker.check_and_increment(self.user), 15)
+        with self.assertRaisesMessage(Throttled, "limit reached"):
+            DailyLimitChecker.check_and_increment(self.user)
+        self.assertEqual(DailyLimitChecker.get_usage_info(self.user)["remaining"], 0)
+
+    def test_databases_without_update_returning_reread_the_count(self):
+        with patch("accounts.authentication._update_can_return", return_value=False):
+            self.assertEqual(DailyLimitChecker.check_and_increment(self.user, count=2), 2)
+            self.assertEqual(DailyLimitChecker.check_and_increment(self.user), 3)
+
+    def test_per_user_limit_overrides_the_default(self):
+        self.user.daily_tagging_limit = 2
+        self.user.save()
+
+        DailyLimitChecker.check_and_increment(self.user, count=2)
+        with self.assertRaisesMessage(Throttled, "(2 requests per day)"):
+            DailyLimitChecker.check_and_increment(self.user)
+
+class TestAPIKeyCache(APITestCase):
+    """Verified API keys are cached until revoked or their user is deactivated."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.epoch_path = os.path.join(tmp.name, "api-keys.epoch")
+        settings_patch = override_settings(API_KEY_CACHE_ENABLED=True, API_KEY_CACHE_EPOCH_PATH=self.epoch_path)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        api_key_cache.clear()
+        self.addCleanup(api_key_cache.clear)
+
+        self.user = User.objects.create_user(email="cached-key@example.com", password="testpass123")
+        self.raw_key, self.api_key = generate_api_key(self.user)
+        self.request = RequestFactory().get("/", HTTP_API_KEY=self.raw_key)
+
+    def _authenticate(self):
+        return APIKeyAuthentication().authenticate(self.request)
+
+    def test_repeat_request_skips_the_key_lookup(self):
+        self._authenticate()
+        with self.assertNumQueries(0):
+            user, _ = self._authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_revoked_key_is_rejected_immediately(self):
+        self._authenticate()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f"/api/v1/keys/{self.api_key.pk}/")
+
+        self.assertEqual(response.status_code, 204)
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate()
+
+    def test_deactivated_user_is_rejected_immediately(self):
+        self._authenticate()
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        with self.assertRaisesMessage(AuthenticationFailed, "User inactive"):
+            self._authenticate()
+
+    def test_raised_daily_limit_applies_immediately(self):
+        self.user.daily_tagging_count = self.user.daily_tagging_limit = 5
+        self.user.daily_count_reset_at = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        with self.assertRaises(Throttled):
+            self._authenticate()
+
+        self.user.daily_tagging_limit = 10
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=["daily_tagging_limit"])
+
+        user, _ = self._authenticate()
+        self.assertEqual(user.daily_tagging_limit, 10)
+
+    def test_unrelated_user_update_keeps_the_cache(self):
+        self._authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=["last_login"])
+
+        with self.assertNumQueries(0):
+            self._authenticate()
+
+    def test_last_used_at_is_written_in_one_bulk_update(self):
+        other = User.objects.create_user(email="cached-key-2@example.com", password="testpass123")
+        other_raw, other_key = generate_api_key(other)
+        last_used.flush()
+        self._authenticate()
+        APIKeyAuthentication().authenticate(RequestFactory().get("/", HTTP_API_KEY=other_raw))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(last_used.flush(), 2)
+        self.assertIsNotNone(APIKey.objects.get(pk=other_key.pk).last_used_at)
+
+    def test_invalidation_from_another_worker_clears_the_cache(self):
+        self._authenticate()
+        with open(self.epoch_path, "ab") as epoch:  # what another process's invalidate() does
+            epoch.write(b".")
+
+        with self.assertNumQueries(1):
+            self._authenticate()
+
+class TestUsageLogBuffer(TestCase):
+    """UsageLog rows are buffered, bulk-inserted and spilled to disk on failure."""
+
+    def setUp(self):
+        usage.buffer.drain()
+        self.user = User.objects.create_user(email="usage-log@example.com", password="testpass123")
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.spill_path = os.path.join(tmp.name, "usage_spill.jsonl")
+        settings_patch = override_settings(USAGE_LOG_SPILL_PATH=self.spill_path)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+
+    def test_events_are_written_in_one_insert(self):
+        for _ in range(3):
+            usage.record(self.user, "/api/v1/tag/", success=True)
+        self.assertEqual(UsageLog.objects.count(), 0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(usage.flush(), 3)
+        self.assertEqual(UsageLog.objects.filter(user=self.user).count(), 3)
+
+    def test_failed_write_is_spilled_and_replayed(self):
+        usage.record(self.user, "/api/v1/tag/", success=False)
+        with patch.object(UsageLog.objects, "bulk_create", side_effect=DatabaseError("timeout")):
+            usage.flush()
+        self.assertEqual(UsageLog.objects.count(), 0)
+        self.assertTrue(os.path.exists(self.spill_path))
+
+        usage.record(self.user, "/api/v1/tag/", success=True)
+        usage.flush()
+        self.assertEqual(
+            sorted(UsageLog.objects.values_list("success", flat=True)), [False, True]
+        )
+        self.assertFalse(os.path.exists(self.spill_path))
+
+    @override_settings(USAGE_LOG_MAX_PENDING=2)
+    def test_backlog_beyond_the_limit_goes_to_disk(self):
+        for _ in range(3):
+            usage.record(self.user, "/api/v1/tag/", success=True)
+
+        self.assertEqual(len(usage.buffer), 0)
+        with open(self.spill_path) as spilled:
+            self.assertEqual(len(spilled.readlines()), 3)
+        self.assertEqual(usage.replay_spill(), 3)
+
+    def test_corrupt_spill_line_is_quarantined_without_duplicates(self):
+        usage.record(self.user, "/api/v1/tag/", success=False)
+        with patch.object(UsageLog.objects, "bulk_create", side_effect=DatabaseError("timeout")):
+            usage.flush()
+        with open(self.spill_path, "a") as spilled:
+            spilled.write('{"user_id": 1, "used_at": "2025-')  # a write cut short
+
+        usage.record(self.user, "/api/v1/tag/", success=True)
+        self.assertEqual(usage.flush(), 1)
+        self.assertEqual(usage.flush(), 0)
+        self.assertEqual(
+            sorted(UsageLog.objects.values_list("success", flat=True)), [False, True]
+        )
+        with open(f"{self.spill_path}.quarantine") as quarantined:
+            self.assertEqual(quarantined.read(), '{"user_id": 1, "used_at": "2025-\n')
+        self.assertEqual(os.listdir(os.path.dirname(self.spill_path)), ["usage_spill.jsonl.quarantine"])
+
+    def test_failed_replay_does_not_rewrite_the_batch(self):
+        usage.spill([UsageLog(user=self.user, used_at=timezone.now(), endpoint="/api/v1/tag/")])
+        usage.record(self.user, "/api/v1/tag/", success=True)
+        with patch.object(usage, "replay_spill", side_effect=OSError("disk error")):
+            self.assertEqual(usage.flush(), 1)
+        self.assertEqual(usage.flush(), 0)
+        self.assertEqual(UsageLog.objects.count(), 1)
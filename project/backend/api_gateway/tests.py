@@ -0,0 +1,80 @@
+import os
+import tempfile
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import Throttled
+
+from accounts.authentication import DailyLimitChecker, get_utc_midnight
+from accounts.models import User
+from common import metrics
+
+from .throttling import LocalQuotaStore
+
+
+class TestLocalQuotaStore(TestCase):
+    """api_gateway.throttling charges a node-local file and flushes to the database."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="local-quota@example.com", password="testpass123")
+        self.user.daily_tagging_limit = 3
+        self.user.save()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "quota.sqlite3")
+
+    def test_workers_share_counters_and_flush_once(self):
+        workers = [LocalQuotaStore(self.path, flush_interval=3600) for _ in range(2)]
+        self.assertEqual(workers[0].charge(self.user, count=2), 2)
+        self.assertEqual(workers[1].charge(self.user), 3)
+        with self.assertRaises(Throttled):
+            workers[0].charge(self.user)
+
+        workers[0].flush()
+        workers[1].flush()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 3)
+        self.assertEqual(workers[1].usage(self.user), {"used": 3, "limit": 3, "remaining": 0})
+
+    def test_daily_limit_checker_uses_the_local_store(self):
+        store = LocalQuotaStore(self.path, flush_interval=3600)
+        with override_settings(TAGGING_LOCAL_QUOTA_ENABLED=True), patch(
+            "api_gateway.throttling.local_quota", return_value=store
+        ):
+            DailyLimitChecker.check_and_increment(self.user)
+            self.assertEqual(DailyLimitChecker.get_usage_info(self.user)["used"], 1)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 0)
+
+    def _charge_yesterday(self, store, count):
+        yesterday = get_utc_midnight() - timedelta(days=1)
+        self.user.daily_tagging_count = 1
+        self.user.daily_count_reset_at = yesterday
+        self.user.save()
+        store.charge(self.user, count=count)
+        store._db().execute("UPDATE quota SET day = ?", (yesterday.date().isoformat(),))
+
+    def test_charges_pending_at_midnight_are_flushed_to_their_day(self):
+        metrics.reset()
+        store = LocalQuotaStore(self.path, flush_interval=3600)
+        self._charge_yesterday(store, 2)
+        self.assertEqual(store.usage(self.user)["used"], 0)  # today's row replaces yesterday's
+
+        store.flush()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 3)
+        self.assertEqual(self.user.daily_count_reset_at, get_utc_midnight() - timedelta(days=1))
+        self.assertEqual(metrics.total("quota_local_flushed_total"), 2)
+
+    def test_charges_for_a_day_the_database_has_left_are_counted(self):
+        metrics.reset()
+        store = LocalQuotaStore(self.path, flush_interval=3600)
+        self._charge_yesterday(store, 2)
+        User.objects.filter(pk=self.user.pk).update(daily_tagging_count=0, daily_count_reset_at=get_utc_midnight())
+
+        store.flush()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 0)
+        self.assertEqual(metrics.total("quota_local_expired_total"), 2)
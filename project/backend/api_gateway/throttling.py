@@ -0,0 +1,298 @@
+"""Node-local daily quota engine.
+
+With ``TAGGING_LOCAL_QUOTA_ENABLED`` the daily tagging quota is charged
+against a SQLite file (``TAGGING_LOCAL_QUOTA_PATH``) shared by the gunicorn
+workers on a node, instead of a row update in the main database per
+request. Each user has one row with:
+
+- ``base``: the database count when the row was last synced,
+- ``pending``: charges taken on this node and not flushed yet,
+- ``daily_limit``: ``User.daily_tagging_limit`` or ``TAGGING_DAILY_LIMIT``.
+
+A charge is one conditional ``UPDATE`` of that row. Every
+``TAGGING_LOCAL_QUOTA_FLUSH_INTERVAL`` seconds a worker moves the pending
+charges into ``User.daily_tagging_count`` and re-reads the database count
+and limit, which picks up charges from other nodes and limit changes.
+Between flushes several nodes may together overshoot a user's limit by the
+charges each took in one interval.
+
+At UTC midnight a user's row starts over for the new day. Charges still
+pending on the old day's row are moved to a ``carried`` table first, and
+the next flush adds them to the database count for that day. If the
+database has already moved on to a later day they no longer affect any
+quota; they are logged and counted in ``quota_local_expired_total``.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Case, F, Q, Value, When
+
+from accounts.authentication import get_utc_midnight, raise_limit_exceeded, should_reset_daily_count
+from accounts.models import User
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quota (
+    user_id INTEGER PRIMARY KEY,
+    day TEXT NOT NULL,
+    base INTEGER NOT NULL,
+    pending INTEGER NOT NULL,
+    daily_limit INTEGER NOT NULL,
+    synced_at REAL NOT NULL
+)
+"""
+
+# Pending charges of rows from past days, waiting for a flush.
+_CARRIED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS carried (
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    pending INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day)
+)
+"""
+
+_CARRY = (
+    "INSERT INTO carried (user_id, day, pending) "
+    "SELECT user_id, day, pending FROM quota WHERE {where} AND pending > 0 "
+    "ON CONFLICT (user_id, day) DO UPDATE SET pending = pending + excluded.pending"
+)
+
+_SYNC_CHUNK = 500
+
+
+def _today() -> str:
+    return datetime.now(dt_timezone.utc).date().isoformat()
+
+
+def _limit(value):
+    return settings.TAGGING_DAILY_LIMIT if value is None else value
+
+
+def _write_charges(user_id: int, pending: int, midnight: datetime) -> int:
+    """Add ``pending`` to the user's count for the day starting at ``midnight``.
+
+    Returns 0 without writing if the database count is for a later day.
+    """
+    stale = Q(daily_count_reset_at__isnull=True) | Q(daily_count_reset_at__lt=midnight)
+    return (
+        User.objects
+        .filter(Q(daily_count_reset_at__isnull=True) | Q(daily_count_reset_at__lte=midnight), pk=user_id)
+        .update(
+            daily_tagging_count=Case(
+                When(stale, then=Value(pending)), default=F("daily_tagging_count") + pending
+            ),
+            daily_count_reset_at=Case(
+                When(stale, then=Value(midnight)), default=F("daily_count_reset_at")
+            ),
+        )
+    )
+
+
+class LocalQuotaStore:
+    """Per-user daily counters in a SQLite file shared by local workers."""
+
+    def __init__(self, path=None, flush_interval=None):
+        self.path = settings.TAGGING_LOCAL_QUOTA_PATH if path is None else path
+        self.flush_interval = (
+            settings.TAGGING_LOCAL_QUOTA_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        )
+        self._local = threading.local()
+        self._flush_lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread, reopened in forked workers.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+            conn.execute(_CARRIED_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _load(self, user_id: int, day: str) -> None:
+        """Seed today's row from the database unless another worker already did."""
+        count, reset_at, limit = (
+            User.objects.filter(pk=user_id)
+            .values_list("daily_tagging_count", "daily_count_reset_at", "daily_tagging_limit")
+            .get()
+        )
+        base = 0 if should_reset_daily_count(reset_at) else count
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(_CARRY.format(where="user_id = ? AND day <> ?"), (user_id, day))
+            db.execute(
+                "INSERT INTO quota (user_id, day, base, pending, daily_limit, synced_at) "
+                "VALUES (?, ?, ?, 0, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET day = excluded.day, base = excluded.base, "
+                "pending = 0, daily_limit = excluded.daily_limit, synced_at = excluded.synced_at "
+                "WHERE quota.day <> excluded.day",
+                (user_id, day, base, _limit(limit), time.time()),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _state(self, user_id: int, day: str):
+        return self._db().execute(
+            "SELECT base + pending, daily_limit FROM quota WHERE user_id = ? AND day = ?",
+            (user_id, day),
+        ).fetchone()
+
+    def charge(self, user, count: int = 1) -> int:
+        """Charge ``count`` taggings to ``user`` all-or-nothing; return today's total.
+
+        Raises ``Throttled`` like ``DailyLimitChecker.check_and_increment``.
+        """
+        self.maybe_flush()
+        day = _today()
+        row = self._charge(user.pk, day, count)
+        if row is None and self._state(user.pk, day) is None:
+            self._load(user.pk, day)
+            row = self._charge(user.pk, day, count)
+        if row is not None:
+            metrics.incr("quota_local_charges_total", outcome="charged")
+            return row[0]
+        metrics.incr("quota_local_charges_total", outcome="throttled")
+        used, limit = self._state(user.pk, day)
+        raise_limit_exceeded(limit, limit - used)
+
+    def _charge(self, user_id: int, day: str, count: int):
+        return self._db().execute(
+            "UPDATE quota SET pending = pending + ? "
+            "WHERE user_id = ? AND day = ? AND base + pending + ? <= daily_limit "
+            "RETURNING base + pending",
+            (count, user_id, day, count),
+        ).fetchone()
+
+    def usage(self, user) -> dict:
+        """Today's usage as seen by this node, in ``get_usage_info`` form."""
+        day = _today()
+        state = self._state(user.pk, day)
+        if state is None:
+            self._load(user.pk, day)
+            state = self._state(user.pk, day)
+        used, limit = state
+        return {"used": used, "limit": limit, "remaining": max(0, limit - used)}
+
+    def maybe_flush(self) -> None:
+        """Flush if the interval has passed and no other thread is flushing."""
+        if time.monotonic() - self._flushed_at < self.flush_interval:
+            return
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._flush()
+        finally:
+            self._flush_lock.release()
+
+    def flush(self) -> None:
+        """Write pending charges to the database and re-sync today's rows."""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        self._flushed_at = time.monotonic()
+        day = _today()
+        db = self._db()
+        # Claim the pending charges under SQLite's write lock so two workers
+        # never flush the same charge; base + pending is unchanged.
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            claimed = db.execute(
+                "SELECT user_id, pending FROM quota WHERE day = ? AND pending > 0", (day,)
+            ).fetchall()
+            db.execute("UPDATE quota SET base = base + pending, pending = 0 WHERE day = ? AND pending > 0", (day,))
+            db.execute(_CARRY.format(where="day < ?"), (day,))
+            db.execute("DELETE FROM quota WHERE day < ?", (day,))
+            carried = db.execute("SELECT user_id, day, pending FROM carried").fetchall()
+            db.execute("DELETE FROM carried")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        # Past days first, so today's charges do not move the count past them.
+        for user_id, old_day, pending in carried:
+            old_midnight = datetime.fromisoformat(old_day).replace(tzinfo=dt_timezone.utc)
+            try:
+                written = _write_charges(user_id, pending, old_midnight)
+            except DatabaseError:
+                logger.exception("Quota flush failed for user %s; keeping %s charges from %s", user_id, pending, old_day)
+                db.execute(
+                    "INSERT INTO carried (user_id, day, pending) VALUES (?, ?, ?) "
+                    "ON CONFLICT (user_id, day) DO UPDATE SET pending = pending + excluded.pending",
+                    (user_id, old_day, pending),
+                )
+                continue
+            if written:
+                metrics.incr("quota_local_flushed_total", pending)
+            else:
+                logger.warning(
+                    "Dropping %s quota charges from %s for user %s; the user is gone or counted a later day",
+                    pending, old_day, user_id,
+                )
+                metrics.incr("quota_local_expired_total", pending)
+
+        midnight = get_utc_midnight()
+        for user_id, pending in claimed:
+            try:
+                _write_charges(user_id, pending, midnight)
+            except DatabaseError:
+                logger.exception("Quota flush failed for user %s; keeping %s charges pending", user_id, pending)
+                db.execute(
+                    "UPDATE quota SET base = base - ?, pending = pending + ? WHERE user_id = ? AND day = ?",
+                    (pending, pending, user_id, day),
+                )
+            else:
+                metrics.incr("quota_local_flushed_total", pending)
+
+        due = [
+            user_id
+            for (user_id,) in db.execute(
+                "SELECT user_id FROM quota WHERE day = ? AND synced_at < ?",
+                (day, time.time() - self.flush_interval),
+            )
+        ]
+        for start in range(0, len(due), _SYNC_CHUNK):
+            rows = User.objects.filter(pk__in=due[start:start + _SYNC_CHUNK]).values_list(
+                "pk", "daily_tagging_count", "daily_count_reset_at", "daily_tagging_limit"
+            )
+            now = time.time()
+            for user_id, count, reset_at, limit in rows:
+                count = 0 if should_reset_daily_count(reset_at) else count
+                # Never lower base: flushes from other workers may still be in flight.
+                db.execute(
+                    "UPDATE quota SET base = MAX(base, ?), daily_limit = ?, synced_at = ? "
+                    "WHERE user_id = ? AND day = ?",
+                    (count, _limit(limit), now, user_id, day),
+                )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def local_quota() -> LocalQuotaStore:
+    """The process-wide store, created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = LocalQuotaStore()
+    return _store
@@ -0,0 +1,24 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from common import metrics
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@require_GET
+def metrics_view(request):
+    """Metrics of every worker on this node in the Prometheus text format.
+
+    When ``METRICS_TOKEN`` is set the scraper must send it as a bearer token.
+    """
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return HttpResponse(status=401)
+    counters, histograms = metrics.collect(settings.METRICS_DIR)
+    return HttpResponse(metrics.render(counters, histograms), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -22,4 +22,6 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/v1/", include("accounts.urls")),
     path("api/v1/", include("fashion_tagger.urls")),
+    path("api/v1/", include("logs.urls")),
+    path("", include("api_gateway.urls")),
 ]
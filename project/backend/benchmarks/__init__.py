@@ -0,0 +1,4 @@
+"""Standalone micro-benchmarks. Run from project/backend, e.g.
+
+    python -m benchmarks.bench_workflow_compile
+"""
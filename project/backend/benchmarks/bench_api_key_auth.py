@@ -0,0 +1,73 @@
+"""API-key authentication latency with and without the verified-key cache.
+
+Times ``APIKeyAuthentication`` for one key, hit repeatedly, in two ways:
+
+- ``lookup`` is ``_get_api_key`` only, the part the cache replaces.
+- ``authenticate`` is the whole call. ``last_used_at`` is queued for the
+  write-behind buffer, and that flush is not timed here.
+
+Run it against the database the deployment uses, so the lookup pays a real
+round trip:
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_api_key_auth --requests 2000
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from django.test import RequestFactory, override_settings  # noqa: E402
+
+from accounts.authentication import APIKeyAuthentication  # noqa: E402
+from accounts.models import User  # noqa: E402
+from accounts.services import api_key_cache  # noqa: E402
+from accounts.services.api_key import generate_api_key  # noqa: E402
+
+_EMAIL = "bench-api-key@example.com"
+
+
+def _time(func, requests):
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return statistics.median(samples) * 1e6, samples[int(len(samples) * 0.99) - 1] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    User.objects.filter(email=_EMAIL).delete()
+    user = User.objects.create_user(email=_EMAIL, password="bench-password")
+    raw_key, _ = generate_api_key(user)
+    request = RequestFactory().get("/", HTTP_API_KEY=raw_key)
+    auth = APIKeyAuthentication()
+    try:
+        print(f"{'':<24} {'p50':>9} {'p99':>9}")
+        for enabled in (False, True):
+            api_key_cache.clear()
+            with override_settings(API_KEY_CACHE_ENABLED=enabled):
+                auth.authenticate(request)  # warm the cache and the connection
+                label = "cached" if enabled else "uncached"
+                for name, func in (
+                    ("lookup", lambda: auth._get_api_key(raw_key)),
+                    ("authenticate", lambda: auth.authenticate(request)),
+                ):
+                    p50, p99 = _time(func, args.requests)
+                    print(f"{name + ' ' + label:<24} {p50:7.0f}us {p99:7.0f}us")
+    finally:
+        user.delete()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Cost of the always-on pipeline instrumentation.
+
+- ``node`` compares a bare node call with one wrapped by
+  ``_instrument_node``, which adds a histogram observation per call.
+- ``debug sizes`` compares the old ``sys.getsizeof(str(value))`` size with
+  ``_approx_size`` on a state holding an ``--image-kb`` image.
+- ``/metrics`` is the time to collect and render ``--workers`` published
+  worker files.
+
+No database is needed:
+
+    python -m benchmarks.bench_metrics --calls 100000
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from common import metrics  # noqa: E402
+from fashion_tagger.services.langgraph_integration.langgraph_service import (  # noqa: E402
+    _approx_size,
+    _instrument_node,
+)
+
+
+def _per_call(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--image-kb", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    state = {"image_url": "https://example.com/a.jpg", "image_tags_en": {"entities": []}}
+    node = lambda: state  # noqa: E731
+    wrapped = _instrument_node(lambda s: s, "bench")
+    bare = _per_call(node, args.calls)
+    timed = _per_call(lambda: wrapped(state), args.calls)
+    print(f"node          bare {bare:6.2f}us  instrumented {timed:6.2f}us  (+{timed - bare:.2f}us)")
+
+    big = {**state, "image_bytes": os.urandom(args.image_kb * 1024)}
+    rounds = max(1, args.calls // 10000)
+    old = _per_call(lambda: [sys.getsizeof(str(v)) for v in big.values()], rounds)
+    new = _per_call(lambda: [_approx_size(v) for v in big.values()], rounds)
+    print(f"debug sizes   str() {old / 1000:8.2f}ms  _approx_size {new / 1000:8.4f}ms  ({args.image_kb} KB image)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        metrics.publish(directory)
+        (published,) = os.listdir(directory)
+        # The other workers' files look like this process's one.
+        for worker in range(1, args.workers):
+            shutil.copy(os.path.join(directory, published), os.path.join(directory, f"worker-{worker}.json"))
+        scrape = _per_call(lambda: metrics.render(*metrics.collect(directory)), 200)
+    print(f"/metrics      {scrape / 1000:6.2f}ms for {args.workers} worker files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Lookup latency of the near-duplicate index at scale.
+
+Fills a MultiIndexHashIndex with random 64-bit hashes, then times lookups
+for unknown hashes (misses) and for planted near-duplicates (hits), and
+compares with a linear scan.
+
+    python -m benchmarks.bench_near_duplicate_index --size 1000000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from fashion_tagger.services.near_duplicates import MultiIndexHashIndex, hamming  # noqa: E402
+
+
+def _flip_bits(value: int, count: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--max-distance", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    hashes = [rng.getrandbits(64) for _ in range(args.size)]
+
+    index = MultiIndexHashIndex(args.max_distance)
+    start = time.perf_counter()
+    for i, value in enumerate(hashes):
+        index.add(value, str(i))
+    build = time.perf_counter() - start
+
+    misses = [rng.getrandbits(64) for _ in range(args.queries)]
+    hits = [
+        _flip_bits(rng.choice(hashes), rng.randint(0, args.max_distance), rng)
+        for _ in range(args.queries)
+    ]
+
+    def time_lookups(queries):
+        latencies, found = [], 0
+        for query in queries:
+            t = time.perf_counter()
+            found += bool(index.search(query))
+            latencies.append(time.perf_counter() - t)
+        return latencies, found
+
+    miss_latencies, _ = time_lookups(misses)
+    hit_latencies, found = time_lookups(hits)
+
+    scan_queries = hits[:5]
+    t = time.perf_counter()
+    for query in scan_queries:
+        [h for h in hashes if hamming(query, h) <= args.max_distance]
+    linear = (time.perf_counter() - t) / len(scan_queries)
+
+    miss_p50, miss_p99 = _percentiles(miss_latencies)
+    hit_p50, hit_p99 = _percentiles(hit_latencies)
+    print(f"stored hashes:      {len(index):,} (max distance {args.max_distance})")
+    print(f"build time:         {build:.1f} s")
+    print(f"miss lookup:        p50 {miss_p50 * 1e6:8.1f} us   p99 {miss_p99 * 1e6:8.1f} us")
+    print(f"near-dup lookup:    p50 {hit_p50 * 1e6:8.1f} us   p99 {hit_p99 * 1e6:8.1f} us   "
+          f"found {found}/{len(hits)}")
+    print(f"linear scan:        {linear * 1e3:8.1f} ms per lookup")
+
+
+if __name__ == "__main__":
+    main()
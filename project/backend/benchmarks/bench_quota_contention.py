@@ -0,0 +1,167 @@
+"""Daily-quota charging under many concurrent requests from one user.
+
+Compares the previous quota path with ``DailyLimitChecker.check_and_increment``.
+The previous path ran for each API-key tag request. It did this twice, once in
+``APIKeyAuthentication`` and once in the view. Each time it opened a
+transaction, ran ``SELECT ... FOR UPDATE`` and did one or two ``save()`` calls.
+The new path is one conditional ``UPDATE ... RETURNING`` per request. The
+``local`` row charges the node-local store in ``api_gateway.throttling``
+instead, and each worker flushes it to the database.
+
+Each round starts ``--workers`` threads, and each thread has its own database
+connection. The threads charge the same user ``--requests`` times between
+them. The first round lifts the limit to measure lock contention. The second
+round uses ``--limit`` and checks that no more than that is ever charged.
+
+Run it against the database the deployment uses. SQLite serialises writers,
+so it shows nothing about row locks:
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_quota_contention --workers 32
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+from rest_framework.exceptions import Throttled  # noqa: E402
+
+from accounts.authentication import (  # noqa: E402
+    DailyLimitChecker,
+    get_daily_limit,
+    get_utc_midnight,
+    should_reset_daily_count,
+)
+from accounts.models import User  # noqa: E402
+from api_gateway.throttling import LocalQuotaStore  # noqa: E402
+
+_EMAIL = "bench-quota@example.com"
+
+
+def _locked_charge(user):
+    """The previous ``select_for_update`` check-and-increment."""
+    with transaction.atomic():
+        locked_user = User.objects.select_for_update().get(pk=user.pk)
+        if should_reset_daily_count(locked_user.daily_count_reset_at):
+            locked_user.daily_tagging_count = 0
+            locked_user.daily_count_reset_at = get_utc_midnight()
+            locked_user.save(update_fields=["daily_tagging_count", "daily_count_reset_at"])
+        if locked_user.daily_tagging_count >= get_daily_limit(locked_user):
+            raise Throttled()
+        locked_user.daily_tagging_count += 1
+        locked_user.save(update_fields=["daily_tagging_count"])
+
+
+def _old_request(user):
+    # API-key requests were charged by the authentication class and the view.
+    _locked_charge(user)
+    _locked_charge(user)
+
+
+def _new_request(user):
+    DailyLimitChecker.check_and_increment(user)
+
+
+def _shared(request):
+    return lambda: (request, None)
+
+
+def _local_stores(path):
+    """One store per thread, as there is one per gunicorn worker."""
+
+    def make():
+        store = LocalQuotaStore(path, flush_interval=0.5)
+        return store.charge, store.flush
+
+    return make
+
+
+def _run(make_worker, user, requests, workers, limit):
+    User.objects.filter(pk=user.pk).update(
+        daily_tagging_count=0, daily_count_reset_at=None, daily_tagging_limit=limit
+    )
+    latencies, throttled = [], [0]
+    lock = threading.Lock()
+    per_worker = [requests // workers + (i < requests % workers) for i in range(workers)]
+    barrier = threading.Barrier(workers + 1)
+
+    def worker(count):
+        charge, on_exit = make_worker()
+        barrier.wait()
+        try:
+            for _ in range(count):
+                start = time.perf_counter()
+                try:
+                    charge(user)
+                except Throttled:
+                    with lock:
+                        throttled[0] += 1
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            if on_exit:
+                on_exit()
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(count,)) for count in per_worker]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    charged = User.objects.values_list("daily_tagging_count", flat=True).get(pk=user.pk)
+    return elapsed, sorted(latencies), throttled[0], charged
+
+
+def _report(label, requests, result):
+    elapsed, latencies, throttled, charged = result
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(
+        f"{label:<10} {requests / elapsed:8.0f} req/s  p50 {p50:6.2f}ms  p99 {p99:7.2f}ms  "
+        f"charged {charged:>6}  throttled {throttled:>6}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=15, help="daily limit for the bounded round")
+    args = parser.parse_args()
+
+    user, _ = User.objects.get_or_create(email=_EMAIL)
+    tmp = tempfile.TemporaryDirectory()
+    paths = iter(os.path.join(tmp.name, f"quota-{i}.sqlite3") for i in range(4))
+    print(f"{connection.vendor}, {args.workers} workers, {args.requests} requests from one user")
+    try:
+        for limit in (args.requests * 2, args.limit):
+            if limit == args.limit:
+                print(f"limit {limit} (charged must not exceed it; old charges 2 per request):")
+            else:
+                print("unbounded limit (lock contention):")
+            _report("old", args.requests, _run(_shared(_old_request), user, args.requests, args.workers, limit))
+            new = _run(_shared(_new_request), user, args.requests, args.workers, limit)
+            _report("new", args.requests, new)
+            local = _run(_local_stores(next(paths)), user, args.requests, args.workers, limit)
+            _report("local", args.requests, local)
+            if limit == args.limit:
+                for result in (new, local):
+                    assert result[3] == limit and result[2] == args.requests - limit, result[2:]
+    finally:
+        user.delete()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Peak memory of building an OpenRouter request body for an inline image.
+
+Compares the previous construction (base64 string, data-URI f-string,
+``json.dumps`` of the whole payload, encode to bytes) with
+``model_client.encode_body`` drained the way urllib3 sends it. The image
+bytes themselves are allocated before measuring, as they already sit in
+the pipeline state.
+
+    python -m benchmarks.bench_request_body_memory --sizes 1 5 20
+"""
+
+import argparse
+import base64
+import json
+import os
+import tracemalloc
+
+from fashion_tagger.services.langgraph_integration.model_client import (
+    InlineImage,
+    _StreamingBody,
+    encode_body,
+    make_image_part,
+    make_text_part,
+)
+
+_SEND_BLOCK = 16 * 1024  # urllib3's default read size
+
+
+def _peak(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _payload(image_part):
+    return {
+        "model": "vision",
+        "messages": [{"role": "user", "content": [make_text_part("Describe the product."), image_part]}],
+        "response_format": {"type": "json_object"},
+    }
+
+
+def _old_body(image: bytes) -> int:
+    data_uri = f"data:image/jpeg;base64,{base64.b64encode(image).decode('ascii')}"
+    return len(json.dumps(_payload(make_image_part(data_uri))).encode("utf-8"))
+
+
+def _new_body(image: bytes) -> int:
+    body = _StreamingBody(*encode_body(_payload(make_image_part(InlineImage(image)))))
+    sent = 0
+    while True:
+        block = body.read(_SEND_BLOCK)
+        if not block:
+            return sent
+        sent += len(block)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 5, 20], help="image sizes in MB")
+    args = parser.parse_args()
+
+    print(f"{'image':>8}  {'body':>8}  {'old peak':>9}  {'new peak':>9}")
+    for size in args.sizes:
+        image = os.urandom(int(size * 2**20))
+        assert _old_body(image) == _new_body(image)
+        old_peak = _peak(lambda: _old_body(image))
+        new_peak = _peak(lambda: _new_body(image))
+        body_size = _new_body(image)
+        print(
+            f"{size:6.1f}MB  {body_size / 2**20:6.1f}MB  "
+            f"{old_peak / 2**20:7.1f}MB  {new_peak / 2**10:7.0f}KB"
+        )
+
+
+if __name__ == "__main__":
+    main()
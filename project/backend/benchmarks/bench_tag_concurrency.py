@@ -0,0 +1,108 @@
+"""Concurrent throughput of POST /api/v1/tag/ (sync vs ASGI deployment).
+
+1. Start a slow upstream stub standing in for OpenRouter and SerpAPI:
+
+       python -m benchmarks.bench_tag_concurrency stub --port 9000 --latency 5
+
+2. Start the service against it, once per deployment mode:
+
+       export OPENROUTER_BASE_URL=http://127.0.0.1:9000/chat
+       export SERPAPI_BASE_URL=http://127.0.0.1:9000/search
+       export OPENROUTER_API_KEY=stub SERPAPI_API_KEY=stub
+       USE_ASGI=false gunicorn --workers 4 --bind 127.0.0.1:8000
+       USE_ASGI=true  gunicorn --workers 4 --bind 127.0.0.1:8000
+
+3. Fire concurrent requests at it and compare the reports:
+
+       python -m benchmarks.bench_tag_concurrency load \\
+           --url http://127.0.0.1:8000/api/v1/tag/ --api-key fk_live_... \\
+           --requests 200 --concurrency 100
+
+Use an account whose daily limit is large enough for the run.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import aiohttp
+from aiohttp import web
+
+
+async def _stub_chat(request: web.Request) -> web.Response:
+    await asyncio.sleep(request.app["latency"])
+    content = json.dumps({"entities": [{"name": "color", "values": ["blue"]}]})
+    return web.json_response({"choices": [{"message": {"content": content}}]})
+
+
+async def _stub_search(request: web.Request) -> web.Response:
+    await asyncio.sleep(request.app["latency"])
+    return web.json_response({"image_results": [{"title": "stub"}]})
+
+
+def run_stub(port: int, latency: float) -> None:
+    app = web.Application()
+    app["latency"] = latency
+    app.router.add_post("/chat", _stub_chat)
+    app.router.add_get("/search", _stub_search)
+    web.run_app(app, host="127.0.0.1", port=port)
+
+
+async def run_load(url: str, api_key: str, total: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = {}
+
+    async def one(session: aiohttp.ClientSession, i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            async with session.post(
+                url,
+                json={"image_url": f"https://example.com/bench/{i}.jpg"},
+                headers={"Api-Key": api_key},
+            ) as resp:
+                await resp.read()
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+    timeout = aiohttp.ClientTimeout(total=None)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(session, i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"requests:     {total} (concurrency {concurrency})")
+    print(f"statuses:     {statuses}")
+    print(f"wall time:    {elapsed:.2f} s")
+    print(f"throughput:   {total / elapsed:.2f} req/s")
+    print(f"latency p50:  {statistics.median(latencies):.2f} s")
+    print(f"latency p95:  {latencies[int(len(latencies) * 0.95) - 1]:.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    stub = sub.add_parser("stub", help="run the slow upstream stub")
+    stub.add_argument("--port", type=int, default=9000)
+    stub.add_argument("--latency", type=float, default=5.0)
+
+    load = sub.add_parser("load", help="send concurrent tag requests")
+    load.add_argument("--url", default="http://127.0.0.1:8000/api/v1/tag/")
+    load.add_argument("--api-key", required=True)
+    load.add_argument("--requests", type=int, default=100)
+    load.add_argument("--concurrency", type=int, default=50)
+
+    args = parser.parse_args()
+    if args.command == "stub":
+        run_stub(args.port, args.latency)
+    else:
+        asyncio.run(run_load(args.url, args.api_key, args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
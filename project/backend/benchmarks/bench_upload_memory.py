@@ -0,0 +1,95 @@
+"""Peak Python memory per request: multipart upload vs base64 data URI.
+
+Both paths end with the downscaled image the vision call receives:
+
+- data URI: the client base64-encodes the image into a JSON body, the
+  server parses the JSON, decodes the base64 and preprocesses the bytes.
+- upload: the multipart body is parsed by ``SpooledImageUploadHandler``
+  and the image is preprocessed straight from the spooled file.
+
+Measured with ``tracemalloc``, which does not see Pillow's pixel buffers
+(the same for both paths), only Python-level copies of the encoded image.
+
+    python -m benchmarks.bench_upload_memory --sizes 5 20
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import tracemalloc
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+import numpy as np  # noqa: E402
+from django.test import RequestFactory, override_settings  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from fashion_tagger.services import tagger  # noqa: E402
+from fashion_tagger.services.langgraph_integration import preprocess  # noqa: E402
+from fashion_tagger.uploads import SpooledImageUploadHandler  # noqa: E402
+
+
+def _make_png(megabytes: float) -> bytes:
+    """Random-noise PNG of roughly the requested size (noise does not compress)."""
+    side = int((megabytes * 1024 * 1024 / 3) ** 0.5)
+    pixels = np.random.default_rng(0).integers(0, 256, (side, side, 3), dtype=np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(pixels).save(out, format="PNG", compress_level=1)
+    return out.getvalue()
+
+
+def _peak(func) -> int:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _data_uri_request(body: bytes) -> None:
+    payload = json.loads(body)
+    image_bytes = base64.b64decode(payload["image"].split(",", 1)[1])
+    preprocess.preprocess_image(image_bytes)
+
+
+def _upload_request(factory: RequestFactory, image: bytes):
+    upload = io.BytesIO(image)
+    upload.name = "bench.png"
+    request = factory.post("/api/v1/tag/upload/", {"image": upload})
+    request.upload_handlers = [SpooledImageUploadHandler(request)]
+    return lambda: tagger._upload_input(request.FILES["image"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[5, 20], help="upload sizes in MB")
+    args = parser.parse_args()
+
+    factory = RequestFactory()
+    print(f"{'upload':>10}  {'data URI peak':>14}  {'multipart peak':>14}  {'saved':>6}")
+    for size in args.sizes:
+        image = _make_png(size)
+        # Request bodies are built before measuring: on a real server they
+        # arrive from the socket rather than sitting in memory.
+        body = json.dumps(
+            {"image": "data:image/png;base64," + base64.b64encode(image).decode("ascii")}
+        ).encode("utf-8")
+        with override_settings(TAGGING_UPLOAD_MAX_BYTES=len(image) * 2):
+            uri_peak = _peak(lambda: _data_uri_request(body))
+            upload_peak = _peak(_upload_request(factory, image))
+        print(
+            f"{len(image) / 2**20:8.1f}MB  {uri_peak / 2**20:12.1f}MB  "
+            f"{upload_peak / 2**20:12.1f}MB  {1 - upload_peak / uri_peak:6.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
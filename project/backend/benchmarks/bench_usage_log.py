@@ -0,0 +1,80 @@
+"""Usage logging cost: one INSERT per request vs the buffered pipeline.
+
+- Request latency is the time the view spends logging one event.
+  ``UsageLog.objects.create`` is compared with ``usage.record``.
+- Insert throughput is rows per second written to the database. It
+  compares one INSERT per row with ``bulk_create`` batches of
+  ``USAGE_LOG_MAX_BATCH`` rows, which is what the buffer's flush does.
+
+Run it against the database the deployment uses:
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_usage_log --events 5000
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from accounts.models import UsageLog, User  # noqa: E402
+from accounts.services import usage  # noqa: E402
+
+_EMAIL = "bench-usage-log@example.com"
+_ENDPOINT = "/api/v1/tag/"
+
+
+def _latencies(func, events):
+    samples = []
+    for _ in range(events):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return statistics.median(samples) * 1e6, samples[int(len(samples) * 0.99) - 1] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=5000)
+    args = parser.parse_args()
+
+    User.objects.filter(email=_EMAIL).delete()
+    user = User.objects.create_user(email=_EMAIL, password="bench-password")
+    # Only this script's flushes write; the timed loop must not race the thread.
+    usage.buffer.max_age = 0
+    usage.buffer.max_items = args.events + 1
+    try:
+        print(f"request latency ({args.events} events)")
+        p50, p99 = _latencies(
+            lambda: UsageLog.objects.create(user=user, used_at=timezone.now(), endpoint=_ENDPOINT),
+            args.events,
+        )
+        print(f"  create()        p50 {p50:7.1f}us  p99 {p99:7.1f}us")
+        p50, p99 = _latencies(lambda: usage.record(user, _ENDPOINT, True), args.events)
+        print(f"  usage.record()  p50 {p50:7.1f}us  p99 {p99:7.1f}us")
+
+        print("insert throughput")
+        start = time.perf_counter()
+        usage.flush()
+        bulk = args.events / (time.perf_counter() - start)
+        start = time.perf_counter()
+        for _ in range(args.events):
+            UsageLog.objects.create(user=user, used_at=timezone.now(), endpoint=_ENDPOINT)
+        single = args.events / (time.perf_counter() - start)
+        print(f"  one INSERT per row  {single:9.0f} rows/s")
+        print(f"  bulk_create         {bulk:9.0f} rows/s  (batches of {settings.USAGE_LOG_MAX_BATCH})")
+        assert UsageLog.objects.filter(user=user).count() == 3 * args.events
+    finally:
+        user.delete()
+
+
+if __name__ == "__main__":
+    main()
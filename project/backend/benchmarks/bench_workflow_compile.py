@@ -0,0 +1,50 @@
+"""Per-request overhead of building the LangGraph workflow.
+
+Compares compiling the graph on every request (the old behaviour) with
+looking it up in the process-level registry.
+
+    python -m benchmarks.bench_workflow_compile --iterations 500
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+from fashion_tagger.services.langgraph_integration import langgraph_service  # noqa: E402
+
+
+def _time_per_call(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    compile_each_time = _time_per_call(
+        lambda: langgraph_service._compile_workflow(
+            use_serpapi=langgraph_service.USE_SERPAPI
+        ),
+        args.iterations,
+    )
+
+    langgraph_service.clear_workflow_registry()
+    langgraph_service.warm_up_workflows()
+    registry_lookup = _time_per_call(
+        langgraph_service.get_compiled_workflow, args.iterations
+    )
+
+    print(f"iterations:            {args.iterations}")
+    print(f"compile per request:   {compile_each_time * 1e6:10.1f} us")
+    print(f"registry lookup:       {registry_lookup * 1e6:10.1f} us")
+    print(f"speed-up:              {compile_each_time / registry_lookup:10.0f}x")
+
+
+if __name__ == "__main__":
+    main()
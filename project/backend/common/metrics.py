@@ -0,0 +1,247 @@
+"""Process-local counters and histograms for service instrumentation.
+
+Counters are identified by a name plus optional labels, e.g.
+``incr("http_pool_requests_total", host="openrouter.ai")``. Histograms count
+observations in fixed buckets, e.g.
+``observe("langgraph_node_duration_seconds", 0.42, node="image_to_tags")``.
+
+Every gunicorn worker keeps its own values. ``publish()`` writes them to one
+JSON file per process in a shared directory (``start_publisher()`` does so
+periodically), and ``collect()`` sums the files of all processes on the node,
+including exited ones, so totals never go backwards while the server runs.
+``render()`` formats the result in the Prometheus text format.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+_Key = Tuple[str, _LabelKey]
+
+# Upper bounds in seconds, from a cache hit to a slow vision model call.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters: Dict[_Key, float] = {}
+# key -> [bucket bounds, per-bucket counts (the last one is +Inf), sum]
+_histograms: Dict[_Key, list] = {}
+
+
+def _key(name: str, labels: Dict[str, object]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def incr(name: str, value: float = 1, **labels) -> None:
+    """Increase a counter by ``value``."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def get(name: str, **labels) -> float:
+    """Return the current value of a counter (0 if never incremented)."""
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def total(name: str) -> float:
+    """Return the sum of a counter across all label combinations."""
+    with _lock:
+        return sum(v for (n, _), v in _counters.items() if n == name)
+
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = DURATION_BUCKETS, **labels) -> None:
+    """Record ``value`` in a histogram; ``buckets`` are fixed by the first observation."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [tuple(buckets), [0] * (len(buckets) + 1), 0.0]
+        histogram[1][bisect_left(histogram[0], value)] += 1
+        histogram[2] += value
+
+
+@contextmanager
+def timer(name: str, **labels) -> Iterator[None]:
+    """Observe how long the block takes, in seconds, whether or not it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def histogram(name: str, **labels) -> Dict[str, object]:
+    """Return ``count``, ``sum`` and per-bucket ``counts`` of a histogram."""
+    with _lock:
+        bounds, counts, sum_ = _histograms.get(_key(name, labels), ((), [0], 0.0))
+        return {"count": sum(counts), "sum": sum_, "counts": list(counts), "buckets": bounds}
+
+
+def snapshot() -> Dict[_Key, float]:
+    """Return a copy of all counters."""
+    with _lock:
+        return dict(_counters)
+
+
+def histogram_snapshot() -> Dict[_Key, list]:
+    """Return a copy of all histograms as ``[bounds, counts, sum]``."""
+    with _lock:
+        return {key: [bounds, list(counts), sum_] for key, (bounds, counts, sum_) in _histograms.items()}
+
+
+def reset() -> None:
+    """Clear all counters and histograms (used by tests and benchmarks)."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+# ---------------------------------------------------------------------------
+# Aggregation across the processes of a node
+# ---------------------------------------------------------------------------
+
+_process_id: Optional[str] = None
+_publisher: Optional[threading.Thread] = None
+
+
+def _after_fork() -> None:
+    # A forked child starts from zero; its parent publishes its own values.
+    global _lock, _process_id, _publisher
+    _lock = threading.Lock()
+    _counters.clear()
+    _histograms.clear()
+    _process_id = None
+    _publisher = None
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _own_file(directory: str) -> str:
+    global _process_id
+    if _process_id is None:
+        # The suffix keeps a recycled pid from overwriting an exited worker's file.
+        _process_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    return os.path.join(directory, f"{_process_id}.json")
+
+
+def publish(directory: str) -> None:
+    """Write this process's counters and histograms to its file in ``directory``."""
+    counters, histograms = snapshot(), histogram_snapshot()
+    data = {
+        "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+        "histograms": [[name, labels, *values] for (name, labels), values in histograms.items()],
+    }
+    os.makedirs(directory, exist_ok=True)
+    path = _own_file(directory)
+    partial = f"{path}.partial"
+    with open(partial, "w", encoding="utf-8") as out:
+        json.dump(data, out)
+    os.replace(partial, path)
+
+
+def start_publisher(directory: str, interval: float) -> None:
+    """Publish every ``interval`` seconds from a daemon thread (once per process)."""
+    global _publisher
+    if not directory or _publisher is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                publish(directory)
+            except OSError:
+                logger.exception("Publishing metrics to %s failed", directory)
+
+    _publisher = threading.Thread(target=run, name="metrics-publisher", daemon=True)
+    _publisher.start()
+
+
+def clear_published(directory: str) -> None:
+    """Delete every process file in ``directory`` (when the server starts)."""
+    if not directory or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            os.remove(os.path.join(directory, name))
+
+
+def collect(directory: Optional[str] = None) -> Tuple[Dict[_Key, float], Dict[_Key, list]]:
+    """Return counters and histograms summed over every process publishing to ``directory``.
+
+    Publishes this process first, so its values are current. Without a
+    directory only this process is returned.
+    """
+    if not directory:
+        return snapshot(), histogram_snapshot()
+    publish(directory)
+    counters: Dict[_Key, float] = {}
+    histograms: Dict[_Key, list] = {}
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as published:
+                data = json.load(published)
+        except (OSError, ValueError):
+            continue  # deleted or replaced while listing
+        for metric, labels, value in data["counters"]:
+            key = (metric, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for metric, labels, bounds, counts, sum_ in data["histograms"]:
+            key = (metric, tuple(tuple(pair) for pair in labels))
+            merged = histograms.setdefault(key, [tuple(bounds), [0] * len(counts), 0.0])
+            if merged[0] != tuple(bounds):
+                continue
+            merged[1] = [a + b for a, b in zip(merged[1], counts)]
+            merged[2] += sum_
+    return counters, histograms
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render(counters: Dict[_Key, float], histograms: Dict[_Key, list]) -> str:
+    """Format counters and histograms in the Prometheus text exposition format."""
+    lines: List[str] = []
+    typed = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    for (name, labels), (bounds, counts, sum_) in sorted(histograms.items()):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in zip([_number(bound) for bound in bounds] + ["+Inf"], counts):
+            cumulative += count
+            le = f'le="{bound}"'
+            lines.append(f"{name}_bucket{_labels(labels, le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {repr(float(sum_))}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,48 @@
+"""Helpers shared by the apps' test modules."""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    """Keep-alive request handler that does not log to stderr."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+
+class StubHandler(QuietHandler):
+    """Answers every GET and POST with ``status`` and a JSON ``body``."""
+    body = b'{"choices": [{"message": {"content": "{\\"entities\\": []}"}}]}'
+    status = 200
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        self.send_response(self.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    do_GET = do_POST = _reply
+
+
+class LocalHTTPServerMixin:
+    """Run a stub HTTP server on localhost for the duration of a test class."""
+    handler_class = StubHandler
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), cls.handler_class)
+        cls.server_url = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
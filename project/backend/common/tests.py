@@ -0,0 +1,50 @@
+import time
+
+from django.db import DatabaseError
+from django.test import SimpleTestCase
+
+from .utils import BufferedWriter
+
+
+class TestBufferedWriter(SimpleTestCase):
+    def setUp(self):
+        self.batches = []
+
+    def _writer(self, **kwargs):
+        writer = BufferedWriter(self.batches.append, **kwargs)
+        self.addCleanup(writer.close)
+        return writer
+
+    def test_coalesces_per_key_and_flushes_when_full(self):
+        writer = self._writer(max_items=2, max_age=0)
+        writer.add("a", 1)
+        writer.add("a", 2)
+        self.assertEqual(self.batches, [])
+        writer.add("b", 3)
+        self.assertEqual(self.batches, [{"a": 2, "b": 3}])
+        self.assertEqual(len(writer), 0)
+
+    def test_flush_thread_bounds_staleness(self):
+        writer = self._writer(max_items=100, max_age=0.05)
+        writer.add("a", 1)
+        deadline = time.monotonic() + 2
+        while not self.batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.batches, [{"a": 1}])
+
+    def test_failed_batch_is_retried_with_newer_values(self):
+        calls = []
+
+        def flaky(batch):
+            calls.append(dict(batch))
+            if len(calls) == 1:
+                raise DatabaseError("database is locked")
+
+        writer = BufferedWriter(flaky, max_items=100, max_age=0)
+        self.addCleanup(writer.close)
+        writer.add("a", 1)
+        writer.add("b", 1)
+        self.assertEqual(writer.flush(), 0)
+        writer.add("a", 2)
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(calls[-1], {"a": 2, "b": 1})
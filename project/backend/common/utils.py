@@ -0,0 +1,190 @@
+"""Small shared helpers."""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU cache whose entries expire.
+
+    Every entry carries its own TTL (``ttl`` by default), so callers can keep
+    failures for less time than successes. When ``maxsize`` is reached the
+    least recently used entry is evicted. With a ``name``, hits, misses and
+    evictions are counted in ``common.metrics`` as ``cache_hits_total``,
+    ``cache_misses_total`` and ``cache_evictions_total`` labelled
+    ``cache=<name>``.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        name: Optional[str] = None,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._timer = timer
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _count(self, counter: str) -> None:
+        if self.name:
+            metrics.incr(counter, cache=self.name)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or ``default`` if it is missing or expired."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > self._timer():
+                    self._data.move_to_end(key)
+                    self._count("cache_hits_total")
+                    return value
+                del self._data[key]
+        self._count("cache_misses_total")
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store ``value`` for ``ttl`` seconds (the cache default if omitted)."""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        evicted = 0
+        with self._lock:
+            self._data[key] = (self._timer() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                evicted += 1
+        if evicted and self.name:
+            metrics.incr("cache_evictions_total", evicted, cache=self.name)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class BufferedWriter:
+    """Coalesce writes in memory and hand them to ``flush_func`` in batches.
+
+    ``add(key, value)`` keeps the latest value per key. A daemon thread
+    passes the buffer to ``flush_func`` as a dict every ``max_age`` seconds,
+    or as soon as it holds ``max_items`` keys, so a recorded value reaches
+    the database at most ``max_age`` seconds (plus one flush) later and
+    ``add()`` never waits for the write. With ``max_age <= 0`` there is no
+    thread and ``add()`` flushes inline when the buffer is full.
+    ``flush()`` also runs at interpreter exit; process managers that skip
+    ``atexit`` (gunicorn ``worker_exit``) should call it themselves.
+
+    If ``flush_func`` raises, the batch is merged back (newer values win) and
+    retried on the next flush. With a ``name``, flushed and failed items are
+    counted in ``common.metrics`` as ``buffered_writes_flushed_total`` and
+    ``buffered_writes_failed_total`` labelled ``buffer=<name>``.
+    """
+
+    def __init__(
+        self,
+        flush_func: Callable[[Dict[Hashable, Any]], None],
+        max_items: int,
+        max_age: float,
+        name: Optional[str] = None,
+    ):
+        self.flush_func = flush_func
+        self.max_items = max_items
+        self.max_age = max_age
+        self.name = name
+        self._pending: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        atexit.register(self.flush)
+
+    def _ensure_thread(self) -> None:
+        # Called with self._lock held. A forked worker starts its own
+        # thread and does not flush values recorded by its parent.
+        if self._pid == os.getpid():
+            return
+        if self._pid is not None:
+            self._pending.clear()
+        self._pid = os.getpid()
+        if self.max_age > 0:
+            threading.Thread(target=self._run, name=f"buffered-writer-{self.name}", daemon=True).start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.max_age)
+            self._wake.clear()
+            self.flush()
+
+    def add(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._ensure_thread()
+            self._pending[key] = value
+            full = len(self._pending) >= self.max_items
+        if not full:
+            return
+        if self.max_age > 0:
+            self._wake.set()
+        else:
+            self.flush()
+
+    def drain(self) -> Dict[Hashable, Any]:
+        """Remove and return everything buffered, without flushing it."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        return batch
+
+    def flush(self) -> int:
+        """Write everything buffered so far; return how many items were written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                self.flush_func(batch)
+            except Exception:
+                logger.exception("Buffered write of %s items failed; retrying later", len(batch))
+                with self._lock:
+                    batch.update(self._pending)
+                    self._pending = batch
+                if self.name:
+                    metrics.incr("buffered_writes_failed_total", len(batch), buffer=self.name)
+                return 0
+        if self.name:
+            metrics.incr("buffered_writes_flushed_total", len(batch), buffer=self.name)
+        return len(batch)
+
+    def close(self) -> None:
+        """Stop the flush thread and write what is left."""
+        self._stop.set()
+        self._wake.set()
+        self.flush()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
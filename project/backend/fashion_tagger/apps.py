@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class FashionTaggerConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'fashion_tagger'
+
+    def ready(self):
+        if settings.TAGGING_TRANSLATION_MEMORY_ENABLED:
+            from .services import translation_memory
+            translation_memory.install()
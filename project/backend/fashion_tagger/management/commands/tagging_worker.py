@@ -0,0 +1,157 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from common import metrics
+
+# Job code is imported inside the functions below: spawned worker
+# processes import this module before Django is set up.
+
+logger = logging.getLogger(__name__)
+
+
+def _run_in_thread(job_id):
+    from fashion_tagger.services import jobs
+
+    try:
+        jobs.run_job(job_id)
+    finally:
+        connection.close()
+
+
+def _init_process():
+    # Children are spawned (not forked) so they never share the parent's
+    # database sockets; they need their own Django setup.
+    import django
+
+    django.setup()
+    metrics.start_publisher(settings.METRICS_DIR, settings.METRICS_PUBLISH_INTERVAL)
+
+
+def _run_in_process(job_id):
+    from fashion_tagger.services import jobs
+
+    jobs.run_job(job_id)
+    close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Process queued tagging jobs with a local pool of threads or processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=settings.TAGGING_WORKER_CONCURRENCY,
+            help="Jobs processed at the same time.",
+        )
+        parser.add_argument(
+            "--mode", choices=["thread", "process"], default=settings.TAGGING_WORKER_MODE,
+            help="Run jobs in threads or in separate processes.",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=settings.TAGGING_WORKER_POLL_INTERVAL,
+            help="Seconds to wait before polling again when the queue is empty.",
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Exit once the queue is empty instead of polling forever.",
+        )
+        parser.add_argument(
+            "--no-webhooks", action="store_true",
+            help="Do not deliver webhook results from this worker.",
+        )
+
+    def handle(self, *args, **options):
+        from fashion_tagger.services import jobs
+
+        concurrency = max(1, options["concurrency"])
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stopping = threading.Event()
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        if options["mode"] == "process":
+            executor = ProcessPoolExecutor(
+                max_workers=concurrency,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process,
+            )
+            run = _run_in_process
+        else:
+            executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="tagging-worker")
+            run = _run_in_thread
+
+        # Job and pipeline metrics show up in the node's /metrics.
+        metrics.start_publisher(settings.METRICS_DIR, settings.METRICS_PUBLISH_INTERVAL)
+        self.stdout.write(
+            f"Tagging worker {worker_id} started ({options['mode']} x {concurrency})"
+        )
+        dispatcher = None
+        if not options["no_webhooks"]:
+            dispatcher = threading.Thread(
+                target=self._deliver_webhooks, args=(options["poll_interval"],),
+                name="webhook-dispatcher", daemon=True,
+            )
+            dispatcher.start()
+
+        in_flight = set()
+        processed = 0
+        with executor:
+            while not self._stopping.is_set():
+                jobs.fail_exhausted()
+                claimed = jobs.claim(worker_id, concurrency - len(in_flight))
+                in_flight.update(executor.submit(run, job.id) for job in claimed)
+
+                if not in_flight:
+                    if options["once"]:
+                        break
+                    self._stopping.wait(options["poll_interval"])
+                    continue
+
+                timeout = None if len(in_flight) >= concurrency else options["poll_interval"]
+                done, in_flight = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is not None:
+                        logger.error("Tagging job crashed the worker task", exc_info=future.exception())
+                processed += len(done)
+
+            # Let claimed jobs finish; unclaimed ones stay queued for others.
+            done, _ = wait(in_flight)
+            processed += len(done)
+
+        self._stopping.set()
+        if dispatcher is not None:
+            dispatcher.join()
+            if options["once"]:
+                # Flush results still inside their coalescing window.
+                time.sleep(settings.TAGGING_WEBHOOK_COALESCE_WINDOW)
+                self._deliver_webhooks_once()
+
+        if settings.METRICS_DIR:
+            metrics.publish(settings.METRICS_DIR)
+        self.stdout.write(f"Tagging worker {worker_id} stopped after {processed} jobs")
+
+    def _stop(self, signum, frame):
+        self._stopping.set()
+
+    def _deliver_webhooks(self, interval):
+        while not self._stopping.wait(interval):
+            self._deliver_webhooks_once()
+        connection.close()
+
+    def _deliver_webhooks_once(self):
+        from fashion_tagger.services import webhooks
+
+        try:
+            webhooks.dispatch_due()
+        except Exception:
+            logger.exception("Webhook dispatch failed")
@@ -0,0 +1,29 @@
+# Generated migration for the tagging result store
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name='TaggingResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_hash', models.CharField(help_text='SHA-256 hex digest of the image bytes', max_length=64)),
+                ('pipeline_version', models.CharField(help_text='Hash of models and prompts that produced the result', max_length=64)),
+                ('result', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('image_hash', 'pipeline_version'), name='unique_tagging_result_per_version')],
+            },
+        ),
+    ]
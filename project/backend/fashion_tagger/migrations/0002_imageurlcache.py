@@ -0,0 +1,26 @@
+# Generated migration for the URL revalidation cache
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fashion_tagger', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageURLCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_hash', models.CharField(help_text='SHA-256 hex digest of the URL', max_length=64, unique=True)),
+                ('url', models.TextField()),
+                ('image_hash', models.CharField(help_text='SHA-256 of the bytes last served by the URL', max_length=64)),
+                ('etag', models.CharField(blank=True, max_length=255)),
+                ('last_modified', models.CharField(blank=True, max_length=64)),
+                ('validated_at', models.DateTimeField(help_text='Last time the origin confirmed the content')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
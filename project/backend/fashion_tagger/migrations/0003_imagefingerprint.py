@@ -0,0 +1,22 @@
+# Generated migration for the near-duplicate fingerprint index
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fashion_tagger', '0002_imageurlcache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_hash', models.CharField(help_text='SHA-256 of the image bytes', max_length=64, unique=True)),
+                ('perceptual_hash', models.BigIntegerField(help_text='64-bit perceptual hash stored as a signed integer')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated migration for webhook result delivery
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fashion_tagger', '0004_taggingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taggingjob',
+            name='callback_url',
+            field=models.URLField(blank=True, help_text='Receives the result when the job finishes', max_length=2048),
+        ),
+        migrations.CreateModel(
+            name='WebhookDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('callback_url', models.URLField(max_length=2048)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('delivered', 'Delivered'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(help_text='Not sent before this time (coalescing window, backoff or lease)')),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='webhook_deliveries', to='fashion_tagger.taggingjob')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='webhook_outbox_due_idx'), models.Index(fields=['callback_url', 'status'], name='webhook_outbox_url_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated migration for the English -> Persian translation memory
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fashion_tagger', '0005_webhookdelivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagTranslation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_name', models.CharField(help_text='English entity name, lower-cased', max_length=100)),
+                ('value_en', models.CharField(blank=True, help_text='English value, lower-cased', max_length=255)),
+                ('value_fa', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('entity_name', 'value_en', 'value_fa'), name='unique_tag_translation')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated migration for the near-duplicate colour check
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fashion_tagger', '0006_tagtranslation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagefingerprint',
+            name='color_histogram',
+            field=models.BinaryField(blank=True, help_text='Coarse RGB histogram, 64 one-byte bins', null=True),
+        ),
+    ]
@@ -0,0 +1 @@
+# Django migrations package
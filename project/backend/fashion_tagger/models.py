@@ -0,0 +1,142 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+
+class TaggingResult(models.Model):
+    """Pipeline output for an image, keyed by the SHA-256 of its bytes."""
+    image_hash = models.CharField(max_length=64, help_text="SHA-256 hex digest of the image bytes")
+    pipeline_version = models.CharField(max_length=64, help_text="Hash of models and prompts that produced the result")
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    hit_count = models.PositiveIntegerField(default=0)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["image_hash", "pipeline_version"],
+                name="unique_tagging_result_per_version",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.image_hash[:12]}@{self.pipeline_version}"
+
+
+class ImageURLCache(models.Model):
+    """Maps an image URL to the content it served and its HTTP validators."""
+    url_hash = models.CharField(max_length=64, unique=True, help_text="SHA-256 hex digest of the URL")
+    url = models.TextField()
+    image_hash = models.CharField(max_length=64, help_text="SHA-256 of the bytes last served by the URL")
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    validated_at = models.DateTimeField(help_text="Last time the origin confirmed the content")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.url
+
+
+class ImageFingerprint(models.Model):
+    """Perceptual hash of a tagged image, for near-duplicate lookup."""
+    image_hash = models.CharField(max_length=64, unique=True, help_text="SHA-256 of the image bytes")
+    perceptual_hash = models.BigIntegerField(help_text="64-bit perceptual hash stored as a signed integer")
+    color_histogram = models.BinaryField(null=True, blank=True, help_text="Coarse RGB histogram, 64 one-byte bins")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.image_hash[:12]}:{self.perceptual_hash & 0xFFFFFFFFFFFFFFFF:016x}"
+
+
+class TaggingJob(models.Model):
+    """A queued tagging request, processed by ``manage.py tagging_worker``."""
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_SUCCEEDED, "Succeeded"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="tagging_jobs")
+    image_url = models.TextField()
+    callback_url = models.URLField(max_length=2048, blank=True, help_text="Receives the result when the job finishes")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker_id = models.CharField(max_length=64, blank=True, help_text="Worker that claimed the job")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="tagging_job_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
+
+
+class WebhookDelivery(models.Model):
+    """Outbox entry: one finished job result waiting to be POSTed to its callback URL."""
+    STATUS_PENDING = "pending"
+    STATUS_DELIVERED = "delivered"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_DELIVERED, "Delivered"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    callback_url = models.URLField(max_length=2048)
+    job = models.ForeignKey(TaggingJob, null=True, blank=True, on_delete=models.SET_NULL, related_name="webhook_deliveries")
+    payload = models.JSONField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(help_text="Not sent before this time (coalescing window, backoff or lease)")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="webhook_outbox_due_idx"),
+            models.Index(fields=["callback_url", "status"], name="webhook_outbox_url_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.callback_url} ({self.status})"
+
+
+class TagTranslation(models.Model):
+    """English -> Persian tag translation seen in a translate-model answer.
+
+    One row per distinct Persian rendering; ``count`` is how often it was
+    seen. An empty ``value_en`` holds the translation of the entity name.
+    """
+    entity_name = models.CharField(max_length=100, help_text="English entity name, lower-cased")
+    value_en = models.CharField(max_length=255, blank=True, help_text="English value, lower-cased")
+    value_fa = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["entity_name", "value_en", "value_fa"],
+                name="unique_tag_translation",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.entity_name}:{self.value_en} -> {self.value_fa}"
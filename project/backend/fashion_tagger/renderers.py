@@ -0,0 +1,24 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+def format_sse(event: str, data) -> bytes:
+    """Encode one Server-Sent Events message."""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients ask for ``text/event-stream``.
+
+    Streaming views answer with their own StreamingHttpResponse; this only
+    renders the error responses DRF produces (401, 400, 429 ...) as a single
+    ``error`` event.
+    """
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_sse("error", data)
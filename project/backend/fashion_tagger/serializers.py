@@ -0,0 +1,35 @@
+from django.conf import settings
+from rest_framework import serializers
+
+from .models import TaggingJob
+
+
+class BatchTagSerializer(serializers.Serializer):
+    image_urls = serializers.ListField(
+        child=serializers.URLField(max_length=2048),
+        allow_empty=False,
+    )
+    callback_url = serializers.URLField(max_length=2048, required=False, allow_blank=True)
+
+    def validate_image_urls(self, value):
+        max_items = settings.TAGGING_BATCH_MAX_ITEMS
+        if len(value) > max_items:
+            raise serializers.ValidationError(
+                f"At most {max_items} image URLs per batch."
+            )
+        return value
+
+
+class TaggingJobCreateSerializer(serializers.Serializer):
+    image_url = serializers.CharField()
+    callback_url = serializers.URLField(max_length=2048, required=False, allow_blank=True)
+
+
+class TaggingJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TaggingJob
+        fields = [
+            'id', 'image_url', 'callback_url', 'status', 'result', 'error',
+            'attempts', 'created_at', 'started_at', 'finished_at',
+        ]
+        read_only_fields = fields
@@ -0,0 +1,132 @@
+"""DB-backed queue for asynchronous tagging jobs.
+
+``submit()`` stores a queued ``TaggingJob``; workers (``manage.py
+tagging_worker``) ``claim()`` batches of them and ``run_job()`` each one.
+Claiming uses ``SELECT ... FOR UPDATE SKIP LOCKED`` so any number of
+workers can poll the same table without blocking each other or taking the
+same job twice; on databases without row locks (SQLite) the conditional
+``UPDATE`` on ``status`` keeps claims exclusive.
+
+A job whose worker died is reclaimed once it has been running for
+``TAGGING_JOB_LEASE`` seconds, up to ``TAGGING_JOB_MAX_ATTEMPTS`` attempts.
+
+Jobs submitted with a ``callback_url`` add their result to the webhook
+outbox (``webhooks``) in the same transaction that finishes them.
+"""
+
+import logging
+from datetime import timedelta
+from typing import List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from common import metrics
+from fashion_tagger.models import TaggingJob
+from . import webhooks
+from .langgraph_integration.image_fetch import ImageFetchError
+from .tagger import tag_image
+
+logger = logging.getLogger(__name__)
+
+
+def submit(user, image_url: str, callback_url: str = "") -> TaggingJob:
+    """Queue an image for tagging and return the job."""
+    job = TaggingJob.objects.create(user=user, image_url=image_url, callback_url=callback_url)
+    metrics.incr("tagging_jobs_submitted_total")
+    return job
+
+
+def submit_many(user, image_urls: List[str], callback_url: str = "") -> List[TaggingJob]:
+    """Queue several images at once, in order."""
+    created = TaggingJob.objects.bulk_create([
+        TaggingJob(user=user, image_url=image_url, callback_url=callback_url)
+        for image_url in image_urls
+    ])
+    metrics.incr("tagging_jobs_submitted_total", len(created))
+    return created
+
+
+def _claimable(now) -> Q:
+    lease_expired = now - timedelta(seconds=settings.TAGGING_JOB_LEASE)
+    return Q(status=TaggingJob.STATUS_QUEUED) | Q(
+        status=TaggingJob.STATUS_RUNNING,
+        started_at__lt=lease_expired,
+        attempts__lt=settings.TAGGING_JOB_MAX_ATTEMPTS,
+    )
+
+
+def claim(worker_id: str, limit: int) -> List[TaggingJob]:
+    """Mark up to ``limit`` of the oldest claimable jobs as running for this worker."""
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            TaggingJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(_claimable(now))
+            .order_by("created_at")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        TaggingJob.objects.filter(_claimable(now), id__in=ids).update(
+            status=TaggingJob.STATUS_RUNNING,
+            worker_id=worker_id,
+            started_at=now,
+            attempts=F("attempts") + 1,
+        )
+    jobs = list(
+        TaggingJob.objects.filter(id__in=ids, worker_id=worker_id, started_at=now)
+        .order_by("created_at")
+    )
+    metrics.incr("tagging_jobs_claimed_total", len(jobs))
+    return jobs
+
+
+def run_job(job_id) -> None:
+    """Tag the job's image and record the outcome."""
+    job = TaggingJob.objects.get(pk=job_id)
+    try:
+        result = tag_image(job.image_url)
+    except ImageFetchError as e:
+        logger.warning("Tagging job %s could not fetch %s: %s", job.id, job.image_url, e)
+        _finish(job, TaggingJob.STATUS_FAILED, error=e.public_message)
+    except Exception as e:
+        logger.error("Tagging job %s failed: %s", job.id, e, exc_info=True)
+        _finish(job, TaggingJob.STATUS_FAILED, error="Tagging failed.")
+    else:
+        _finish(job, TaggingJob.STATUS_SUCCEEDED, result=result)
+
+
+def _finish(job: TaggingJob, status: str, result=None, error: str = "") -> bool:
+    # Only the worker that currently holds the job may complete it; a job
+    # reclaimed after its lease expired belongs to the new worker.
+    finished_at = timezone.now()
+    with transaction.atomic():
+        updated = TaggingJob.objects.filter(
+            pk=job.pk, status=TaggingJob.STATUS_RUNNING, worker_id=job.worker_id
+        ).update(status=status, result=result, error=error, finished_at=finished_at)
+        if updated and job.callback_url:
+            job.status, job.result, job.error, job.finished_at = status, result, error, finished_at
+            webhooks.enqueue(job)
+    if updated:
+        metrics.incr("tagging_jobs_finished_total", status=status)
+    return bool(updated)
+
+
+def fail_exhausted() -> int:
+    """Fail running jobs whose lease expired after the last allowed attempt."""
+    lease_expired = timezone.now() - timedelta(seconds=settings.TAGGING_JOB_LEASE)
+    exhausted = TaggingJob.objects.filter(
+        status=TaggingJob.STATUS_RUNNING,
+        started_at__lt=lease_expired,
+        attempts__gte=settings.TAGGING_JOB_MAX_ATTEMPTS,
+    )
+    return sum(
+        _finish(job, TaggingJob.STATUS_FAILED, error="Worker did not finish the job.")
+        for job in exhausted
+    )
@@ -5,7 +5,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 OPENROUTER_API_KEY: str = os.getenv("OPENROUTER_API_KEY", "")
-OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_BASE_URL: str = os.getenv(
+    "OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1/chat/completions"
+)
 REQUEST_TIMEOUT: int = int(os.getenv("REQUEST_TIMEOUT", "60"))
 OPENROUTER_SITE_URL: str = os.getenv("OPENROUTER_SITE_URL", "")
 OPENROUTER_SITE_TITLE: str = os.getenv("OPENROUTER_SITE_TITLE", "")
@@ -14,3 +16,35 @@ OPENROUTER_SITE_TITLE: str = os.getenv("OPENROUTER_SITE_TITLE", "")
 VISION_MODEL: str = "qwen/qwen2.5-vl-32b-instruct:free"
 TRANSLATE_MODEL: str = "tngtech/deepseek-r1t2-chimera:free"
 USE_SERPAPI: bool = True
+
+SERPAPI_BASE_URL: str = os.getenv("SERPAPI_BASE_URL", "https://serpapi.com/search.json")
+
+# Reverse-image search cache (serpapi_search.py)
+SERPAPI_CACHE_ENABLED: bool = os.getenv("SERPAPI_CACHE_ENABLED", "true").lower() == "true"
+SERPAPI_CACHE_TTL: int = int(os.getenv("SERPAPI_CACHE_TTL", str(24 * 60 * 60)))
+SERPAPI_CACHE_NEGATIVE_TTL: int = int(os.getenv("SERPAPI_CACHE_NEGATIVE_TTL", "300"))  # failed / skipped
+SERPAPI_CACHE_MAX_ENTRIES: int = int(os.getenv("SERPAPI_CACHE_MAX_ENTRIES", "10000"))
+
+# Shared HTTP connection pool for upstream calls (OpenRouter, SerpAPI)
+HTTP_POOL_CONNECTIONS: int = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE: int = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+HTTP_ASYNC_POOL_LIMIT: int = int(os.getenv("HTTP_ASYNC_POOL_LIMIT", "100"))
+HTTP_KEEPALIVE: bool = os.getenv("HTTP_KEEPALIVE", "true").lower() == "true"
+HTTP_POOL_WARMUP: bool = os.getenv("HTTP_POOL_WARMUP", "false").lower() == "true"
+
+# Server-side image download (image_fetch.py)
+IMAGE_FETCH_MAX_BYTES: int = int(os.getenv("IMAGE_FETCH_MAX_BYTES", str(15 * 1024 * 1024)))
+IMAGE_FETCH_TIMEOUT: int = int(os.getenv("IMAGE_FETCH_TIMEOUT", "20"))
+IMAGE_FETCH_CHUNK_SIZE: int = 64 * 1024
+IMAGE_FETCH_MAX_REDIRECTS: int = int(os.getenv("IMAGE_FETCH_MAX_REDIRECTS", "3"))
+
+# Client-supplied image and webhook URLs may not resolve to private addresses (url_guard.py)
+OUTBOUND_ALLOW_PRIVATE_HOSTS: bool = os.getenv("OUTBOUND_ALLOW_PRIVATE_HOSTS", "false").lower() == "true"
+
+# Image preprocessing before the vision call (preprocess.py)
+IMAGE_PREPROCESS_ENABLED: bool = os.getenv("IMAGE_PREPROCESS_ENABLED", "true").lower() == "true"
+IMAGE_MAX_EDGE: int = int(os.getenv("IMAGE_MAX_EDGE", "1024"))
+IMAGE_OUTPUT_FORMAT: str = os.getenv("IMAGE_OUTPUT_FORMAT", "jpeg").lower()  # jpeg | webp
+IMAGE_OUTPUT_QUALITY: int = int(os.getenv("IMAGE_OUTPUT_QUALITY", "85"))
+IMAGE_PREPROCESS_POOL: str = os.getenv("IMAGE_PREPROCESS_POOL", "thread").lower()  # thread | process
+IMAGE_PREPROCESS_WORKERS: int = int(os.getenv("IMAGE_PREPROCESS_WORKERS", "2"))
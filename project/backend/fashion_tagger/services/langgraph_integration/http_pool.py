@@ -0,0 +1,267 @@
+"""Shared keep-alive HTTP connection pool for upstream calls.
+
+Every upstream call site (OpenRouter, SerpAPI) goes through one
+``requests.Session`` per process (or one ``aiohttp.ClientSession`` per event
+loop for the async pipeline), so TCP/TLS connections are reused across
+requests instead of being re-established on every call. Client-supplied
+URLs (images, webhooks) use the ``guarded=True`` sessions, whose connections
+check the address they connect to (see ``url_guard``).
+
+Pool usage is reported through ``common.metrics``:
+
+- ``http_pool_requests_total{host}``: requests sent through the pool
+- ``http_pool_misses_total{host}``: requests that had to open a new connection
+- hits are ``requests - misses``; see ``pool_stats()``.
+- ``http_upstream_duration_seconds{host}``: time until the response headers
+  arrived (histogram)
+- ``http_upstream_errors_total{host,error}``: exceptions by type, and
+  ``HTTP_<status>`` for 4xx/5xx responses
+
+``host`` is the OpenRouter or SerpAPI host; image and webhook URLs come
+from clients and are all counted as ``host="other"`` (see ``host_label``)
+so they cannot grow the number of series without bound.
+"""
+
+import asyncio
+import logging
+import socket
+import threading
+import time
+import weakref
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from common import metrics
+
+from .config import (
+    HTTP_ASYNC_POOL_LIMIT,
+    HTTP_KEEPALIVE,
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
+    OPENROUTER_BASE_URL,
+    SERPAPI_BASE_URL,
+)
+from .url_guard import GuardedHTTPConnection, GuardedHTTPSConnection, GuardedResolver
+
+logger = logging.getLogger(__name__)
+
+_UPSTREAM_HOSTS = frozenset(urlsplit(url).hostname for url in (OPENROUTER_BASE_URL, SERPAPI_BASE_URL))
+OTHER_HOST = "other"
+
+
+def host_label(host: Optional[str]) -> str:
+    """The ``host`` metric label: the upstream's host, or ``OTHER_HOST``."""
+    return host if host in _UPSTREAM_HOSTS else OTHER_HOST
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        metrics.incr("http_pool_misses_total", host=host_label(self.host))
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        metrics.incr("http_pool_misses_total", host=host_label(self.host))
+        return super()._new_conn()
+
+
+class _GuardedHTTPConnectionPool(_CountingHTTPConnectionPool):
+    ConnectionCls = GuardedHTTPConnection
+
+
+class _GuardedHTTPSConnectionPool(_CountingHTTPSConnectionPool):
+    ConnectionCls = GuardedHTTPSConnection
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that enables TCP keep-alive and counts pool usage.
+
+    With ``guarded=True`` new connections go through ``url_guard``.
+    """
+
+    def __init__(self, *, keepalive: bool = HTTP_KEEPALIVE, guarded: bool = False, **kwargs):
+        self.keepalive = keepalive
+        self.guarded = guarded
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.keepalive:
+            pool_kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            ]
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        if self.guarded:
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": _GuardedHTTPConnectionPool,
+                "https": _GuardedHTTPSConnectionPool,
+            }
+        else:
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": _CountingHTTPConnectionPool,
+                "https": _CountingHTTPSConnectionPool,
+            }
+
+    def send(self, request, **kwargs):
+        host = host_label(urlsplit(request.url).hostname)
+        metrics.incr("http_pool_requests_total", host=host)
+        start = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception as exc:
+            metrics.incr("http_upstream_errors_total", host=host, error=type(exc).__name__)
+            raise
+        finally:
+            metrics.observe("http_upstream_duration_seconds", time.perf_counter() - start, host=host)
+        if response.status_code >= 400:
+            metrics.incr("http_upstream_errors_total", host=host, error=f"HTTP_{response.status_code}")
+        return response
+
+
+def build_session(
+    pool_connections: int = HTTP_POOL_CONNECTIONS,
+    pool_maxsize: int = HTTP_POOL_MAXSIZE,
+    keepalive: bool = HTTP_KEEPALIVE,
+    guarded: bool = False,
+) -> requests.Session:
+    """Build a session whose adapters share a bounded connection pool.
+
+    ``pool_connections`` is the number of hosts kept in the pool and
+    ``pool_maxsize`` the number of idle connections kept per host (set it to
+    at least the number of threads per worker).
+    """
+    session = requests.Session()
+    adapter = PooledHTTPAdapter(
+        keepalive=keepalive,
+        guarded=guarded,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_sessions: Dict[bool, requests.Session] = {}
+_session_lock = threading.Lock()
+
+
+def get_session(guarded: bool = False) -> requests.Session:
+    """Return the process-wide pooled session, creating it on first use.
+
+    Pass ``guarded=True`` for client-supplied URLs.
+    """
+    session = _sessions.get(guarded)
+    if session is None:
+        with _session_lock:
+            session = _sessions.get(guarded)
+            if session is None:
+                session = _sessions[guarded] = build_session(guarded=guarded)
+    return session
+
+
+def close_session() -> None:
+    """Close the shared sessions and drop their pooled connections."""
+    with _session_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+async def _on_request_start(session, ctx, params):
+    ctx.host = host_label(params.url.host)
+    ctx.start = time.perf_counter()
+    metrics.incr("http_pool_requests_total", host=ctx.host)
+
+
+async def _on_request_end(session, ctx, params):
+    metrics.observe("http_upstream_duration_seconds", time.perf_counter() - ctx.start, host=ctx.host)
+    if params.response.status >= 400:
+        metrics.incr("http_upstream_errors_total", host=ctx.host, error=f"HTTP_{params.response.status}")
+
+
+async def _on_request_exception(session, ctx, params):
+    metrics.observe("http_upstream_duration_seconds", time.perf_counter() - ctx.start, host=ctx.host)
+    metrics.incr("http_upstream_errors_total", host=ctx.host, error=type(params.exception).__name__)
+
+
+async def _on_connection_create_end(session, ctx, params):
+    metrics.incr("http_pool_misses_total", host=getattr(ctx, "host", ""))
+
+
+def build_async_session(limit: int = HTTP_ASYNC_POOL_LIMIT, guarded: bool = False) -> aiohttp.ClientSession:
+    """Build an aiohttp session with a bounded keep-alive connector.
+
+    Must be called from within a running event loop.
+    """
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_request_end.append(_on_request_end)
+    trace_config.on_request_exception.append(_on_request_exception)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    connector = aiohttp.TCPConnector(limit=limit, resolver=GuardedResolver() if guarded else None)
+    return aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+
+
+_async_sessions: "Dict[bool, weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]]" = {
+    False: weakref.WeakKeyDictionary(),
+    True: weakref.WeakKeyDictionary(),
+}
+
+
+def get_async_session(guarded: bool = False) -> aiohttp.ClientSession:
+    """Return the pooled aiohttp session bound to the running event loop.
+
+    Pass ``guarded=True`` for client-supplied URLs.
+    """
+    loop = asyncio.get_running_loop()
+    session = _async_sessions[guarded].get(loop)
+    if session is None or session.closed:
+        session = build_async_session(guarded=guarded)
+        _async_sessions[guarded][loop] = session
+    return session
+
+
+async def close_async_session() -> None:
+    """Close the running loop's aiohttp sessions, if any."""
+    loop = asyncio.get_running_loop()
+    for sessions in _async_sessions.values():
+        session = sessions.pop(loop, None)
+        if session is not None:
+            await session.close()
+
+
+def warm_up(urls: Optional[Iterable[str]] = None, timeout: float = 5) -> None:
+    """Open one connection to each upstream host ahead of the first request.
+
+    Failures are logged and ignored; the pool then simply starts cold.
+    """
+    session = get_session()
+    for url in urls or (OPENROUTER_BASE_URL, SERPAPI_BASE_URL):
+        try:
+            session.head(url, timeout=timeout)
+        except requests.RequestException as e:
+            logger.warning("HTTP pool warm-up failed for %s: %s", url, e)
+
+
+def pool_stats() -> Dict[str, Dict[str, float]]:
+    """Return pool requests, hits and misses per upstream host."""
+    stats: Dict[str, Dict[str, float]] = {}
+    for (name, labels), value in metrics.snapshot().items():
+        if name not in ("http_pool_requests_total", "http_pool_misses_total"):
+            continue
+        host = dict(labels).get("host", "")
+        entry = stats.setdefault(host, {"requests": 0, "hits": 0, "misses": 0})
+        if name == "http_pool_requests_total":
+            entry["requests"] = value
+        else:
+            entry["misses"] = value
+    for entry in stats.values():
+        entry["hits"] = max(0, entry["requests"] - entry["misses"])
+    return stats
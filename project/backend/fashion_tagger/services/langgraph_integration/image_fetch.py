@@ -0,0 +1,281 @@
+"""Server-side image download through the shared connection pool.
+
+Images are streamed in chunks with a hard byte cap and an overall
+deadline, and their type is sniffed from magic bytes rather than trusted
+from the Content-Type header. ``fetch_image_node`` runs this as the first
+step of the tagging branch so later nodes work on the bytes.
+
+Every request, including each redirect hop, goes through
+``url_guard.check_url`` first, and the guarded sessions check the address
+each new connection is made to, so client URLs cannot reach private
+addresses. Error messages name the URL and the upstream failure; they are
+for the logs, and clients get ``ImageFetchError.public_message``.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from urllib.parse import urljoin
+
+import aiohttp
+import requests
+
+from .config import (
+    IMAGE_FETCH_CHUNK_SIZE,
+    IMAGE_FETCH_MAX_BYTES,
+    IMAGE_FETCH_MAX_REDIRECTS,
+    IMAGE_FETCH_TIMEOUT,
+)
+from .http_pool import get_async_session, get_session
+from .url_guard import REDIRECT_STATUSES, UnsafeURLError, acheck_url, check_url
+
+logger = logging.getLogger(__name__)
+
+
+class ImageFetchError(RuntimeError):
+    # What API clients are told; the message itself only goes to the logs.
+    public_message = "Could not fetch image."
+
+
+class ImageRejectedError(ImageFetchError):
+    """The URL is not allowed, or the download is too large or not an image."""
+
+
+@dataclass
+class FetchedImage:
+    status: int
+    content: bytes = b""
+    content_type: str = ""
+    etag: str = ""
+    last_modified: str = ""
+
+    @property
+    def not_modified(self) -> bool:
+        """True when a conditional request was answered with 304."""
+        return self.status == 304
+
+
+_MAGIC_TYPES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+)
+
+_ISO_BRANDS = {
+    b"avif": "image/avif",
+    b"avis": "image/avif",
+    b"heic": "image/heic",
+    b"heix": "image/heic",
+    b"mif1": "image/heif",
+    b"msf1": "image/heif",
+}
+
+
+def sniff_image_type(data: bytes) -> str:
+    """Return the image MIME type from magic bytes, or "" if unknown."""
+    for magic, mime in _MAGIC_TYPES:
+        if data.startswith(magic):
+            return mime
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp":
+        return _ISO_BRANDS.get(data[8:12], "")
+    return ""
+
+
+def _conditional_headers(etag: Optional[str], last_modified: Optional[str]) -> Dict[str, str]:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def _check_declared_length(url: str, content_length: Optional[str], max_bytes: int) -> None:
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise ImageRejectedError(
+            f"Image at {url} is {content_length} bytes (limit {max_bytes})"
+        )
+
+
+def _finish(url: str, content: bytes, headers) -> FetchedImage:
+    content_type = sniff_image_type(content)
+    if not content_type:
+        raise ImageRejectedError(f"Content at {url} is not a supported image")
+    return FetchedImage(
+        status=200,
+        content=content,
+        content_type=content_type,
+        etag=headers.get("ETag", ""),
+        last_modified=headers.get("Last-Modified", ""),
+    )
+
+
+def _guard(url: str) -> None:
+    try:
+        check_url(url)
+    except UnsafeURLError as e:
+        raise ImageRejectedError(str(e)) from e
+    except OSError as e:
+        raise ImageFetchError(f"Could not resolve the host of {url}: {e}") from e
+
+
+async def _aguard(url: str) -> None:
+    try:
+        await acheck_url(url)
+    except UnsafeURLError as e:
+        raise ImageRejectedError(str(e)) from e
+    except OSError as e:
+        raise ImageFetchError(f"Could not resolve the host of {url}: {e}") from e
+
+
+def _open(url: str, headers: Dict[str, str], timeout: int) -> requests.Response:
+    """Stream a GET of ``url``, following redirects only to allowed addresses."""
+    for _ in range(IMAGE_FETCH_MAX_REDIRECTS + 1):
+        _guard(url)
+        try:
+            resp = get_session(guarded=True).get(
+                url, headers=headers, timeout=timeout, stream=True, allow_redirects=False
+            )
+        except UnsafeURLError as e:
+            raise ImageRejectedError(str(e)) from e
+        location = resp.headers.get("Location")
+        if resp.status_code not in REDIRECT_STATUSES or not location:
+            return resp
+        resp.close()
+        url = urljoin(url, location)
+    raise ImageFetchError(f"Image fetch for {url} exceeded {IMAGE_FETCH_MAX_REDIRECTS} redirects")
+
+
+async def _aopen(url: str, headers: Dict[str, str], timeout: int) -> aiohttp.ClientResponse:
+    """Async variant of ``_open``."""
+    for _ in range(IMAGE_FETCH_MAX_REDIRECTS + 1):
+        await _aguard(url)
+        try:
+            resp = await get_async_session(guarded=True).get(
+                url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout), allow_redirects=False
+            )
+        except UnsafeURLError as e:
+            raise ImageRejectedError(str(e)) from e
+        location = resp.headers.get("Location")
+        if resp.status not in REDIRECT_STATUSES or not location:
+            return resp
+        resp.release()
+        url = urljoin(url, location)
+    raise ImageFetchError(f"Image fetch for {url} exceeded {IMAGE_FETCH_MAX_REDIRECTS} redirects")
+
+
+def fetch_image(
+    url: str,
+    *,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    timeout: int = IMAGE_FETCH_TIMEOUT,
+    max_bytes: int = IMAGE_FETCH_MAX_BYTES,
+) -> FetchedImage:
+    """Download an image, optionally as a conditional GET.
+
+    Pass the validators from an earlier fetch to get a 304 (empty content)
+    when the origin reports the image unchanged. The body is streamed and
+    the download aborted once it exceeds ``max_bytes`` or ``timeout``
+    seconds in total. Redirects are followed up to
+    ``IMAGE_FETCH_MAX_REDIRECTS`` times, each target checked like ``url``.
+    """
+    deadline = time.monotonic() + timeout
+    try:
+        with _open(url, _conditional_headers(etag, last_modified), timeout) as resp:
+            if resp.status_code == 304:
+                return FetchedImage(status=304, etag=etag or "", last_modified=last_modified or "")
+            if resp.status_code != 200:
+                raise ImageFetchError(f"Image fetch failed for {url}: HTTP {resp.status_code}")
+            _check_declared_length(url, resp.headers.get("Content-Length"), max_bytes)
+
+            chunks = []
+            received = 0
+            for chunk in resp.iter_content(chunk_size=IMAGE_FETCH_CHUNK_SIZE):
+                received += len(chunk)
+                if received > max_bytes:
+                    raise ImageRejectedError(f"Image at {url} exceeds {max_bytes} bytes")
+                if time.monotonic() > deadline:
+                    raise ImageFetchError(f"Image fetch for {url} exceeded {timeout}s")
+                chunks.append(chunk)
+            return _finish(url, b"".join(chunks), resp.headers)
+    except requests.RequestException as e:
+        raise ImageFetchError(f"Image fetch failed for {url}: {e}") from e
+
+
+async def afetch_image(
+    url: str,
+    *,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    timeout: int = IMAGE_FETCH_TIMEOUT,
+    max_bytes: int = IMAGE_FETCH_MAX_BYTES,
+) -> FetchedImage:
+    """Async variant of ``fetch_image`` using the loop's aiohttp session."""
+    try:
+        async with await _aopen(url, _conditional_headers(etag, last_modified), timeout) as resp:
+            if resp.status == 304:
+                return FetchedImage(status=304, etag=etag or "", last_modified=last_modified or "")
+            if resp.status != 200:
+                raise ImageFetchError(f"Image fetch failed for {url}: HTTP {resp.status}")
+            _check_declared_length(url, resp.headers.get("Content-Length"), max_bytes)
+
+            chunks = []
+            received = 0
+            async for chunk in resp.content.iter_chunked(IMAGE_FETCH_CHUNK_SIZE):
+                received += len(chunk)
+                if received > max_bytes:
+                    raise ImageRejectedError(f"Image at {url} exceeds {max_bytes} bytes")
+                chunks.append(chunk)
+            return _finish(url, b"".join(chunks), resp.headers)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise ImageFetchError(f"Image fetch failed for {url}: {e or type(e).__name__}") from e
+
+
+def _needs_fetch(state: Dict[str, Any]) -> bool:
+    # image_fetch_failed: the caller already tried and failed; do not wait on the origin twice.
+    image_url = state.get("image_url")
+    return (
+        not state.get("image_bytes")
+        and not state.get("image_fetch_failed")
+        and bool(image_url)
+        and not str(image_url).startswith("data:")
+    )
+
+
+def _fallback(state: Dict[str, Any], error: ImageFetchError) -> Dict[str, Any]:
+    # Transport errors: let the vision model try the public URL itself.
+    if isinstance(error, ImageRejectedError):
+        raise error
+    logger.warning("fetch_image_node: %s; passing the URL through", error)
+    return state
+
+
+def fetch_image_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Download the image into ``image_bytes`` unless the caller supplied it."""
+    if not _needs_fetch(state):
+        return state
+    try:
+        fetched = fetch_image(state["image_url"])
+    except ImageFetchError as e:
+        return _fallback(state, e)
+    return {**state, "image_bytes": fetched.content, "image_mime": fetched.content_type}
+
+
+async def afetch_image_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of ``fetch_image_node``."""
+    if not _needs_fetch(state):
+        return state
+    try:
+        fetched = await afetch_image(state["image_url"])
+    except ImageFetchError as e:
+        return _fallback(state, e)
+    return {**state, "image_bytes": fetched.content, "image_mime": fetched.content_type}
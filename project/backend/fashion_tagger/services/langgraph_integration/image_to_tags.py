@@ -1,8 +1,10 @@
-from typing import Any, Dict
+from typing import Any, Dict, List, Union
 
 from .config import VISION_MODEL
 from .model_client import (
-    OpenRouterClient,
+    AsyncOpenRouterClient,
+    InlineImage,
+    get_openrouter_client,
     make_image_part,
     make_text_part,
 )
@@ -39,15 +41,22 @@ def build_prompt() -> str:
     )
 
 
-def image_to_tags_node(state: Dict[str, Any]) -> Dict[str, Any]:
-    image_url = state.get("image_url")
+def _image_source(state: Dict[str, Any]) -> Union[InlineImage, str]:
+    """Inline the downloaded bytes when available, else pass the URL on."""
+    image_bytes = state.get("image_bytes")
+    if image_bytes:
+        return InlineImage(image_bytes, state.get("image_mime") or "image/jpeg")
+    return state.get("image_url")
+
+
+def _build_messages(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    image_url = _image_source(state)
     if not image_url:
         raise ValueError("image_to_tags_node: 'image_url' is missing in state")
 
-    client = OpenRouterClient()
     prompt = build_prompt()
 
-    messages = [
+    return [
         {
             "role": "user",
             "content": [
@@ -57,7 +66,8 @@ def image_to_tags_node(state: Dict[str, Any]) -> Dict[str, Any]:
         }
     ]
 
-    result = client.call_json(model=VISION_MODEL, messages=messages)
+
+def _apply_result(state: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
     image_tags_en = result["json"] or {}
 
     return {
@@ -65,3 +75,17 @@ def image_to_tags_node(state: Dict[str, Any]) -> Dict[str, Any]:
         "image_tags_en": image_tags_en,
         "raw_response": result.get("text"),
     }
+
+
+def image_to_tags_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    messages = _build_messages(state)
+    client = get_openrouter_client()
+    result = client.call_json(model=VISION_MODEL, messages=messages)
+    return _apply_result(state, result)
+
+
+async def aimage_to_tags_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    messages = _build_messages(state)
+    client = AsyncOpenRouterClient()
+    result = await client.acall_json(model=VISION_MODEL, messages=messages)
+    return _apply_result(state, result)
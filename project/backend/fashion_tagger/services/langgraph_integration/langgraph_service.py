@@ -1,14 +1,31 @@
-import base64
+import hashlib
+import inspect
 import os
 import logging
-from typing import Annotated, TypedDict, Any, Dict, Callable
+import sys
+import threading
+import time
+from typing import Annotated, TypedDict, Any, AsyncIterator, Dict, Callable, Iterator, Optional, Tuple
 import operator
 from langgraph.graph import StateGraph, END
-from .image_to_tags import image_to_tags_node
+
+from common import metrics
+
+from .image_fetch import afetch_image_node, fetch_image_node, sniff_image_type
+from .preprocess import apreprocess_image_node, preprocess_image_node
+from .image_to_tags import aimage_to_tags_node, build_prompt, image_to_tags_node
 from .merge_results import merge_results_node
-from .serpapi_search import serpapi_search_node
-from .translate_tags import translate_tags_node
-from .config import VISION_MODEL, TRANSLATE_MODEL, USE_SERPAPI
+from .serpapi_search import aserpapi_search_node, serpapi_search_node
+from .translate_tags import atranslate_tags_node, build_translation_prompt, translate_tags_node
+from .config import (
+    IMAGE_MAX_EDGE,
+    IMAGE_OUTPUT_FORMAT,
+    IMAGE_OUTPUT_QUALITY,
+    IMAGE_PREPROCESS_ENABLED,
+    TRANSLATE_MODEL,
+    USE_SERPAPI,
+    VISION_MODEL,
+)
 
 logger = logging.getLogger(__name__)
 DEBUG_LANGGRAPH = os.getenv("DEBUG_LANGGRAPH", "").lower() == "true"
@@ -18,68 +35,86 @@ def last(a, b):
     return b
 
 
-def _calculate_size(obj: Any) -> int:
-    """Calculate approximate size of an object in bytes."""
-    try:
-        import sys
-        return sys.getsizeof(str(obj))
-    except Exception:
-        return 0
-
-
-def _debug_wrap_node(node_func: Callable, node_name: str) -> Callable:
-    """Wrap a node function with debug logging.
-    
-    When DEBUG_LANGGRAPH=true, logs node name, keys added/changed,
-    and payload sizes after each node execution.
+def last_non_empty(a, b):
+    # Parallel branches pass the whole state through, including empty
+    # defaults for keys they never set; don't let those clobber a value.
+    return b if b else a
+
+
+def _approx_size(value: Any) -> int:
+    """Approximate payload size in bytes, without serialising ``value``."""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_approx_size(k) + _approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(_approx_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def _log_state_changes(node_name: str, state: Dict[str, Any], result: Dict[str, Any]) -> None:
+    # Keys the node added, or whose value it replaced
+    changed = sorted(key for key in result if key not in state or state[key] is not result[key])
+    if changed:
+        logger.debug(
+            "[LangGraph][%s] added: %s (sizes: %s)",
+            node_name,
+            ", ".join(changed),
+            ", ".join(f"{key}={_approx_size(result[key])}B" for key in changed),
+        )
+    else:
+        logger.debug("[LangGraph][%s] no state changes", node_name)
+
+
+def _instrument_node(node_func: Callable, node_name: str) -> Callable:
+    """Wrap a node function with timing, error counting and debug logging.
+
+    Records ``langgraph_node_duration_seconds{node}`` and, when the node
+    raises, ``langgraph_node_errors_total{node,error}``. With
+    DEBUG_LANGGRAPH=true it also logs the keys each node added or changed
+    and their approximate sizes. Works for both sync and async
+    (coroutine) nodes.
     """
-    if not DEBUG_LANGGRAPH:
-        return node_func
-    
+    debug = DEBUG_LANGGRAPH
+
+    if inspect.iscoroutinefunction(node_func):
+        async def async_wrapped_node(state: Dict[str, Any]) -> Dict[str, Any]:
+            start = time.perf_counter()
+            try:
+                result = await node_func(state)
+            except Exception as exc:
+                metrics.incr("langgraph_node_errors_total", node=node_name, error=type(exc).__name__)
+                raise
+            finally:
+                metrics.observe("langgraph_node_duration_seconds", time.perf_counter() - start, node=node_name)
+            if debug and logger.isEnabledFor(logging.DEBUG):
+                _log_state_changes(node_name, state, result)
+            return result
+
+        return async_wrapped_node
+
     def wrapped_node(state: Dict[str, Any]) -> Dict[str, Any]:
-        # Execute the original node
-        result = node_func(state)
-        
-        # Determine keys that were added or changed
-        state_keys = set(state.keys())
-        result_keys = set(result.keys())
-        new_or_changed_keys = result_keys - state_keys
-        
-        # For keys in both, check if values changed
-        for key in state_keys & result_keys:
-            if state.get(key) != result.get(key):
-                new_or_changed_keys.add(key)
-        
-        # Calculate sizes for changed keys
-        size_info = {}
-        for key in new_or_changed_keys:
-            value = result.get(key)
-            size_info[key] = _calculate_size(value)
-        
-        # Log the debug information
-        if new_or_changed_keys:
-            keys_list = sorted(new_or_changed_keys)
-            # Show keys that were added/changed
-            keys_str = ", ".join(keys_list)
-            # Show sizes for context
-            sizes_parts = [f"{k}={size_info[k]}B" for k in keys_list]
-            sizes_str = ", ".join(sizes_parts)
-            logger.debug(
-                "[LangGraph][%s] added: %s (sizes: %s)",
-                node_name,
-                keys_str,
-                sizes_str,
-            )
-        else:
-            logger.debug("[LangGraph][%s] no state changes", node_name)
-        
+        start = time.perf_counter()
+        try:
+            result = node_func(state)
+        except Exception as exc:
+            metrics.incr("langgraph_node_errors_total", node=node_name, error=type(exc).__name__)
+            raise
+        finally:
+            metrics.observe("langgraph_node_duration_seconds", time.perf_counter() - start, node=node_name)
+        if debug and logger.isEnabledFor(logging.DEBUG):
+            _log_state_changes(node_name, state, result)
         return result
-    
+
     return wrapped_node
 
 
 class WorkflowState(TypedDict, total=False):
     image_url: Annotated[str, last]
+    image_bytes: Annotated[bytes, last_non_empty]
+    image_mime: Annotated[str, last_non_empty]
+    image_preprocessed: Annotated[bool, last_non_empty]
+    image_fetch_failed: Annotated[bool, last_non_empty]
     image_tags_en: Annotated[Dict[str, Any], operator.or_]
     serpapi_results: Annotated[Dict[str, Any], operator.or_]
     merged_data: Annotated[Dict[str, Any], operator.or_]
@@ -104,28 +139,51 @@ def merge_for_translate_node(state: Dict[str, Any]) -> Dict[str, Any]:
     return {**state, "merged_data": merged_data}
 
 
-def _compile_workflow() -> StateGraph:
-    """Compile the LangGraph workflow with advanced_reasoning mode."""
+def _compile_workflow(use_serpapi: bool = True, use_async: bool = False) -> StateGraph:
+    """Compile the LangGraph workflow with advanced_reasoning mode.
+
+    With ``use_async`` the network-bound nodes are their asyncio variants and
+    the graph must be run with ``ainvoke``.
+    """
     workflow: StateGraph = StateGraph(WorkflowState)
 
-    # Nodes - wrap with debug instrumentation if enabled
-    workflow.add_node("fan_out", _debug_wrap_node(fan_out_node, "fan_out"))
-    workflow.add_node("image_to_tags", _debug_wrap_node(image_to_tags_node, "image_to_tags"))
-    workflow.add_node("merge_for_translate", _debug_wrap_node(merge_for_translate_node, "merge_for_translate"))
-    workflow.add_node("translate_tags", _debug_wrap_node(translate_tags_node, "translate_tags"))
-    workflow.add_node("merge_results", _debug_wrap_node(merge_results_node, "merge_results"))
+    if use_async:
+        fetch_node, preprocess_node, image_node, serpapi_node, translate_node = (
+            afetch_image_node, apreprocess_image_node, aimage_to_tags_node,
+            aserpapi_search_node, atranslate_tags_node,
+        )
+    else:
+        fetch_node, preprocess_node, image_node, serpapi_node, translate_node = (
+            fetch_image_node, preprocess_image_node, image_to_tags_node,
+            serpapi_search_node, translate_tags_node,
+        )
+
+    # Nodes - timed and counted, with debug logging if enabled
+    workflow.add_node("fan_out", _instrument_node(fan_out_node, "fan_out"))
+    workflow.add_node("fetch_image", _instrument_node(fetch_node, "fetch_image"))
+    workflow.add_node("preprocess_image", _instrument_node(preprocess_node, "preprocess_image"))
+    workflow.add_node("image_to_tags", _instrument_node(image_node, "image_to_tags"))
+    workflow.add_node("merge_for_translate", _instrument_node(merge_for_translate_node, "merge_for_translate"))
+    workflow.add_node("translate_tags", _instrument_node(translate_node, "translate_tags"))
+    workflow.add_node("merge_results", _instrument_node(merge_results_node, "merge_results"))
 
     # Set entry point
     workflow.set_entry_point("fan_out")
 
-    # Always go from fan_out to image_to_tags
-    workflow.add_edge("fan_out", "image_to_tags")
-
-    # Add serpapi node (always enabled in advanced_reasoning mode)
-    workflow.add_node("serpapi_search", _debug_wrap_node(serpapi_search_node, "serpapi_search"))
-    workflow.add_edge("fan_out", "serpapi_search")
-    workflow.add_edge("image_to_tags", "merge_for_translate")
-    workflow.add_edge("serpapi_search", "merge_for_translate")
+    # Tagging branch: download the image once, shrink it, then hand the bytes on
+    workflow.add_edge("fan_out", "fetch_image")
+    workflow.add_edge("fetch_image", "preprocess_image")
+    workflow.add_edge("preprocess_image", "image_to_tags")
+
+    # Add serpapi node (enabled in advanced_reasoning mode); it searches by
+    # the public URL, so it runs alongside the download. The branches have
+    # different lengths, so merge_for_translate waits for both explicitly.
+    if use_serpapi:
+        workflow.add_node("serpapi_search", _instrument_node(serpapi_node, "serpapi_search"))
+        workflow.add_edge("fan_out", "serpapi_search")
+        workflow.add_edge(["image_to_tags", "serpapi_search"], "merge_for_translate")
+    else:
+        workflow.add_edge("image_to_tags", "merge_for_translate")
 
     # Continue sequence
     workflow.add_edge("merge_for_translate", "translate_tags")
@@ -136,36 +194,236 @@ def _compile_workflow() -> StateGraph:
     return workflow.compile()
 
 
-def run_langgraph_on_bytes(image_bytes: bytes) -> Dict[str, Any]:
-    """Convenience entry: image bytes → data URI → invoke graph."""
-    b64 = base64.b64encode(image_bytes).decode("utf-8")
-    data_uri = f"data:image/jpeg;base64,{b64}"
+# Process-level registry of compiled graphs, keyed by pipeline configuration.
+# Compiled graphs hold no per-invocation state, so one instance is shared by
+# every request (and thread) in the worker.
+_WORKFLOW_REGISTRY: Dict[Tuple[Any, ...], Any] = {}
+_WORKFLOW_REGISTRY_LOCK = threading.Lock()
 
-    workflow = _compile_workflow()
 
-    initial_state = {
-        "image_url": data_uri,
-    }
+def _pipeline_config_key(use_async: bool = False) -> Tuple[Any, ...]:
+    """Return the configuration a compiled graph depends on."""
+    return (VISION_MODEL, TRANSLATE_MODEL, USE_SERPAPI, DEBUG_LANGGRAPH, use_async)
 
-    final_state = workflow.invoke(initial_state)
 
+def get_compiled_workflow(use_async: bool = False):
+    """Return the compiled workflow for the current configuration.
+
+    The graph is compiled on first use and reused afterwards. Compilation is
+    guarded by a lock so concurrent first requests build it only once.
+    """
+    key = _pipeline_config_key(use_async)
+    workflow = _WORKFLOW_REGISTRY.get(key)
+    if workflow is not None:
+        return workflow
+
+    with _WORKFLOW_REGISTRY_LOCK:
+        workflow = _WORKFLOW_REGISTRY.get(key)
+        if workflow is None:
+            workflow = _compile_workflow(use_serpapi=USE_SERPAPI, use_async=use_async)
+            _WORKFLOW_REGISTRY[key] = workflow
+            logger.info("[LangGraph] compiled workflow for config %s", key)
+    return workflow
+
+
+def pipeline_version() -> str:
+    """Return a short hash identifying what the pipeline would produce.
+
+    Covers the models, the SerpAPI flag, the image preprocessing settings
+    and both prompt templates, so any change to them yields a new version
+    (and a fresh result-cache namespace).
+    """
+    fingerprint = "\n".join([
+        VISION_MODEL,
+        TRANSLATE_MODEL,
+        str(USE_SERPAPI),
+        f"{IMAGE_PREPROCESS_ENABLED}:{IMAGE_MAX_EDGE}:{IMAGE_OUTPUT_FORMAT}:{IMAGE_OUTPUT_QUALITY}",
+        build_prompt(),
+        build_translation_prompt({}),
+    ])
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+
+def warm_up_workflows() -> None:
+    """Compile the workflows ahead of the first request (e.g. at worker boot)."""
+    get_compiled_workflow()
+    get_compiled_workflow(use_async=True)
+
+
+def clear_workflow_registry() -> None:
+    """Drop all compiled graphs; the next request recompiles."""
+    with _WORKFLOW_REGISTRY_LOCK:
+        _WORKFLOW_REGISTRY.clear()
+
+
+def _to_output(final_state: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "english": final_state.get("image_tags_en", {}),
         "persian": final_state.get("final_output", {}),
     }
 
 
-def run_langgraph_on_url(image_url: str) -> Dict[str, Any]:
-    """Convenience entry: image URL → invoke graph."""
-    workflow = _compile_workflow()
-
-    initial_state = {
-        "image_url": image_url,
+def _bytes_state(
+    image_bytes: bytes, image_mime: Optional[str] = None, preprocessed: bool = False
+) -> Dict[str, Any]:
+    # No public URL: SerpAPI is skipped and the vision call gets the bytes.
+    return {
+        "image_url": "",
+        "image_bytes": image_bytes,
+        "image_mime": image_mime or sniff_image_type(image_bytes) or "image/jpeg",
+        "image_preprocessed": preprocessed,
     }
 
+
+def run_langgraph_on_bytes(
+    image_bytes: bytes, image_mime: Optional[str] = None, preprocessed: bool = False
+) -> Dict[str, Any]:
+    """Convenience entry: image bytes → preprocess → invoke graph.
+
+    Pass ``preprocessed=True`` when the caller already downscaled the
+    image, so the graph does not decode and re-encode it again.
+    """
+    workflow = get_compiled_workflow()
+
+    initial_state = _bytes_state(image_bytes, image_mime, preprocessed)
+
     final_state = workflow.invoke(initial_state)
 
-    return {
-        "english": final_state.get("image_tags_en", {}),
-        "persian": final_state.get("final_output", {}),
-    }
+    return _to_output(final_state)
+
+
+def _url_state(
+    image_url: str, image_bytes: Optional[bytes], image_mime: Optional[str], fetch_failed: bool = False
+) -> Dict[str, Any]:
+    state: Dict[str, Any] = {"image_url": image_url}
+    if fetch_failed:
+        state["image_fetch_failed"] = True
+    if image_bytes:
+        state["image_bytes"] = image_bytes
+        state["image_mime"] = image_mime or sniff_image_type(image_bytes) or "image/jpeg"
+    return state
+
+
+def run_langgraph_on_url(
+    image_url: str,
+    image_bytes: Optional[bytes] = None,
+    image_mime: Optional[str] = None,
+    fetch_failed: bool = False,
+) -> Dict[str, Any]:
+    """Convenience entry: image URL → invoke graph.
+
+    Pass ``image_bytes`` when the caller has already downloaded the image
+    so the graph does not fetch it again, or ``fetch_failed=True`` when the
+    caller's download failed, so the URL is passed to the model as is.
+    """
+    workflow = get_compiled_workflow()
+
+    initial_state = _url_state(image_url, image_bytes, image_mime, fetch_failed)
+
+    final_state = workflow.invoke(initial_state)
+
+    return _to_output(final_state)
+
+
+async def arun_langgraph_on_bytes(
+    image_bytes: bytes, image_mime: Optional[str] = None, preprocessed: bool = False
+) -> Dict[str, Any]:
+    """Async entry: image bytes → preprocess → ``ainvoke`` the async graph."""
+    workflow = get_compiled_workflow(use_async=True)
+
+    initial_state = _bytes_state(image_bytes, image_mime, preprocessed)
+
+    final_state = await workflow.ainvoke(initial_state)
+
+    return _to_output(final_state)
+
+
+async def arun_langgraph_on_url(
+    image_url: str,
+    image_bytes: Optional[bytes] = None,
+    image_mime: Optional[str] = None,
+    fetch_failed: bool = False,
+) -> Dict[str, Any]:
+    """Async entry: image URL → ``ainvoke`` the async graph.
+
+    Upstream calls are awaited, so one event loop can have many taggings in
+    flight at once.
+    """
+    workflow = get_compiled_workflow(use_async=True)
+
+    initial_state = _url_state(image_url, image_bytes, image_mime, fetch_failed)
+
+    final_state = await workflow.ainvoke(initial_state)
+
+    return _to_output(final_state)
+
+
+# Graph nodes whose completion is reported by the streaming entries:
+# node name -> (event name, state key carrying the partial result).
+_STREAM_EVENTS = {
+    "image_to_tags": ("english", "image_tags_en"),
+    "serpapi_search": ("serpapi", "serpapi_results"),
+    "translate_tags": ("persian", "image_tags_fa"),
+}
+
+
+class _StreamCollector:
+    """Turn graph ``updates`` chunks into ``(event, data)`` pairs."""
+
+    def __init__(self):
+        self.final_state: Dict[str, Any] = {}
+
+    def events(self, chunk: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for node_name, update in chunk.items():
+            if not update:
+                continue
+            self.final_state.update(update)
+            if node_name in _STREAM_EVENTS:
+                event, key = _STREAM_EVENTS[node_name]
+                yield event, update.get(key) or {}
+
+    def result(self) -> Tuple[str, Dict[str, Any]]:
+        return "result", _to_output(self.final_state)
+
+
+def stream_langgraph_on_url(
+    image_url: str,
+    image_bytes: Optional[bytes] = None,
+    image_mime: Optional[str] = None,
+    fetch_failed: bool = False,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Streaming entry: yield partial results as graph nodes complete.
+
+    Yields ``("english", tags)``, ``("serpapi", results)`` and
+    ``("persian", tags)`` in completion order, then ``("result", output)``
+    with the same shape as ``run_langgraph_on_url``. The graph runs once;
+    events come from its ``updates`` stream.
+    """
+    workflow = get_compiled_workflow()
+    collector = _StreamCollector()
+
+    initial_state = _url_state(image_url, image_bytes, image_mime, fetch_failed)
+
+    for chunk in workflow.stream(initial_state, stream_mode="updates"):
+        yield from collector.events(chunk)
+
+    yield collector.result()
+
+
+async def astream_langgraph_on_url(
+    image_url: str,
+    image_bytes: Optional[bytes] = None,
+    image_mime: Optional[str] = None,
+    fetch_failed: bool = False,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Async variant of ``stream_langgraph_on_url`` on the async graph."""
+    workflow = get_compiled_workflow(use_async=True)
+    collector = _StreamCollector()
+
+    initial_state = _url_state(image_url, image_bytes, image_mime, fetch_failed)
+
+    async for chunk in workflow.astream(initial_state, stream_mode="updates"):
+        for event in collector.events(chunk):
+            yield event
+
+    yield collector.result()
@@ -3,7 +3,6 @@ from typing import Any, Dict
 
 def merge_results_node(state: Dict[str, Any]) -> Dict[str, Any]:
     image_tags_fa = state.get("image_tags_fa")
-    print(state)
     if not image_tags_fa:
         raise ValueError("merge_results_node: 'image_tags_fa' is missing in state")
 
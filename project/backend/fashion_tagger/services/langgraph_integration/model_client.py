@@ -1,11 +1,18 @@
 from __future__ import annotations
 
+import asyncio
+import base64
 import json
+import threading
 import time
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
 
+import aiohttp
 import requests
 
+from common import metrics
+
+from .http_pool import get_async_session, get_session
 from .config import (
     OPENROUTER_API_KEY,
     OPENROUTER_BASE_URL,
@@ -36,8 +43,40 @@ def _auth_headers() -> Dict[str, str]:
     return headers
 
 
-def make_image_part(image_url_or_data_uri: str) -> Dict[str, str]:
-    return {"type": "image_url", "image_url": image_url_or_data_uri}
+class InlineImage:
+    """Image bytes sent to the model as a base64 data URI.
+
+    The data URI is never built as a string: when the request body is
+    serialised, the base64 text is produced chunk by chunk straight from
+    ``data`` (see ``encode_body``).
+    """
+
+    __slots__ = ("data", "mime")
+
+    def __init__(self, data: bytes, mime: str = "image/jpeg"):
+        self.data = data
+        self.mime = mime
+
+    def _prefix(self) -> bytes:
+        return f'"data:{self.mime};base64,'.encode("ascii")
+
+    def encoded_length(self) -> int:
+        """Length of the quoted JSON string this image serialises to."""
+        return len(self._prefix()) + 4 * ((len(self.data) + 2) // 3) + 1
+
+    def iter_encoded(self, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Yield the quoted JSON string in chunks of about ``chunk_size`` bytes."""
+        yield self._prefix()
+        view = memoryview(self.data)
+        step = max(3, chunk_size // 4 * 3)  # whole base64 quanta, no padding mid-stream
+        for start in range(0, len(view), step):
+            yield base64.b64encode(view[start:start + step])
+        yield b'"'
+
+
+def make_image_part(image: Union[str, InlineImage]) -> Dict[str, Any]:
+    """Image content part from a URL, a data URI or an ``InlineImage``."""
+    return {"type": "image_url", "image_url": image}
 
 
 def make_text_part(text: str) -> Dict[str, str]:
@@ -58,12 +97,130 @@ def extract_json_from_text(text: str) -> Tuple[Optional[dict], Optional[str]]:
         return None, text
 
 
+def _build_payload(
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: Optional[float],
+    response_format: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "model": model,
+        "messages": messages,
+    }
+    if temperature is not None:
+        payload["temperature"] = temperature
+    if response_format is not None:
+        payload["response_format"] = response_format
+    return payload
+
+
+# Stands in for each InlineImage while the rest of the payload is dumped.
+_IMAGE_PLACEHOLDER = "\x00inline-image\x00"
+_IMAGE_PLACEHOLDER_JSON = json.dumps(_IMAGE_PLACEHOLDER).encode("ascii")
+
+
+def encode_body(payload: Dict[str, Any]) -> Tuple[List[Union[bytes, InlineImage]], int]:
+    """Serialise a chat payload without materialising inline images.
+
+    Returns the JSON body as segments (bytes, or ``InlineImage`` to be
+    expanded with ``iter_encoded``) and its total length in bytes. Apart
+    from the image bytes already held by the caller, memory use is the
+    size of the non-image JSON plus one encoding chunk.
+    """
+    images: List[InlineImage] = []
+
+    def default(obj: Any) -> str:
+        if isinstance(obj, InlineImage):
+            images.append(obj)
+            return _IMAGE_PLACEHOLDER
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    text = json.dumps(payload, default=default).encode("ascii")
+    pieces = text.split(_IMAGE_PLACEHOLDER_JSON)
+    segments: List[Union[bytes, InlineImage]] = [pieces[0]]
+    length = len(pieces[0])
+    for image, piece in zip(images, pieces[1:]):
+        segments += [image, piece]
+        length += image.encoded_length() + len(piece)
+    return segments, length
+
+
+def _iter_body(segments: List[Union[bytes, InlineImage]]) -> Iterator[bytes]:
+    for segment in segments:
+        if isinstance(segment, InlineImage):
+            yield from segment.iter_encoded()
+        else:
+            yield segment
+
+
+async def _aiter_body(segments: List[Union[bytes, InlineImage]]) -> AsyncIterator[bytes]:
+    for chunk in _iter_body(segments):
+        yield chunk
+
+
+class _StreamingBody:
+    """File-like request body with a known length, for ``requests``.
+
+    ``requests`` sends a Content-Length for objects with ``__len__`` and
+    urllib3 pulls the data through ``read()`` in small blocks.
+    """
+
+    def __init__(self, segments: List[Union[bytes, InlineImage]], length: int):
+        self._chunks = _iter_body(segments)
+        self._length = length
+        self._buffer = b""
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self._chunks
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer = self._buffer + chunk if self._buffer else chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _parse_chat_response(data: Dict[str, Any]) -> Dict[str, Any]:
+    content = data["choices"][0]["message"]["content"]
+    return {
+        "raw": data,
+        "content": content,
+    }
+
+
+def _parse_json_output(out: Dict[str, Any]) -> Dict[str, Any]:
+    content = out.get("content", "")
+    obj, raw = extract_json_from_text(content)
+    return {
+        "json": obj,
+        "text": None if obj is not None else content,
+        "raw": out.get("raw"),
+        "fallback_raw_text": raw,
+    }
+
+
+def _retry_delay(attempt: int) -> float:
+    return 0.8 * (attempt + 1)
+
+
 class OpenRouterClient:
     def __init__(
-        self, base_url: str = OPENROUTER_BASE_URL, timeout: int = REQUEST_TIMEOUT
+        self,
+        base_url: str = OPENROUTER_BASE_URL,
+        timeout: int = REQUEST_TIMEOUT,
+        session: Optional[requests.Session] = None,
     ):
         self.base_url = base_url
         self.timeout = timeout
+        self.session = session or get_session()
 
     def call_chat(
         self,
@@ -75,35 +232,29 @@ class OpenRouterClient:
         response_format: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
         headers = _auth_headers()
-        payload: Dict[str, Any] = {
-            "model": model,
-            "messages": messages,
-        }
-        if temperature is not None:
-            payload["temperature"] = temperature
-        if response_format is not None:
-            payload["response_format"] = response_format
+        payload = _build_payload(model, messages, temperature, response_format)
 
         last_err: Optional[Exception] = None
         for attempt in range(max_retries + 1):
             try:
-                resp = requests.post(
-                    self.base_url, headers=headers, json=payload, timeout=self.timeout
+                segments, length = encode_body(payload)
+                resp = self.session.post(
+                    self.base_url,
+                    headers=headers,
+                    data=_StreamingBody(segments, length),
+                    timeout=self.timeout,
                 )
                 if resp.status_code != 200:
                     raise OpenRouterError(
                         f"OpenRouter HTTP {resp.status_code}: {resp.text[:300]}"
                     )
-                data = resp.json()
-                content = data["choices"][0]["message"]["content"]
-                return {
-                    "raw": data,
-                    "content": content,
-                }
+                return _parse_chat_response(resp.json())
             except Exception as e:
                 last_err = e
+                metrics.incr("openrouter_errors_total", model=model, error=type(e).__name__)
                 if attempt < max_retries:
-                    time.sleep(0.8 * (attempt + 1))
+                    metrics.incr("openrouter_retries_total", model=model)
+                    time.sleep(_retry_delay(attempt))
                 else:
                     raise OpenRouterError(f"OpenRouter call failed: {e}") from e
         raise OpenRouterError(f"OpenRouter call failed: {last_err}")
@@ -125,11 +276,96 @@ class OpenRouterClient:
             temperature=temperature,
             response_format=response_format,
         )
-        content = out.get("content", "")
-        obj, raw = extract_json_from_text(content)
-        return {
-            "json": obj,
-            "text": None if obj is not None else content,
-            "raw": out.get("raw"),
-            "fallback_raw_text": raw,
-        }
+        return _parse_json_output(out)
+
+
+class AsyncOpenRouterClient:
+    """asyncio counterpart of ``OpenRouterClient`` built on aiohttp.
+
+    Uses the event loop's shared ``aiohttp.ClientSession`` unless one is
+    passed explicitly, so concurrent calls on one loop share connections.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OPENROUTER_BASE_URL,
+        timeout: int = REQUEST_TIMEOUT,
+        session: Optional[aiohttp.ClientSession] = None,
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.session = session
+
+    async def acall_chat(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        *,
+        max_retries: int = 2,
+        temperature: Optional[float] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        headers = _auth_headers()
+        payload = _build_payload(model, messages, temperature, response_format)
+        session = self.session or get_async_session()
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        last_err: Optional[Exception] = None
+        for attempt in range(max_retries + 1):
+            try:
+                segments, length = encode_body(payload)
+                async with session.post(
+                    self.base_url,
+                    headers={**headers, "Content-Length": str(length)},
+                    data=_aiter_body(segments),
+                    timeout=timeout,
+                ) as resp:
+                    if resp.status != 200:
+                        text = await resp.text()
+                        raise OpenRouterError(
+                            f"OpenRouter HTTP {resp.status}: {text[:300]}"
+                        )
+                    data = await resp.json(content_type=None)
+                return _parse_chat_response(data)
+            except Exception as e:
+                last_err = e
+                metrics.incr("openrouter_errors_total", model=model, error=type(e).__name__)
+                if attempt < max_retries:
+                    metrics.incr("openrouter_retries_total", model=model)
+                    await asyncio.sleep(_retry_delay(attempt))
+                else:
+                    raise OpenRouterError(f"OpenRouter call failed: {e}") from e
+        raise OpenRouterError(f"OpenRouter call failed: {last_err}")
+
+    async def acall_json(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        *,
+        max_retries: int = 2,
+        temperature: Optional[float] = None,
+        enforce_json_mode: bool = True,
+    ) -> Dict[str, Any]:
+        response_format = {"type": "json_object"} if enforce_json_mode else None
+        out = await self.acall_chat(
+            model,
+            messages,
+            max_retries=max_retries,
+            temperature=temperature,
+            response_format=response_format,
+        )
+        return _parse_json_output(out)
+
+
+_default_client: Optional[OpenRouterClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_openrouter_client() -> OpenRouterClient:
+    """Return the process-wide client backed by the shared connection pool."""
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = OpenRouterClient()
+    return _default_client
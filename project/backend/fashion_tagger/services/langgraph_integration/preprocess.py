@@ -0,0 +1,183 @@
+"""Downscale and re-encode images before they are sent to the vision model.
+
+Upload size, vision token count and latency all grow with resolution, so
+the downloaded bytes are normalised first: EXIF orientation applied, the
+longest edge capped at ``IMAGE_MAX_EDGE``, converted to RGB and re-encoded
+as JPEG or WebP at ``IMAGE_OUTPUT_QUALITY``.
+
+Decoding and encoding are CPU-bound, so they run in a small thread or
+process pool (``IMAGE_PREPROCESS_POOL``) rather than on the request
+thread or event loop.
+
+Metrics (``common.metrics``):
+
+- ``image_preprocess_images_total``: images processed
+- ``image_preprocess_bytes_in_total`` / ``image_preprocess_bytes_out_total``
+- ``image_preprocess_bytes_saved_total``: in minus out, summed per image
+"""
+
+import asyncio
+import io
+import logging
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+from common import metrics
+
+from .config import (
+    IMAGE_MAX_EDGE,
+    IMAGE_OUTPUT_FORMAT,
+    IMAGE_OUTPUT_QUALITY,
+    IMAGE_PREPROCESS_ENABLED,
+    IMAGE_PREPROCESS_POOL,
+    IMAGE_PREPROCESS_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+_EXIF_ORIENTATION = 0x0112
+
+_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    if img.mode == "RGB":
+        return img
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        # Flatten transparency onto white; black backgrounds confuse colour tags.
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def preprocess_image(
+    image: Union[bytes, BinaryIO],
+    max_edge: int = IMAGE_MAX_EDGE,
+    output_format: str = IMAGE_OUTPUT_FORMAT,
+    quality: int = IMAGE_OUTPUT_QUALITY,
+) -> Tuple[bytes, str]:
+    """Return ``(bytes, mime_type)`` of the normalised image.
+
+    ``image`` is the encoded image or a seekable file holding it; a file
+    is decoded in place, without first reading it into memory. The
+    original is kept when re-encoding would not make it smaller and the
+    image needed no resize or rotation.
+    """
+    pil_format, mime = _FORMATS[output_format]
+    source = io.BytesIO(image) if isinstance(image, (bytes, bytearray)) else image
+    with Image.open(source) as img:
+        source_format = img.format
+        # Decided before draft(), which can already shrink the image to max_edge.
+        resized = max(img.size) > max_edge
+        # Let the JPEG decoder drop resolution early (DCT scaling).
+        img.draft("RGB", (max_edge, max_edge))
+        rotated = img.getexif().get(_EXIF_ORIENTATION, 1) != 1
+        oriented = ImageOps.exif_transpose(img)
+        if max(oriented.size) > max_edge:
+            oriented.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        _to_rgb(oriented).save(out, format=pil_format, quality=quality, optimize=True)
+
+    encoded = out.getvalue()
+    if not (resized or rotated) and source_format == pil_format:
+        if len(encoded) >= source.seek(0, io.SEEK_END):
+            source.seek(0)
+            return (image if source is not image else source.read()), mime
+    return encoded, mime
+
+
+def _make_executor() -> Executor:
+    if IMAGE_PREPROCESS_POOL == "process":
+        return ProcessPoolExecutor(max_workers=IMAGE_PREPROCESS_WORKERS)
+    return ThreadPoolExecutor(
+        max_workers=IMAGE_PREPROCESS_WORKERS, thread_name_prefix="image-preprocess"
+    )
+
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> Executor:
+    """Return the process-wide preprocessing pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = _make_executor()
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _record(bytes_in: int, bytes_out: int) -> None:
+    metrics.incr("image_preprocess_images_total")
+    metrics.incr("image_preprocess_bytes_in_total", bytes_in)
+    metrics.incr("image_preprocess_bytes_out_total", bytes_out)
+    metrics.incr("image_preprocess_bytes_saved_total", bytes_in - bytes_out)
+    logger.debug("Preprocessed image: %d -> %d bytes", bytes_in, bytes_out)
+
+
+def preprocess_file(fileobj: BinaryIO, size: int) -> Tuple[bytes, str]:
+    """Preprocess an image held in a seekable file (e.g. an upload).
+
+    Runs on the calling thread: a process pool cannot receive the file.
+    """
+    processed = preprocess_image(fileobj)
+    _record(size, len(processed[0]))
+    return processed
+
+
+def _apply(state: Dict[str, Any], processed: Tuple[bytes, str]) -> Dict[str, Any]:
+    image_bytes, mime = processed
+    _record(len(state["image_bytes"]), len(image_bytes))
+    return {**state, "image_bytes": image_bytes, "image_mime": mime}
+
+
+def _skip(state: Dict[str, Any]) -> bool:
+    # Nothing downloaded (URL fallback), already done by the caller, or
+    # preprocessing switched off.
+    return (
+        not IMAGE_PREPROCESS_ENABLED
+        or not state.get("image_bytes")
+        or state.get("image_preprocessed", False)
+    )
+
+
+def preprocess_image_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace ``image_bytes`` with the downscaled, re-encoded image."""
+    if _skip(state):
+        return state
+    try:
+        processed = get_executor().submit(preprocess_image, state["image_bytes"]).result()
+    except Exception as e:
+        logger.warning("preprocess_image_node: keeping original bytes: %s", e)
+        return state
+    return _apply(state, processed)
+
+
+async def apreprocess_image_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of ``preprocess_image_node``; the loop stays free."""
+    if _skip(state):
+        return state
+    loop = asyncio.get_running_loop()
+    try:
+        processed = await loop.run_in_executor(get_executor(), preprocess_image, state["image_bytes"])
+    except Exception as e:
+        logger.warning("apreprocess_image_node: keeping original bytes: %s", e)
+        return state
+    return _apply(state, processed)
@@ -1,31 +1,104 @@
+import asyncio
+import hashlib
 import os
+import aiohttp
 import requests
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
+from common import metrics
+from common.utils import TTLCache
 
-def serpapi_search_node(state: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Reverse image search via SerpAPI (Google Reverse Image).
-    Cleans response: keeps only titles from image_results and organic_results.
-    """
+from .config import (
+    SERPAPI_BASE_URL,
+    SERPAPI_CACHE_ENABLED,
+    SERPAPI_CACHE_MAX_ENTRIES,
+    SERPAPI_CACHE_NEGATIVE_TTL,
+    SERPAPI_CACHE_TTL,
+)
+from .http_pool import get_async_session, get_session
+
+SERPAPI_TIMEOUT = 30
+
+# Cleaned results keyed by image URL and, when the bytes are known, by image
+# hash. Failed and skipped results are kept for SERPAPI_CACHE_NEGATIVE_TTL,
+# under the URL only, so a bad URL is not retried on every request.
+_cache = TTLCache(SERPAPI_CACHE_MAX_ENTRIES, SERPAPI_CACHE_TTL, name="serpapi")
 
+
+def _cache_keys(state: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """Return ``(url key, image hash key)``; either may be None."""
+    if not SERPAPI_CACHE_ENABLED:
+        return None, None
+    image_url = state.get("image_url")
+    image_bytes = state.get("image_bytes")
+    return (
+        "url:" + hashlib.sha256(str(image_url).encode("utf-8")).hexdigest() if image_url else None,
+        "sha256:" + hashlib.sha256(image_bytes).hexdigest() if image_bytes else None,
+    )
+
+
+def _cached(keys: Tuple[Optional[str], Optional[str]]) -> Optional[Dict[str, Any]]:
+    for key in keys:
+        entry = _cache.get(key) if key else None
+        if entry is not None:
+            result, searched = entry
+            metrics.incr("serpapi_cache_lookups_total", outcome="hit")
+            if searched:
+                metrics.incr("serpapi_quota_saved_total")
+            return result
+    if any(keys):
+        metrics.incr("serpapi_cache_lookups_total", outcome="miss")
+    return None
+
+
+def _remember(
+    keys: Tuple[Optional[str], Optional[str]], result: Dict[str, Any], searched: bool
+) -> None:
+    """Cache a result; ``searched`` marks results that cost a SerpAPI call."""
+    url_key, hash_key = keys
+    if result.get("status") == "ok":
+        for key in (url_key, hash_key):
+            if key:
+                _cache.set(key, (result, searched))
+    elif url_key:
+        _cache.set(url_key, (result, searched), ttl=SERPAPI_CACHE_NEGATIVE_TTL)
+
+
+def clear_cache() -> None:
+    _cache.clear()
+
+
+def cache_stats() -> Dict[str, float]:
+    """Return process-local cache hits, misses, evictions and SerpAPI calls saved."""
+    hits = metrics.get("serpapi_cache_lookups_total", outcome="hit")
+    misses = metrics.get("serpapi_cache_lookups_total", outcome="miss")
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+        "evictions": metrics.get("cache_evictions_total", cache="serpapi"),
+        "quota_saved": metrics.get("serpapi_quota_saved_total"),
+        "entries": len(_cache),
+    }
+
+
+def _prepare_search(state: Dict[str, Any]) -> Tuple[Optional[Dict[str, str]], Optional[Dict[str, Any]]]:
+    """Return ``(params, None)`` for a search, or ``(None, result)`` if it cannot run."""
     image_url = state.get("image_url")
 
     # SerpAPI needs a publicly reachable URL, not a data URI.
     if not image_url or str(image_url).startswith("data:"):
-        state["serpapi_results"] = {
+        return None, {
             "status": "skipped",
             "reason": "image_url is not a public URL (data URI received)",
         }
-        return state
 
     api_key = os.getenv("SERPAPI_API_KEY")
     if not api_key:
-        state["serpapi_results"] = {
+        return None, {
             "status": "failed",
             "error": "SERPAPI_API_KEY not set in environment",
         }
-        return state
 
     params = {
         "engine": "google_reverse_image",
@@ -34,44 +107,98 @@ def serpapi_search_node(state: Dict[str, Any]) -> Dict[str, Any]:
         "gl": "ir",   # country
         "hl": "fa",   # language
     }
+    return params, None
+
+
+def _clean_response(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Extract only titles
+    titles: List[str] = []
+
+    for r in data.get("image_results", []):
+        title = r.get("title")
+        if title:
+            # skip abadis/dictionary titles
+            if "آبادیس" in title or "abadis" in title.lower():
+                continue
+            titles.append(title)
+
+    for r in data.get("organic_results", []):
+        title = r.get("title")
+        if title:
+            # skip abadis/dictionary titles
+            if "آبادیس" in title or "abadis" in title.lower():
+                continue
+            titles.append(title)
+    limited_titles = titles[:5]
+    cleaned_text = "\n".join(limited_titles).strip()
+
+    return {
+        "status": "ok",
+        "titles": cleaned_text,
+        "count": len(titles),
+    }
+
+
+def serpapi_search_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reverse image search via SerpAPI (Google Reverse Image).
+    Cleans response: keeps only titles from image_results and organic_results.
+    """
+    keys = _cache_keys(state)
+    cached = _cached(keys)
+    if cached is not None:
+        state["serpapi_results"] = cached
+        return state
+
+    params, result = _prepare_search(state)
+    if params is None:
+        _remember(keys, result, searched=False)
+        state["serpapi_results"] = result
+        return state
 
     try:
-        resp = requests.get("https://serpapi.com/search.json", params=params, timeout=30)
+        resp = get_session().get(SERPAPI_BASE_URL, params=params, timeout=SERPAPI_TIMEOUT)
         resp.raise_for_status()
-        data = resp.json()
-
-        # Extract only titles
-        titles: List[str] = []
-
-        for r in data.get("image_results", []):
-            title = r.get("title")
-            if title:
-                # skip abadis/dictionary titles
-                if "آبادیس" in title or "abadis" in title.lower():
-                    continue
-                titles.append(title)
-
-        for r in data.get("organic_results", []):
-            title = r.get("title")
-            if title:
-                # skip abadis/dictionary titles
-                if "آبادیس" in title or "abadis" in title.lower():
-                    continue
-                titles.append(title)
-        limited_titles = titles[:5]
-        print(limited_titles)
-        cleaned_text = "\n".join(limited_titles).strip()
+        state["serpapi_results"] = _clean_response(resp.json())
 
+    except requests.RequestException as e:
         state["serpapi_results"] = {
-            "status": "ok",
-            "titles": cleaned_text,
-            "count": len(titles),
+            "status": "failed",
+            "error": str(e),
         }
 
-    except requests.RequestException as e:
+    _remember(keys, state["serpapi_results"], searched=True)
+    return state
+
+
+async def aserpapi_search_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of ``serpapi_search_node`` using the loop's aiohttp session."""
+    keys = _cache_keys(state)
+    cached = _cached(keys)
+    if cached is not None:
+        state["serpapi_results"] = cached
+        return state
+
+    params, result = _prepare_search(state)
+    if params is None:
+        _remember(keys, result, searched=False)
+        state["serpapi_results"] = result
+        return state
+
+    try:
+        timeout = aiohttp.ClientTimeout(total=SERPAPI_TIMEOUT)
+        async with get_async_session().get(
+            SERPAPI_BASE_URL, params=params, timeout=timeout
+        ) as resp:
+            resp.raise_for_status()
+            data = await resp.json(content_type=None)
+        state["serpapi_results"] = _clean_response(data)
+
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         state["serpapi_results"] = {
             "status": "failed",
-            "error": str(e),
+            "error": str(e) or type(e).__name__,
         }
 
+    _remember(keys, state["serpapi_results"], searched=True)
     return state
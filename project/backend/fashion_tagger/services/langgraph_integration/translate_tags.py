@@ -1,7 +1,34 @@
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, List, Optional, Protocol, Tuple
+
+from asgiref.sync import sync_to_async
+
+from common import metrics
 
 from .config import TRANSLATE_MODEL
-from .model_client import OpenRouterClient, make_text_part
+from .model_client import AsyncOpenRouterClient, get_openrouter_client, make_text_part
+
+
+class TranslationMemory(Protocol):
+    """Known English -> Persian tag translations.
+
+    Keys are ``(entity name, English value)``, lower-cased and stripped.
+    An empty value stands for the entity name itself.
+    """
+
+    def lookup(self, name: str, value: str) -> Optional[str]:
+        """Return the Persian text if it is known with enough confidence."""
+
+    def learn(self, pairs: Iterable[Tuple[str, str, str]]) -> None:
+        """Record ``(name, value, persian)`` triples seen in an LLM answer."""
+
+
+_memory: Optional[TranslationMemory] = None
+
+
+def set_translation_memory(memory: Optional[TranslationMemory]) -> None:
+    """Install the memory consulted before the translate call (None disables it)."""
+    global _memory
+    _memory = memory
 
 
 def build_translation_prompt(data: Dict[str, Any]) -> str:
@@ -16,43 +43,222 @@ def build_translation_prompt(data: Dict[str, Any]) -> str:
         "Rules:\n"
         "1. Identify the product type using VLM tags as the main evidence.\n"
         "2. Analyze the Persian titles to detect common or cultural terms used for this product.\n"
-        "3. Output only a clean Persian JSON object.\n\n"
+        "3. Output only a clean Persian JSON object.\n"
+        "4. For every input entity, set \"source\" to its English name and give its Persian values "
+        "in the same order as the English values.\n\n"
         f"{data}\n\n"
         "Example output format:\n"
         "{\n"
         '  "entities": [\n'
-        '    {"name": "", "values": ["","",...]},\n'
+        '    {"source": "", "name": "", "values": ["","",...]},\n'
         "  ]\n"
         "}\n\n"
         "Output (Persian JSON only):"
     )
 
-def translate_tags_node(state: Dict[str, Any]) -> Dict[str, Any]:
-    image_tags_en = state.get("image_tags_en")
+
+def _key(text: Any) -> str:
+    return str(text).strip().lower()
+
+
+def _entities(tags: Any) -> Optional[List[Tuple[str, List[str]]]]:
+    """Return ``[(name, values)]`` from a tags object, or None if it has no entity list."""
+    if not isinstance(tags, dict) or not isinstance(tags.get("entities"), list):
+        return None
+    entities = []
+    for entity in tags["entities"]:
+        if not isinstance(entity, dict) or not entity.get("name"):
+            return None
+        values = entity.get("values", [])
+        if not isinstance(values, list):
+            values = [values]
+        entities.append((str(entity["name"]), [str(v) for v in values]))
+    return entities
+
+
+def _plan(memory: TranslationMemory, entities: List[Tuple[str, List[str]]]):
+    """Split the English entities into locally known translations and what to ask for.
+
+    Returns ``(known, unknown_entities)`` where ``known`` maps keys to Persian
+    text and ``unknown_entities`` is the reduced ``image_tags_en`` to send.
+    """
+    known: Dict[Tuple[str, str], str] = {}
+    unknown_entities = []
+    hits = misses = 0
+    for name, values in entities:
+        name_fa = memory.lookup(_key(name), "")
+        if name_fa is not None:
+            known[(_key(name), "")] = name_fa
+        missing = []
+        for value in values:
+            value_fa = memory.lookup(_key(name), _key(value))
+            if value_fa is None:
+                missing.append(value)
+                misses += 1
+            else:
+                known[(_key(name), _key(value))] = value_fa
+                hits += 1
+        if name_fa is None and not missing:
+            missing = values  # give the model context to name the entity
+        if name_fa is None or missing:
+            unknown_entities.append({"name": name, "values": missing})
+    metrics.incr("translation_memory_lookups_total", hits, outcome="hit")
+    metrics.incr("translation_memory_lookups_total", misses, outcome="miss")
+    return known, unknown_entities
+
+
+def _learned_pairs(sent: List[Dict[str, Any]], answer: Any) -> List[Tuple[str, str, str]]:
+    """Pair the Persian answer with what was sent, where the model kept the order."""
+    answered = {}
+    if isinstance(answer, dict) and isinstance(answer.get("entities"), list):
+        for entity in answer["entities"]:
+            if isinstance(entity, dict) and entity.get("source"):
+                answered[_key(entity["source"])] = entity
+    pairs = []
+    for entity in sent:
+        name = _key(entity["name"])
+        reply = answered.get(name)
+        if reply is None:
+            continue
+        if reply.get("name"):
+            pairs.append((name, "", str(reply["name"])))
+        values_fa = reply.get("values")
+        if isinstance(values_fa, list) and len(values_fa) == len(entity["values"]):
+            pairs.extend(
+                (name, _key(value), str(value_fa))
+                for value, value_fa in zip(entity["values"], values_fa)
+                if value_fa
+            )
+    return pairs
+
+
+def _assemble(
+    entities: List[Tuple[str, List[str]]],
+    translations: Dict[Tuple[str, str], str],
+    answer: Any = None,
+) -> Dict[str, Any]:
+    """Build the Persian tags from known translations plus the model's answer."""
+    names = {_key(name) for name, _ in entities}
+    replies = {}
+    extra = []
+    if isinstance(answer, dict) and isinstance(answer.get("entities"), list):
+        for entity in answer["entities"]:
+            if not isinstance(entity, dict):
+                continue
+            source = _key(entity.get("source", ""))
+            if source in names:
+                replies[source] = entity
+            else:
+                extra.append(entity)
+
+    result = []
+    for name, values in entities:
+        key = _key(name)
+        reply = replies.get(key, {})
+        values_fa = [
+            translations[(key, _key(value))]
+            for value in values
+            if (key, _key(value)) in translations
+        ]
+        if len(values_fa) < len(values) and isinstance(reply.get("values"), list):
+            # The model did not keep the order; take its values as given.
+            values_fa.extend(v for v in reply["values"] if v and v not in values_fa)
+        result.append({
+            "name": translations.get((key, "")) or reply.get("name") or name,
+            "values": values_fa,
+        })
+    return {"entities": result + extra}
+
+
+def _build_messages(state: Dict[str, Any], image_tags_en: Any = None) -> List[Dict[str, Any]]:
+    image_tags_en = image_tags_en or state.get("image_tags_en")
     serpapi_results = state.get("serpapi_results", {})
 
     if not image_tags_en:
         raise ValueError("translate_tags_node: 'image_tags_en' is missing in state")
 
-    client = OpenRouterClient()
     combined_input = {
         "image_tags_en": image_tags_en,
         "serpapi_results": serpapi_results,
     }
     prompt = build_translation_prompt(combined_input)
 
-    messages = [
+    return [
         {
             "role": "user",
             "content": [make_text_part(prompt)],
         }
     ]
 
-    result = client.call_json(model=TRANSLATE_MODEL, messages=messages)
+
+def _prepare(state: Dict[str, Any]):
+    """Consult the memory before calling the model.
+
+    Returns ``(plan, image_tags_en to send)``; the second item is None when
+    every tag is already known. ``plan`` is None without a memory, or for
+    tags it cannot interpret, in which case the full tags are sent.
+    """
+    if not state.get("image_tags_en"):
+        raise ValueError("translate_tags_node: 'image_tags_en' is missing in state")
+    memory = _memory
+    entities = _entities(state.get("image_tags_en"))
+    if memory is None or entities is None:
+        return None, state.get("image_tags_en")
+    known, unknown_entities = _plan(memory, entities)
+    if not unknown_entities:
+        metrics.incr("translation_memory_llm_calls_avoided_total")
+        return (memory, entities, known, []), None
+    return (memory, entities, known, unknown_entities), {"entities": unknown_entities}
+
+
+def _finish(state: Dict[str, Any], plan, result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if plan is None:
+        return _apply_result(state, result)
+    memory, entities, known, sent = plan
+    if result is None:
+        return _apply_result(state, {"json": _assemble(entities, known), "text": None})
+    pairs = _learned_pairs(sent, result["json"])
+    memory.learn(pairs)
+    translations = {**known, **{(name, value): fa for name, value, fa in pairs}}
+    return _apply_result(state, {**result, "json": _assemble(entities, translations, result["json"])})
+
+
+def _apply_result(state: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
     image_tags_fa = result["json"] or {}
+    if isinstance(image_tags_fa.get("entities"), list):
+        image_tags_fa = {
+            **image_tags_fa,
+            "entities": [
+                {k: v for k, v in entity.items() if k != "source"} if isinstance(entity, dict) else entity
+                for entity in image_tags_fa["entities"]
+            ],
+        }
 
     return {
         **state,
         "image_tags_fa": image_tags_fa,
         "translation_raw": result.get("text"),
     }
+
+
+def translate_tags_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    plan, image_tags_en = _prepare(state)
+    result = None
+    if image_tags_en is not None:
+        messages = _build_messages(state, image_tags_en)
+        client = get_openrouter_client()
+        result = client.call_json(model=TRANSLATE_MODEL, messages=messages)
+        metrics.incr("translation_llm_calls_total")
+    return _finish(state, plan, result)
+
+
+async def atranslate_tags_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    # The memory may hit the database, which Django forbids on the event loop.
+    plan, image_tags_en = await sync_to_async(_prepare)(state)
+    result = None
+    if image_tags_en is not None:
+        messages = _build_messages(state, image_tags_en)
+        client = AsyncOpenRouterClient()
+        result = await client.acall_json(model=TRANSLATE_MODEL, messages=messages)
+        metrics.incr("translation_llm_calls_total")
+    return await sync_to_async(_finish)(state, plan, result)
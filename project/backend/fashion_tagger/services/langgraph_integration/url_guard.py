@@ -0,0 +1,129 @@
+"""Checks on client-supplied URLs the server connects to.
+
+Image URLs and webhook callback URLs come from API clients. Before each
+connection the URL must be http(s) and every address its host resolves to
+must be public, so clients cannot reach private, loopback, link-local or
+reserved addresses (internal services, cloud metadata) through the server.
+Callers do not let the HTTP client follow redirects; they check each
+``Location`` here before following it.
+
+``check_url`` alone leaves a gap: the HTTP client resolves the host again
+when it connects, and a short-TTL DNS record can answer a private address
+the second time (DNS rebinding). Sessions for client URLs therefore use
+``GuardedHTTPConnection``/``GuardedHTTPSConnection`` (requests) or
+``GuardedResolver`` (aiohttp), which check the addresses resolved for the
+connection itself and connect only to those.
+
+``OUTBOUND_ALLOW_PRIVATE_HOSTS`` skips the address check, for development
+against services on localhost.
+"""
+
+import asyncio
+import ipaddress
+import socket
+from typing import Iterable, List, Tuple
+from urllib.parse import urlsplit
+
+from aiohttp.abc import ResolveResult
+from aiohttp.resolver import ThreadedResolver
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.exceptions import NameResolutionError
+
+from .config import OUTBOUND_ALLOW_PRIVATE_HOSTS
+
+ALLOWED_SCHEMES = ("http", "https")
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class UnsafeURLError(ValueError):
+    """The URL's scheme or resolved address may not be connected to."""
+
+
+def _host_port(url: str) -> Tuple[str, int]:
+    parts = urlsplit(url)
+    if parts.scheme not in ALLOWED_SCHEMES:
+        raise UnsafeURLError(f"Unsupported URL scheme in {url}")
+    try:
+        port = parts.port
+    except ValueError as e:
+        raise UnsafeURLError(f"Invalid port in {url}") from e
+    if not parts.hostname:
+        raise UnsafeURLError(f"No host in {url}")
+    return parts.hostname, port or (443 if parts.scheme == "https" else 80)
+
+
+def is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])  # drop an IPv6 zone id
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    # is_global is False for private, loopback, link-local, shared and unspecified ranges.
+    return ip.is_global and not (ip.is_multicast or ip.is_reserved)
+
+
+def _check_addresses(url: str, infos: Iterable[tuple]) -> None:
+    for info in infos:
+        address = info[4][0]
+        if not is_public_address(address):
+            raise UnsafeURLError(f"{url} resolves to non-public address {address}")
+
+
+def check_url(url: str) -> None:
+    """Raise ``UnsafeURLError`` unless ``url`` may be connected to.
+
+    Raises ``OSError`` when the host does not resolve.
+    """
+    host, port = _host_port(url)
+    if not OUTBOUND_ALLOW_PRIVATE_HOSTS:
+        _check_addresses(url, socket.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+
+
+async def acheck_url(url: str) -> None:
+    """Async variant of ``check_url``; resolves without blocking the loop."""
+    host, port = _host_port(url)
+    if not OUTBOUND_ALLOW_PRIVATE_HOSTS:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        _check_addresses(url, infos)
+
+
+class _PinnedConnectionMixin:
+    """Resolve and check the host at connect time, then connect to that address."""
+
+    def _new_conn(self):
+        try:
+            infos = socket.getaddrinfo(self._dns_host, self.port, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        if not OUTBOUND_ALLOW_PRIVATE_HOSTS:
+            _check_addresses(f"{self.host}:{self.port}", infos)
+        # urllib3 connects to _dns_host; TLS SNI and certificate checks use self.host.
+        dns_host, self._dns_host = self._dns_host, infos[0][4][0]
+        try:
+            return super()._new_conn()
+        finally:
+            self._dns_host = dns_host
+
+
+class GuardedHTTPConnection(_PinnedConnectionMixin, HTTPConnection):
+    pass
+
+
+class GuardedHTTPSConnection(_PinnedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class GuardedResolver(ThreadedResolver):
+    """aiohttp resolver that refuses hosts resolving to non-public addresses.
+
+    aiohttp connects to the addresses returned here. IP literals bypass the
+    resolver, so callers still run ``acheck_url`` first.
+    """
+
+    async def resolve(
+        self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET
+    ) -> List[ResolveResult]:
+        results = await super().resolve(host, port, family)
+        if not OUTBOUND_ALLOW_PRIVATE_HOSTS:
+            for result in results:
+                if not is_public_address(result["host"]):
+                    raise UnsafeURLError(f"{host}:{port} resolves to non-public address {result['host']}")
+        return results
@@ -0,0 +1,239 @@
+"""Near-duplicate image detection with perceptual hashes.
+
+A re-encoded, resized or re-hosted copy of a product photo has different
+bytes (so the result store misses it) but an almost identical 64-bit
+perceptual hash. Fingerprints of tagged images are kept in a multi-index
+hash table: the hash is split into ``max_distance + 1`` chunks, and by the
+pigeonhole principle any hash within ``max_distance`` bits matches at
+least one chunk exactly. A lookup therefore checks a few small buckets
+instead of every stored hash.
+
+The hashes are computed on grayscale thumbnails, so a product photographed
+in another colour hashes the same. Each fingerprint therefore also carries
+a coarse colour histogram, and a hash match is only returned when the
+histograms differ by at most ``TAGGING_NEAR_DUPLICATE_MAX_COLOR_DISTANCE``
+(the share of pixels that fall in a different colour bin).
+
+The in-process index is loaded from ``ImageFingerprint`` rows on first
+use and picks up rows written by other workers every
+``TAGGING_NEAR_DUPLICATE_REFRESH`` seconds.
+"""
+
+import io
+import logging
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from PIL import Image, UnidentifiedImageError
+
+from common import metrics
+from fashion_tagger.models import ImageFingerprint
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+_DCT_SIZE = 32
+# Colour histogram: 4 levels per RGB channel, 64 bins summing to about 255.
+_COLOR_LEVELS = 4
+_COLOR_SIZE = (32, 32)
+
+
+class Fingerprint(NamedTuple):
+    hash: int
+    colors: bytes
+
+
+def _load_grayscale(image_bytes: bytes, size: Tuple[int, int]) -> np.ndarray:
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img.draft("L", (size[0] * 4, size[1] * 4))  # cheap JPEG downscale on decode
+        small = img.convert("L").resize(size, Image.Resampling.LANCZOS)
+    return np.asarray(small, dtype=np.float32)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+
+def dhash(image_bytes: bytes) -> int:
+    """64-bit difference hash: sign of horizontal gradients on a 9x8 thumbnail."""
+    pixels = _load_grayscale(image_bytes, (9, 8))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def phash(image_bytes: bytes) -> int:
+    """64-bit DCT hash: low-frequency 8x8 coefficients above their median."""
+    pixels = _load_grayscale(image_bytes, (_DCT_SIZE, _DCT_SIZE))
+    low = (_DCT @ pixels @ _DCT.T)[:8, :8].ravel()
+    return _bits_to_int(low > np.median(low[1:]))
+
+
+def color_histogram(image_bytes: bytes) -> bytes:
+    """Coarse RGB histogram of a thumbnail, one byte per bin."""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img.draft("RGB", (_COLOR_SIZE[0] * 2, _COLOR_SIZE[1] * 2))
+        small = np.asarray(img.convert("RGB").resize(_COLOR_SIZE, Image.Resampling.BILINEAR), dtype=np.uint16)
+    levels = (small * _COLOR_LEVELS) >> 8
+    bins = (levels[..., 0] * _COLOR_LEVELS + levels[..., 1]) * _COLOR_LEVELS + levels[..., 2]
+    counts = np.bincount(bins.ravel(), minlength=_COLOR_LEVELS ** 3)
+    return np.rint(counts * 255 / counts.sum()).astype(np.uint8).tobytes()
+
+
+def color_distance(a: bytes, b: bytes) -> float:
+    """Share of pixels (0..1) in a different colour bin."""
+    diff = np.abs(np.frombuffer(a, dtype=np.uint8).astype(np.int16) - np.frombuffer(b, dtype=np.uint8))
+    return float(diff.sum()) / (2 * 255)
+
+
+_ALGORITHMS = {"dhash": dhash, "phash": phash}
+
+
+def fingerprint(image_bytes: bytes) -> Optional[Fingerprint]:
+    """Perceptual hash and colour histogram of the image, or None if it cannot be decoded."""
+    try:
+        return Fingerprint(
+            _ALGORITHMS[settings.TAGGING_NEAR_DUPLICATE_ALGORITHM](image_bytes), color_histogram(image_bytes)
+        )
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        logger.debug("Cannot fingerprint image: %s", e)
+        return None
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHashIndex:
+    """Sub-linear Hamming-radius search over 64-bit hashes."""
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        chunks = max_distance + 1
+        widths = [HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0) for i in range(chunks)]
+        self._slices: List[Tuple[int, int]] = []
+        shift = HASH_BITS
+        for width in widths:
+            shift -= width
+            self._slices.append((shift, (1 << width) - 1))
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in widths]
+        self._hashes: List[int] = []
+        self._values: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, hash_value: int, value: str) -> None:
+        slot = len(self._hashes)
+        self._hashes.append(hash_value)
+        self._values.append(value)
+        for table, (shift, mask) in zip(self._tables, self._slices):
+            table.setdefault((hash_value >> shift) & mask, []).append(slot)
+
+    def search(self, hash_value: int, max_distance: Optional[int] = None) -> List[Tuple[int, str]]:
+        """Return ``(distance, value)`` pairs within the radius, nearest first."""
+        radius = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        seen = set()
+        matches = []
+        for table, (shift, mask) in zip(self._tables, self._slices):
+            for slot in table.get((hash_value >> shift) & mask, ()):
+                if slot in seen:
+                    continue
+                seen.add(slot)
+                distance = hamming(hash_value, self._hashes[slot])
+                if distance <= radius:
+                    matches.append((distance, self._values[slot]))
+        matches.sort()
+        return matches
+
+
+def _to_signed(value: int) -> int:
+    """Store unsigned 64-bit hashes in a signed BigIntegerField."""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+_index: Optional[MultiIndexHashIndex] = None
+_last_loaded_id = 0
+_last_refresh = 0.0
+_added_since_refresh: set = set()  # row ids already indexed by remember()
+_colors: Dict[str, bytes] = {}  # image hash -> colour histogram; rows from before histograms have none
+_index_lock = threading.Lock()
+
+
+def _get_index() -> MultiIndexHashIndex:
+    """Return the process index, loading rows added since the last refresh."""
+    global _index, _last_loaded_id, _last_refresh
+    with _index_lock:
+        if _index is None:
+            _index = MultiIndexHashIndex(settings.TAGGING_NEAR_DUPLICATE_MAX_DISTANCE)
+        if time.monotonic() - _last_refresh >= settings.TAGGING_NEAR_DUPLICATE_REFRESH:
+            rows = (
+                ImageFingerprint.objects
+                .filter(id__gt=_last_loaded_id)
+                .order_by("id")
+                .values_list("id", "perceptual_hash", "image_hash", "color_histogram")
+            )
+            for row_id, perceptual_hash, image_hash, colors in rows.iterator(chunk_size=10000):
+                if row_id not in _added_since_refresh:
+                    _index.add(_to_unsigned(perceptual_hash), image_hash)
+                    if colors is not None:
+                        _colors[image_hash] = bytes(colors)
+                _last_loaded_id = row_id
+            _added_since_refresh.clear()
+            _last_refresh = time.monotonic()
+        return _index
+
+
+def is_enabled() -> bool:
+    return settings.TAGGING_NEAR_DUPLICATE_ENABLED
+
+
+def find_match(fp: Fingerprint) -> Optional[str]:
+    """Return the image hash of the nearest known near-duplicate, if any.
+
+    Hash matches whose colours differ (or are unknown) are skipped.
+    """
+    matches = _get_index().search(fp.hash)
+    for _, image_hash in matches:
+        colors = _colors.get(image_hash)
+        if colors is not None and color_distance(fp.colors, colors) <= settings.TAGGING_NEAR_DUPLICATE_MAX_COLOR_DISTANCE:
+            metrics.incr("tagging_near_duplicate_hits_total")
+            return image_hash
+    if matches:
+        metrics.incr("tagging_near_duplicate_color_rejects_total")
+    metrics.incr("tagging_near_duplicate_misses_total")
+    return None
+
+
+def remember(image_hash: str, fp: Fingerprint) -> None:
+    """Add a tagged image's fingerprint to the index and persist it."""
+    try:
+        # A savepoint, so a duplicate does not break the caller's transaction.
+        with transaction.atomic():
+            row = ImageFingerprint.objects.create(
+                image_hash=image_hash, perceptual_hash=_to_signed(fp.hash), color_histogram=fp.colors
+            )
+    except IntegrityError:
+        return
+    with _index_lock:
+        if _index is not None and row.id > _last_loaded_id:
+            _index.add(fp.hash, image_hash)
+            _colors[image_hash] = fp.colors
+            _added_since_refresh.add(row.id)
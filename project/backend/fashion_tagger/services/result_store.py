@@ -0,0 +1,113 @@
+"""Content-addressed store of tagging results.
+
+Results are keyed by the SHA-256 of the image bytes plus the pipeline
+version (see ``pipeline_version()``), so the same picture served from
+different URLs shares one entry, and changing a model or prompt starts a
+fresh namespace without touching old rows.
+"""
+
+import hashlib
+import logging
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from common import metrics
+from fashion_tagger.models import TaggingResult
+from .langgraph_integration.langgraph_service import pipeline_version
+
+logger = logging.getLogger(__name__)
+
+
+def compute_image_hash(image_bytes: bytes) -> str:
+    """Return the SHA-256 hex digest of the image bytes."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def is_enabled() -> bool:
+    return settings.TAGGING_RESULT_STORE_ENABLED
+
+
+def get_result(image_hash: str, version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Return the stored result for an image, or None on a miss or expiry."""
+    version = version or pipeline_version()
+    now = timezone.now()
+    entry = (
+        TaggingResult.objects
+        .filter(image_hash=image_hash, pipeline_version=version)
+        .only("id", "result", "expires_at")
+        .first()
+    )
+    if entry is None or (entry.expires_at is not None and entry.expires_at <= now):
+        metrics.incr("tagging_result_store_misses_total")
+        return None
+
+    TaggingResult.objects.filter(pk=entry.pk).update(
+        hit_count=F("hit_count") + 1, last_hit_at=now
+    )
+    metrics.incr("tagging_result_store_hits_total")
+    return entry.result
+
+
+def store_result(
+    image_hash: str,
+    result: Dict[str, Any],
+    version: Optional[str] = None,
+    ttl: Optional[int] = None,
+) -> None:
+    """Save (or refresh) the result for an image.
+
+    ``ttl`` defaults to ``settings.TAGGING_RESULT_TTL`` seconds; 0 keeps the
+    entry until it is invalidated explicitly.
+    """
+    version = version or pipeline_version()
+    ttl = settings.TAGGING_RESULT_TTL if ttl is None else ttl
+    expires_at = timezone.now() + timedelta(seconds=ttl) if ttl > 0 else None
+    try:
+        TaggingResult.objects.update_or_create(
+            image_hash=image_hash,
+            pipeline_version=version,
+            defaults={"result": result, "expires_at": expires_at},
+        )
+    except IntegrityError:
+        # A concurrent request stored the same image first; keep theirs.
+        logger.debug("Tagging result for %s already stored", image_hash)
+
+
+def invalidate(image_hash: Optional[str] = None, pipeline_version: Optional[str] = None) -> int:
+    """Delete stored results and return how many were removed.
+
+    Filter by image, by pipeline version, or both. Without arguments every
+    stored result is removed.
+    """
+    qs = TaggingResult.objects.all()
+    if image_hash is not None:
+        qs = qs.filter(image_hash=image_hash)
+    if pipeline_version is not None:
+        qs = qs.filter(pipeline_version=pipeline_version)
+    deleted, _ = qs.delete()
+    return deleted
+
+
+def purge_expired() -> int:
+    """Delete expired results and return how many were removed."""
+    deleted, _ = TaggingResult.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def stats() -> Dict[str, Any]:
+    """Return process-local hit/miss counters and the stored entry count."""
+    hits = metrics.total("tagging_result_store_hits_total")
+    misses = metrics.total("tagging_result_store_misses_total")
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / lookups if lookups else 0.0,
+        "entries": TaggingResult.objects.filter(pipeline_version=pipeline_version()).count(),
+        "pipeline_version": pipeline_version(),
+    }
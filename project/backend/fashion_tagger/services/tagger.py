@@ -2,16 +2,327 @@
 
 Provides the public API for image analysis using the LangGraph pipeline.
 This function returns raw LangGraph output without modification.
+
+Results are looked up in the URL cache (``url_cache``) and the
+content-addressed result store (``result_store``) first, so a repeated
+image skips the pipeline entirely. On a miss, the bytes downloaded for
+the lookup are handed to the pipeline so the image is fetched only once.
 """
 
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, AsyncIterator, Iterator, List, NamedTuple, Optional, Tuple
+import asyncio
 import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.db import connection
 
-from .langgraph_integration.langgraph_service import run_langgraph_on_url
+from common import metrics
+from fashion_tagger.models import ImageURLCache
+from . import near_duplicates, result_store, url_cache
+from .langgraph_integration import preprocess
+from .langgraph_integration.config import IMAGE_PREPROCESS_ENABLED
+from .langgraph_integration.image_fetch import (
+    FetchedImage,
+    ImageFetchError,
+    ImageRejectedError,
+    afetch_image,
+    fetch_image,
+)
+from .langgraph_integration.langgraph_service import (
+    arun_langgraph_on_bytes,
+    arun_langgraph_on_url,
+    astream_langgraph_on_url,
+    run_langgraph_on_bytes,
+    run_langgraph_on_url,
+    stream_langgraph_on_url,
+)
 
 logger = logging.getLogger(__name__)
 
 
+def _is_complete(result: Dict[str, Any]) -> bool:
+    return bool(result.get("english")) and bool(result.get("persian"))
+
+
+def _lookup_fresh(image_url: str) -> Tuple[Optional[ImageURLCache], Optional[Dict[str, Any]]]:
+    """Return the URL cache entry and, if it is fresh, its stored result."""
+    entry = url_cache.get_entry(image_url)
+    if url_cache.is_fresh(entry):
+        metrics.incr("tagging_url_cache_fresh_hits_total")
+        return entry, result_store.get_result(entry.image_hash)
+    return entry, None
+
+
+def _lookup_stale(entry: Optional[ImageURLCache]) -> Optional[Dict[str, Any]]:
+    """Result to serve when the origin is unreachable, if still acceptable."""
+    if url_cache.is_servable_stale(entry):
+        metrics.incr("tagging_url_cache_stale_served_total")
+        return result_store.get_result(entry.image_hash)
+    return None
+
+
+def _lookup_near_duplicate(
+    image_hash: str, image_bytes: bytes
+) -> Tuple[Optional[near_duplicates.Fingerprint], Optional[Dict[str, Any]]]:
+    """Reuse the result of a visually identical image, if one is known.
+
+    Returns the image's fingerprint (None if it cannot be computed) and
+    the reused result. A reused result is also stored under ``image_hash``.
+    """
+    if not near_duplicates.is_enabled():
+        return None, None
+    fingerprint = near_duplicates.fingerprint(image_bytes)
+    if fingerprint is None:
+        return None, None
+    match = near_duplicates.find_match(fingerprint)
+    cached = result_store.get_result(match) if match else None
+    if cached is not None:
+        result_store.store_result(image_hash, cached)
+        near_duplicates.remember(image_hash, fingerprint)
+    return fingerprint, cached
+
+
+def _lookup_fetched(
+    image_url: str, entry: Optional[ImageURLCache], fetched: FetchedImage
+) -> Tuple[str, Optional[near_duplicates.Fingerprint], Optional[Dict[str, Any]]]:
+    """Update the URL cache after a fetch and look the content up.
+
+    Returns the image hash, its fingerprint (if computed) and any
+    stored result for the image or a near-duplicate of it.
+    """
+    if fetched.not_modified:
+        url_cache.mark_validated(entry)
+        return entry.image_hash, None, result_store.get_result(entry.image_hash)
+
+    image_hash = result_store.compute_image_hash(fetched.content)
+    url_cache.save(image_url, image_hash, fetched)
+    cached = result_store.get_result(image_hash)
+    if cached is not None:
+        return image_hash, None, cached
+    fingerprint, cached = _lookup_near_duplicate(image_hash, fetched.content)
+    return image_hash, fingerprint, cached
+
+
+class _Miss(NamedTuple):
+    """What a cache miss hands to the pipeline and then to ``_store``."""
+    image_hash: Optional[str]  # None when the origin was unreachable: do not store
+    fingerprint: Optional[near_duplicates.Fingerprint]
+    fetched: Optional[FetchedImage]
+    fetch_failed: bool = False  # the origin is unreachable; the graph should not retry it
+
+
+_UNCACHEABLE = _Miss(None, None, None)
+_FETCH_FAILED = _Miss(None, None, None, fetch_failed=True)
+
+
+def _lookup(image_url: str) -> Tuple[Optional[Dict[str, Any]], _Miss]:
+    """Return a stored result for the URL, or what the pipeline needs instead."""
+    entry, cached = _lookup_fresh(image_url)
+    if cached is not None:
+        return cached, _UNCACHEABLE
+
+    try:
+        fetched = fetch_image(image_url, **url_cache.conditional_headers(entry))
+    except ImageRejectedError:
+        raise
+    except ImageFetchError as e:
+        logger.warning("Could not fetch %s for caching: %s", image_url, e)
+        return _lookup_stale(entry), _FETCH_FAILED
+
+    image_hash, fingerprint, cached = _lookup_fetched(image_url, entry, fetched)
+    return cached, _Miss(image_hash, fingerprint, fetched)
+
+
+async def _alookup(image_url: str) -> Tuple[Optional[Dict[str, Any]], _Miss]:
+    """Async variant of ``_lookup``."""
+    entry, cached = await sync_to_async(_lookup_fresh)(image_url)
+    if cached is not None:
+        return cached, _UNCACHEABLE
+
+    try:
+        fetched = await afetch_image(image_url, **url_cache.conditional_headers(entry))
+    except ImageRejectedError:
+        raise
+    except ImageFetchError as e:
+        logger.warning("Could not fetch %s for caching: %s", image_url, e)
+        return await sync_to_async(_lookup_stale)(entry), _FETCH_FAILED
+
+    image_hash, fingerprint, cached = await sync_to_async(_lookup_fetched)(image_url, entry, fetched)
+    return cached, _Miss(image_hash, fingerprint, fetched)
+
+
+def _pipeline_input(miss: _Miss) -> Tuple[Optional[bytes], Optional[str], bool]:
+    """Bytes already downloaded for the lookup, so the graph skips its fetch.
+
+    The last item is True when the lookup's download failed, so the graph
+    passes the URL to the model instead of trying the origin again.
+    """
+    if miss.fetched is None or not miss.fetched.content:
+        return None, None, miss.fetch_failed
+    return miss.fetched.content, miss.fetched.content_type, False
+
+
+def _store(miss: _Miss, result: Dict[str, Any]) -> None:
+    if miss.image_hash is None or not _is_complete(result):
+        return
+    result_store.store_result(miss.image_hash, result)
+    if miss.fingerprint is not None:
+        near_duplicates.remember(miss.image_hash, miss.fingerprint)
+
+
+def tag_image(image_url: str) -> Dict[str, Any]:
+    """Tag an image, reusing stored results where possible.
+    
+    Unchanged URLs are answered from the URL cache (revalidated with a
+    conditional GET once stale); otherwise identical image bytes are
+    answered from the result store, and visually identical images from
+    the near-duplicate index. Unlike ``generate_tags`` this raises on
+    pipeline errors.
+    """
+    if not result_store.is_enabled():
+        return run_langgraph_on_url(image_url)
+
+    cached, miss = _lookup(image_url)
+    if cached is not None:
+        return cached
+
+    result = run_langgraph_on_url(image_url, *_pipeline_input(miss))
+
+    _store(miss, result)
+    return result
+
+
+async def atag_image(image_url: str) -> Dict[str, Any]:
+    """Async variant of ``tag_image``."""
+    if not result_store.is_enabled():
+        return await arun_langgraph_on_url(image_url)
+
+    cached, miss = await _alookup(image_url)
+    if cached is not None:
+        return cached
+
+    result = await arun_langgraph_on_url(image_url, *_pipeline_input(miss))
+
+    await sync_to_async(_store)(miss, result)
+    return result
+
+
+def _upload_input(upload) -> Tuple[bytes, Optional[str], bool]:
+    """Pipeline input for an upload: ``(bytes, mime, preprocessed)``.
+
+    The image is decoded straight from the spooled upload file, so only
+    the downscaled re-encode is ever held in memory as bytes.
+    """
+    if IMAGE_PREPROCESS_ENABLED:
+        try:
+            image_bytes, mime = preprocess.preprocess_file(upload.file, upload.size)
+            return image_bytes, mime, True
+        except Exception as e:
+            logger.warning("Could not preprocess upload %s, sending it as is: %s", upload.name, e)
+    upload.file.seek(0)
+    return upload.file.read(), None, False
+
+
+def tag_upload(upload) -> Dict[str, Any]:
+    """Tag an uploaded image (a ``HashedUploadedFile``).
+
+    Uses the result store keyed by the upload's SHA-256, so the same
+    picture sent by URL or by upload shares one entry, then the
+    near-duplicate index. Raises on pipeline errors.
+    """
+    if not result_store.is_enabled():
+        return run_langgraph_on_bytes(*_upload_input(upload))
+
+    cached = result_store.get_result(upload.sha256)
+    if cached is not None:
+        return cached
+
+    pipeline_input = _upload_input(upload)
+    # The perceptual hash survives the downscale, so hash the small copy.
+    fingerprint, cached = _lookup_near_duplicate(upload.sha256, pipeline_input[0])
+    if cached is not None:
+        return cached
+
+    result = run_langgraph_on_bytes(*pipeline_input)
+
+    _store(_Miss(upload.sha256, fingerprint, None), result)
+    return result
+
+
+async def atag_upload(upload) -> Dict[str, Any]:
+    """Async variant of ``tag_upload``; preprocessing runs off the event loop."""
+    prepare = sync_to_async(_upload_input, thread_sensitive=False)
+    if not result_store.is_enabled():
+        return await arun_langgraph_on_bytes(*await prepare(upload))
+
+    cached = await sync_to_async(result_store.get_result)(upload.sha256)
+    if cached is not None:
+        return cached
+
+    pipeline_input = await prepare(upload)
+    fingerprint, cached = await sync_to_async(_lookup_near_duplicate)(upload.sha256, pipeline_input[0])
+    if cached is not None:
+        return cached
+
+    result = await arun_langgraph_on_bytes(*pipeline_input)
+
+    await sync_to_async(_store)(_Miss(upload.sha256, fingerprint, None), result)
+    return result
+
+
+def _cached_events(cached: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    return [
+        ("english", cached.get("english", {})),
+        ("persian", cached.get("persian", {})),
+        ("result", cached),
+    ]
+
+
+def stream_tags(image_url: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Tag an image, yielding ``(event, data)`` as the pipeline progresses.
+    
+    Events are ``english``, ``serpapi`` and ``persian`` as the matching
+    graph nodes finish, then ``result`` with the same output as
+    ``tag_image``. A stored result is replayed as ``english``, ``persian``
+    and ``result`` straight away. Raises on pipeline errors.
+    """
+    miss = _UNCACHEABLE
+    if result_store.is_enabled():
+        cached, miss = _lookup(image_url)
+        if cached is not None:
+            yield from _cached_events(cached)
+            return
+
+    result: Dict[str, Any] = {}
+    for event, data in stream_langgraph_on_url(image_url, *_pipeline_input(miss)):
+        if event == "result":
+            result = data
+        yield event, data
+
+    _store(miss, result)
+
+
+async def astream_tags(image_url: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Async variant of ``stream_tags``."""
+    miss = _UNCACHEABLE
+    if result_store.is_enabled():
+        cached, miss = await _alookup(image_url)
+        if cached is not None:
+            for event, data in _cached_events(cached):
+                yield event, data
+            return
+
+    result: Dict[str, Any] = {}
+    async for event, data in astream_langgraph_on_url(image_url, *_pipeline_input(miss)):
+        if event == "result":
+            result = data
+        yield event, data
+
+    await sync_to_async(_store)(miss, result)
+
+
 def generate_tags(image_url: str) -> Dict[str, Any]:
     """Generate tags for an image using the LangGraph pipeline.
     
@@ -30,7 +341,7 @@ def generate_tags(image_url: str) -> Dict[str, Any]:
         Raw LangGraph output as-is. On any exception, returns an empty dict {}.
     """
     try:
-        result = run_langgraph_on_url(image_url)
+        result = tag_image(image_url)
         return result
     except Exception as e:
         logger.error(
@@ -40,3 +351,105 @@ def generate_tags(image_url: str) -> Dict[str, Any]:
             exc_info=True,
         )
         return {}
+
+
+async def agenerate_tags(image_url: str) -> Dict[str, Any]:
+    """Async variant of ``generate_tags`` running the asyncio pipeline.
+    
+    Returns:
+        Raw LangGraph output as-is. On any exception, returns an empty dict {}.
+    """
+    try:
+        result = await atag_image(image_url)
+        return result
+    except Exception as e:
+        logger.error(
+            "Error while generating tags for %s: %s",
+            image_url,
+            str(e),
+            exc_info=True,
+        )
+        return {}
+
+
+def generate_upload_tags(upload) -> Dict[str, Any]:
+    """Like ``generate_tags`` for an uploaded file; returns {} on any exception."""
+    try:
+        return tag_upload(upload)
+    except Exception as e:
+        logger.error("Error while generating tags for upload %s: %s", upload.name, e, exc_info=True)
+        return {}
+
+
+async def agenerate_upload_tags(upload) -> Dict[str, Any]:
+    """Async variant of ``generate_upload_tags``."""
+    try:
+        return await atag_upload(upload)
+    except Exception as e:
+        logger.error("Error while generating tags for upload %s: %s", upload.name, e, exc_info=True)
+        return {}
+
+
+def _batch_item(image_url: str) -> Dict[str, Any]:
+    """Tag one batch item, turning failures into an error entry."""
+    try:
+        return {"image_url": image_url, "tags": tag_image(image_url)}
+    except ImageFetchError as e:
+        logger.warning("Could not fetch batch item %s: %s", image_url, e)
+        return {"image_url": image_url, "error": e.public_message}
+    except Exception as e:
+        logger.error("Error while tagging batch item %s: %s", image_url, e, exc_info=True)
+        return {"image_url": image_url, "error": "Tagging failed."}
+
+
+async def _abatch_item(image_url: str) -> Dict[str, Any]:
+    try:
+        return {"image_url": image_url, "tags": await atag_image(image_url)}
+    except ImageFetchError as e:
+        logger.warning("Could not fetch batch item %s: %s", image_url, e)
+        return {"image_url": image_url, "error": e.public_message}
+    except Exception as e:
+        logger.error("Error while tagging batch item %s: %s", image_url, e, exc_info=True)
+        return {"image_url": image_url, "error": "Tagging failed."}
+
+
+def tag_batch(image_urls: List[str], concurrency: int) -> List[Dict[str, Any]]:
+    """Tag several images with at most ``concurrency`` pipelines in flight.
+    
+    Returns one entry per URL, in input order: ``{"image_url", "tags"}`` on
+    success or ``{"image_url", "error"}`` on failure. A failing item never
+    affects the others.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(image_urls)
+    pending = iter(enumerate(image_urls))
+    pending_lock = threading.Lock()
+
+    def worker() -> None:
+        # Each worker thread holds its own DB connection; close it when done.
+        try:
+            while True:
+                with pending_lock:
+                    item = next(pending, None)
+                if item is None:
+                    return
+                index, image_url = item
+                results[index] = _batch_item(image_url)
+        finally:
+            connection.close()
+
+    workers = max(1, min(concurrency, len(image_urls)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tag-batch") as executor:
+        for future in [executor.submit(worker) for _ in range(workers)]:
+            future.result()
+    return results
+
+
+async def atag_batch(image_urls: List[str], concurrency: int) -> List[Dict[str, Any]]:
+    """Async variant of ``tag_batch`` bounded by a semaphore."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(image_url: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await _abatch_item(image_url)
+
+    return list(await asyncio.gather(*(run(image_url) for image_url in image_urls)))
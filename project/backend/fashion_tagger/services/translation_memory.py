@@ -0,0 +1,117 @@
+"""Translation memory for the English -> Persian translate step.
+
+The fashion vocabulary is small and repeats constantly, so every answer
+from the translate model is mined for ``(entity name, English value) ->
+Persian`` pairs and stored in ``TagTranslation``. Once a pair has been
+seen ``TAGGING_TRANSLATION_MEMORY_MIN_COUNT`` times, with one rendering
+accounting for at least ``TAGGING_TRANSLATION_MEMORY_MIN_CONFIDENCE`` of
+the observations, the translate node uses it directly and only sends the
+unknown values to the model, or skips the call when nothing is unknown.
+
+The in-process table is reloaded every ``TAGGING_TRANSLATION_MEMORY_REFRESH``
+seconds to pick up pairs learned by other workers.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+
+from common import metrics
+from fashion_tagger.models import TagTranslation
+from .langgraph_integration import translate_tags
+
+
+class DatabaseTranslationMemory:
+    """``translate_tags.TranslationMemory`` backed by ``TagTranslation`` rows."""
+
+    def __init__(
+        self,
+        min_count: Optional[int] = None,
+        min_confidence: Optional[float] = None,
+        refresh: Optional[int] = None,
+    ):
+        self.min_count = settings.TAGGING_TRANSLATION_MEMORY_MIN_COUNT if min_count is None else min_count
+        self.min_confidence = (
+            settings.TAGGING_TRANSLATION_MEMORY_MIN_CONFIDENCE if min_confidence is None else min_confidence
+        )
+        self.refresh = settings.TAGGING_TRANSLATION_MEMORY_REFRESH if refresh is None else refresh
+        self._counts: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _maybe_reload(self) -> None:
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh:
+            return
+        counts: Dict[Tuple[str, str], Dict[str, int]] = {}
+        rows = TagTranslation.objects.values_list("entity_name", "value_en", "value_fa", "count")
+        for name, value, value_fa, count in rows.iterator(chunk_size=5000):
+            counts.setdefault((name, value), {})[value_fa] = count
+        with self._lock:
+            self._counts = counts
+            self._loaded_at = time.monotonic()
+
+    def lookup(self, name: str, value: str) -> Optional[str]:
+        self._maybe_reload()
+        with self._lock:
+            seen = self._counts.get((name, value))
+            if not seen:
+                return None
+            value_fa, count = max(seen.items(), key=lambda item: item[1])
+            total = sum(seen.values())
+        if count < self.min_count or count / total < self.min_confidence:
+            return None
+        return value_fa
+
+    def learn(self, pairs: Iterable[Tuple[str, str, str]]) -> None:
+        pairs = set(pairs)
+        for name, value, value_fa in pairs:
+            name, value, value_fa = name[:100], value[:255], value_fa.strip()[:255]
+            if not value_fa:
+                continue
+            rows = TagTranslation.objects.filter(entity_name=name, value_en=value, value_fa=value_fa)
+            if not rows.update(count=F("count") + 1):
+                try:
+                    TagTranslation.objects.create(
+                        entity_name=name, value_en=value, value_fa=value_fa, count=1
+                    )
+                except IntegrityError:
+                    rows.update(count=F("count") + 1)
+            with self._lock:
+                seen = self._counts.setdefault((name, value), {})
+                seen[value_fa] = seen.get(value_fa, 0) + 1
+        metrics.incr("translation_memory_learned_total", len(pairs))
+
+    def clear(self) -> None:
+        """Forget the in-process table; the next lookup reloads it."""
+        with self._lock:
+            self._counts = {}
+            self._loaded_at = None
+
+
+def install() -> DatabaseTranslationMemory:
+    """Make the translate node consult a database-backed memory."""
+    memory = DatabaseTranslationMemory()
+    translate_tags.set_translation_memory(memory)
+    return memory
+
+
+def stats() -> Dict[str, Any]:
+    """Return process-local hit rates and how many translate calls were avoided."""
+    hits = metrics.get("translation_memory_lookups_total", outcome="hit")
+    misses = metrics.get("translation_memory_lookups_total", outcome="miss")
+    lookups = hits + misses
+    calls = metrics.total("translation_llm_calls_total")
+    avoided = metrics.total("translation_memory_llm_calls_avoided_total")
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / lookups if lookups else 0.0,
+        "llm_calls": calls,
+        "llm_calls_avoided": avoided,
+        "llm_calls_avoided_ratio": avoided / (calls + avoided) if calls + avoided else 0.0,
+        "entries": TagTranslation.objects.count(),
+    }
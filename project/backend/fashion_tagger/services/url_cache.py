@@ -0,0 +1,84 @@
+"""URL → image cache with HTTP revalidation.
+
+Each entry remembers which image bytes (by hash) a URL served and the
+origin's ETag / Last-Modified. Within ``TAGGING_URL_CACHE_MAX_AGE`` seconds
+of the last validation the entry is trusted as-is; after that the image is
+re-requested with If-None-Match / If-Modified-Since and a 304 keeps the
+entry. If the origin cannot be reached, an entry validated within
+``TAGGING_URL_CACHE_MAX_STALE`` seconds is still served.
+"""
+
+import hashlib
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from common import metrics
+from fashion_tagger.models import ImageURLCache
+from .langgraph_integration.image_fetch import FetchedImage
+
+
+def _url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def is_enabled() -> bool:
+    return settings.TAGGING_URL_CACHE_ENABLED
+
+
+def get_entry(url: str) -> Optional[ImageURLCache]:
+    if not is_enabled():
+        return None
+    return ImageURLCache.objects.filter(url_hash=_url_hash(url)).first()
+
+
+def _age(entry: ImageURLCache) -> timedelta:
+    return timezone.now() - entry.validated_at
+
+
+def is_fresh(entry: Optional[ImageURLCache]) -> bool:
+    """True if the entry can be used without asking the origin."""
+    return entry is not None and _age(entry) < timedelta(seconds=settings.TAGGING_URL_CACHE_MAX_AGE)
+
+
+def is_servable_stale(entry: Optional[ImageURLCache]) -> bool:
+    """True if the entry may be served while the origin is unreachable."""
+    return entry is not None and _age(entry) < timedelta(seconds=settings.TAGGING_URL_CACHE_MAX_STALE)
+
+
+def conditional_headers(entry: Optional[ImageURLCache]) -> Dict[str, Any]:
+    """Keyword arguments for ``fetch_image`` to revalidate the entry."""
+    if entry is None:
+        return {}
+    return {"etag": entry.etag or None, "last_modified": entry.last_modified or None}
+
+
+def mark_validated(entry: ImageURLCache) -> None:
+    """Record that the origin answered 304 for the entry."""
+    metrics.incr("tagging_url_cache_revalidated_total")
+    entry.validated_at = timezone.now()
+    ImageURLCache.objects.filter(pk=entry.pk).update(validated_at=entry.validated_at)
+
+
+def save(url: str, image_hash: str, fetched: FetchedImage) -> None:
+    """Remember what the URL served along with its validators."""
+    if not is_enabled():
+        return
+    ImageURLCache.objects.update_or_create(
+        url_hash=_url_hash(url),
+        defaults={
+            "url": url,
+            "image_hash": image_hash,
+            "etag": fetched.etag[:255],
+            "last_modified": fetched.last_modified[:64],
+            "validated_at": timezone.now(),
+        },
+    )
+
+
+def invalidate(url: str) -> int:
+    """Forget a URL so its next request refetches the image."""
+    deleted, _ = ImageURLCache.objects.filter(url_hash=_url_hash(url)).delete()
+    return deleted
@@ -0,0 +1,264 @@
+"""Webhook delivery of finished tagging jobs through a persistent outbox.
+
+A finished job with a ``callback_url`` gets a ``WebhookDelivery`` row.
+The first pending row for a URL opens a coalescing window
+(``TAGGING_WEBHOOK_COALESCE_WINDOW``). Rows for the same URL created in
+that window join it, so ``dispatch_due()`` sends them as one POST::
+
+    {"results": [{"job_id": ..., "image_url": ..., "status": ..., "tags": ...}, ...]}
+
+A failed POST (a non-2xx reply or a transport error) is retried with
+exponential backoff. After ``TAGGING_WEBHOOK_MAX_ATTEMPTS`` the row is
+marked failed. Rows are claimed one callback URL at a time and leased for
+as long as that URL's POSTs may take, and the lease is renewed before each
+POST, so a crashed dispatcher's rows are retried while a slow one's are not
+claimed twice. Delivery is at least once, and receivers should de-duplicate
+on ``job_id``.
+
+Callback URLs pass the same ``url_guard`` check as image URLs before every
+POST, and redirects are not followed; a URL that fails the check is marked
+failed without retries. With ``TAGGING_WEBHOOK_SECRET`` set, each POST
+carries ``X-Webhook-Signature: sha256=<hex>``, the HMAC-SHA256 of the raw
+body under that secret, for receivers to verify.
+
+Metrics (``common.metrics``):
+
+- ``webhook_deliveries_total{outcome}``: POSTs made, delivered or failed
+- ``webhook_results_delivered_total`` / ``webhook_results_failed_total``
+- ``webhook_delivery_latency_seconds``: histogram, job finished → delivered
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import math
+import random
+from datetime import timedelta
+from typing import Any, Dict, List, Set, Tuple
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from common import metrics
+from fashion_tagger.models import TaggingJob, WebhookDelivery
+from .langgraph_integration.http_pool import get_session
+from .langgraph_integration.url_guard import UnsafeURLError, check_url
+
+logger = logging.getLogger(__name__)
+
+# Rows claimed per dispatch pass (whole URL groups, so it may be exceeded by one group)
+DISPATCH_LIMIT = 1000
+
+# Latency includes the coalescing window and any retries, so up to hours.
+LATENCY_BUCKETS = (1, 2.5, 5, 10, 30, 60, 300, 900, 3600, 14400, 86400)
+SIGNATURE_HEADER = "X-Webhook-Signature"
+
+
+def job_payload(job: TaggingJob) -> Dict[str, Any]:
+    payload = {
+        "job_id": str(job.id),
+        "image_url": job.image_url,
+        "status": job.status,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == TaggingJob.STATUS_SUCCEEDED:
+        payload["tags"] = job.result
+    else:
+        payload["error"] = job.error
+    return payload
+
+
+def enqueue(job: TaggingJob) -> WebhookDelivery:
+    """Add a finished job's result to the outbox for its callback URL."""
+    now = timezone.now()
+    window_end = now + timedelta(seconds=settings.TAGGING_WEBHOOK_COALESCE_WINDOW)
+    # Join the URL's open window, if one is waiting to be sent.
+    open_window = (
+        WebhookDelivery.objects
+        .filter(
+            callback_url=job.callback_url,
+            status=WebhookDelivery.STATUS_PENDING,
+            attempts=0,
+            next_attempt_at__gt=now,
+            next_attempt_at__lte=window_end,
+        )
+        .order_by("next_attempt_at")
+        .values_list("next_attempt_at", flat=True)
+        .first()
+    )
+    return WebhookDelivery.objects.create(
+        callback_url=job.callback_url,
+        job=job,
+        payload=job_payload(job),
+        next_attempt_at=open_window or window_end,
+    )
+
+
+def _lease_until(posts: int):
+    # A POST may take the timeout to connect and the timeout again to read.
+    return timezone.now() + timedelta(seconds=settings.TAGGING_WEBHOOK_TIMEOUT * 2 * posts)
+
+
+def _claim_group(skip_urls: Set[str]) -> List[WebhookDelivery]:
+    """Lease the due rows of the callback URL that has waited longest."""
+    now = timezone.now()
+    due = (
+        WebhookDelivery.objects
+        .select_for_update(skip_locked=True)
+        .filter(status=WebhookDelivery.STATUS_PENDING, next_attempt_at__lte=now)
+        .exclude(callback_url__in=skip_urls)
+        .order_by("next_attempt_at")
+    )
+    with transaction.atomic():
+        callback_url = due.values_list("callback_url", flat=True).first()
+        if callback_url is None:
+            return []
+        ids = list(due.filter(callback_url=callback_url).values_list("id", flat=True)[:DISPATCH_LIMIT])
+        lease_until = _lease_until(math.ceil(len(ids) / settings.TAGGING_WEBHOOK_MAX_BATCH))
+        WebhookDelivery.objects.filter(id__in=ids, next_attempt_at__lte=now).update(
+            next_attempt_at=lease_until
+        )
+    return list(
+        WebhookDelivery.objects
+        .filter(id__in=ids, next_attempt_at=lease_until)
+        .order_by("created_at")
+    )
+
+
+def _renew(rows: List[WebhookDelivery]) -> Tuple[List[WebhookDelivery], int]:
+    """Extend the lease on the rows still held; return them and how many were lost."""
+    posts = math.ceil(len(rows) / settings.TAGGING_WEBHOOK_MAX_BATCH)
+    lease_until = _lease_until(posts)
+    with transaction.atomic():
+        held = set(
+            WebhookDelivery.objects
+            .select_for_update()
+            .filter(
+                id__in=[row.id for row in rows],
+                status=WebhookDelivery.STATUS_PENDING,
+                next_attempt_at=rows[0].next_attempt_at,
+            )
+            .values_list("id", flat=True)
+        )
+        WebhookDelivery.objects.filter(id__in=held).update(next_attempt_at=lease_until)
+    kept = [row for row in rows if row.id in held]
+    for row in kept:
+        row.next_attempt_at = lease_until
+    return kept, len(rows) - len(kept)
+
+
+def _retry_delay(attempts: int) -> float:
+    delay = min(settings.TAGGING_WEBHOOK_RETRY_MAX, settings.TAGGING_WEBHOOK_RETRY_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def sign(body: bytes, secret: str) -> str:
+    """The ``X-Webhook-Signature`` value for ``body``."""
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def _post(callback_url: str, rows: List[WebhookDelivery]) -> str:
+    """POST the rows' payloads; return "" on success or the error."""
+    body = json.dumps({"results": [row.payload for row in rows]}).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if settings.TAGGING_WEBHOOK_SECRET:
+        headers[SIGNATURE_HEADER] = sign(body, settings.TAGGING_WEBHOOK_SECRET)
+    try:
+        resp = get_session(guarded=True).post(
+            callback_url,
+            data=body,
+            headers=headers,
+            timeout=settings.TAGGING_WEBHOOK_TIMEOUT,
+            allow_redirects=False,
+        )
+    except (requests.RequestException, UnsafeURLError) as e:
+        return str(e)
+    if 200 <= resp.status_code < 300:
+        return ""
+    return f"HTTP {resp.status_code}"
+
+
+def _record_success(rows: List[WebhookDelivery]) -> None:
+    now = timezone.now()
+    for row in rows:
+        row.status = WebhookDelivery.STATUS_DELIVERED
+        row.attempts += 1
+        row.delivered_at = now
+        row.last_error = ""
+        metrics.observe(
+            "webhook_delivery_latency_seconds", (now - row.created_at).total_seconds(), buckets=LATENCY_BUCKETS
+        )
+    WebhookDelivery.objects.bulk_update(rows, ["status", "attempts", "delivered_at", "last_error"])
+    metrics.incr("webhook_deliveries_total", outcome="delivered")
+    metrics.incr("webhook_results_delivered_total", len(rows))
+
+
+def _record_failure(rows: List[WebhookDelivery], error: str, retry: bool = True) -> None:
+    now = timezone.now()
+    given_up = 0
+    for row in rows:
+        row.attempts += 1
+        row.last_error = error[:1000]
+        if not retry or row.attempts >= settings.TAGGING_WEBHOOK_MAX_ATTEMPTS:
+            row.status = WebhookDelivery.STATUS_FAILED
+            given_up += 1
+        else:
+            row.next_attempt_at = now + timedelta(seconds=_retry_delay(row.attempts))
+    WebhookDelivery.objects.bulk_update(rows, ["status", "attempts", "last_error", "next_attempt_at"])
+    metrics.incr("webhook_deliveries_total", outcome="failed")
+    if given_up:
+        metrics.incr("webhook_results_failed_total", given_up)
+
+
+def dispatch_due() -> int:
+    """Send every due outbox row, one POST per URL and batch; return the POST count."""
+    posts = claimed = 0
+    batch_size = settings.TAGGING_WEBHOOK_MAX_BATCH
+    # URLs handled this pass; rows that just failed are not retried until the next one.
+    handled: Set[str] = set()
+    while claimed < DISPATCH_LIMIT:
+        rows = _claim_group(handled)
+        if not rows:
+            break
+        callback_url = rows[0].callback_url
+        handled.add(callback_url)
+        claimed += len(rows)
+        try:
+            check_url(callback_url)
+        except (UnsafeURLError, OSError) as e:
+            # Unresolvable hosts may come back; disallowed addresses will not.
+            logger.warning("Webhook delivery to %s refused: %s", callback_url, e)
+            _record_failure(rows, str(e), retry=not isinstance(e, UnsafeURLError))
+            continue
+        while rows:
+            rows, lost = _renew(rows)
+            if lost:
+                logger.warning("Lost the lease on %s webhook rows for %s", lost, callback_url)
+            batch, rows = rows[:batch_size], rows[batch_size:]
+            if not batch:
+                break
+            error = _post(callback_url, batch)
+            if error:
+                logger.warning("Webhook delivery to %s failed: %s", callback_url, error)
+                _record_failure(batch, error)
+            else:
+                _record_success(batch)
+            posts += 1
+    return posts
+
+
+def stats() -> Dict[str, Any]:
+    """Return process-local delivery counters and the outbox backlog."""
+    latency = metrics.histogram("webhook_delivery_latency_seconds")
+    return {
+        "deliveries": metrics.get("webhook_deliveries_total", outcome="delivered"),
+        "failed_deliveries": metrics.get("webhook_deliveries_total", outcome="failed"),
+        "results_delivered": metrics.total("webhook_results_delivered_total"),
+        "results_failed": metrics.total("webhook_results_failed_total"),
+        "mean_latency_seconds": latency["sum"] / latency["count"] if latency["count"] else 0.0,
+        "pending": WebhookDelivery.objects.filter(status=WebhookDelivery.STATUS_PENDING).count(),
+        "failed": WebhookDelivery.objects.filter(status=WebhookDelivery.STATUS_FAILED).count(),
+    }
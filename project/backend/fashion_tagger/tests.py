@@ -1,10 +1,60 @@
-from django.test import override_settings
+import base64
+import hashlib
+import hmac
+import io
+import json
+import os
+import random
+import socket
+import tempfile
+from unittest.mock import patch
+from urllib.parse import urlsplit
+
+import numpy as np
+import requests
+
+from asgiref.sync import sync_to_async
+from django.core.files.uploadhandler import StopUpload
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import path
 from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 from datetime import timedelta
 
 from accounts.models import User, APIKey, UsageLog
-from accounts.services.api_key import generate_key
+from accounts.services import usage
+from accounts.services.api_key import generate_api_key, generate_key, last_used
+from common import metrics
+from common.testing import LocalHTTPServerMixin, QuietHandler, StubHandler
+from common.utils import TTLCache
+from fashion_tagger.models import ImageFingerprint, ImageURLCache, TagTranslation, TaggingJob, TaggingResult, WebhookDelivery
+from fashion_tagger.services import jobs, near_duplicates, result_store, tagger, translation_memory, webhooks
+from fashion_tagger.uploads import SpooledImageUploadHandler
+from fashion_tagger.views import AsyncImageTagView, AsyncImageUploadTagView, ImageTagView
+from PIL import Image
+
+from fashion_tagger.services.langgraph_integration import (
+    http_pool,
+    langgraph_service,
+    model_client,
+    preprocess,
+    serpapi_search,
+    translate_tags,
+    url_guard,
+)
+from fashion_tagger.services.langgraph_integration.image_fetch import (
+    ImageFetchError,
+    ImageRejectedError,
+    afetch_image,
+    fetch_image,
+    fetch_image_node,
+)
+from fashion_tagger.services.langgraph_integration.model_client import OpenRouterClient
+
+# Tests flush the write-behind buffers themselves; a background flush would
+# write from another connection, outside the test's transaction.
+usage.buffer.max_age = 0
+last_used.max_age = 0
 
 
 class ImageTagAuthenticationTests(APITestCase):
@@ -20,6 +70,7 @@ class ImageTagAuthenticationTests(APITestCase):
 
     def setUp(self):
         """Initialize test client and test data."""
+        usage.buffer.drain()  # events left unflushed by earlier tests
         self.client = APIClient()
         self.test_email = "testuser@example.com"
         self.test_password = "securepassword123"
@@ -162,6 +213,7 @@ class TestValidAPIKey(ImageTagAuthenticationTests):
         response = self._make_request(api_key=raw_key)
         self.assertEqual(response.status_code, 200)
         
+        usage.flush()
         final_logs = UsageLog.objects.filter(user=user).count()
         self.assertEqual(final_logs, initial_logs + 1)
 
@@ -173,6 +225,7 @@ class TestValidAPIKey(ImageTagAuthenticationTests):
         response = self._make_request(api_key=raw_key)
         self.assertEqual(response.status_code, 200)
         
+        last_used.flush()  # written behind the request
         api_key_obj.refresh_from_db()
         self.assertIsNotNone(api_key_obj.last_used_at)
         self.assertGreater(api_key_obj.last_used_at, initial_last_used or timezone.now() - timedelta(seconds=1))
@@ -299,6 +352,7 @@ class TestUsageLogging(ImageTagAuthenticationTests):
         response = self._make_request(api_key=raw_key, image_url=None)
         self.assertEqual(response.status_code, 400)
         
+        usage.flush()
         final_logs = UsageLog.objects.filter(user=user).count()
         self.assertEqual(final_logs, initial_logs + 1)
 
@@ -308,6 +362,7 @@ class TestUsageLogging(ImageTagAuthenticationTests):
         response = self._make_request(api_key=raw_key)
         self.assertEqual(response.status_code, 200)
         
+        usage.flush()
         log = UsageLog.objects.filter(user=user).latest("used_at")
         self.assertEqual(log.endpoint, "/api/v1/tag/")
 
@@ -320,6 +375,7 @@ class TestUsageLogging(ImageTagAuthenticationTests):
         
         self.assertEqual(response.status_code, 200)
         
+        usage.flush()
         log = UsageLog.objects.filter(user=user).latest("used_at")
         self.assertGreaterEqual(log.used_at, before_request)
         self.assertLessEqual(log.used_at, after_request)
@@ -410,6 +466,7 @@ class TestAuthenticationEdgeCases(ImageTagAuthenticationTests):
         self.assertEqual(response1.status_code, 200)
         self.assertEqual(response2.status_code, 200)
         
+        usage.flush()
         log1 = UsageLog.objects.filter(user=user1).latest("used_at")
         log2 = UsageLog.objects.filter(user=user2).latest("used_at")
         
@@ -427,3 +484,1149 @@ class TestAuthenticationEdgeCases(ImageTagAuthenticationTests):
         self.assertEqual(response1.status_code, 200)
         self.assertEqual(response2.status_code, 200)
         self.assertEqual(response3.status_code, 429)
+
+
+class TestHTTPConnectionPool(LocalHTTPServerMixin, SimpleTestCase):
+    """Upstream calls reuse pooled keep-alive connections."""
+
+    def setUp(self):
+        metrics.reset()
+        self.session = http_pool.build_session(pool_connections=1, pool_maxsize=1)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_openrouter_calls_reuse_connection(self):
+        """Verify that repeated chat calls open a single connection."""
+        client = OpenRouterClient(base_url=f"{self.server_url}/chat", session=self.session)
+        upstream = patch.object(http_pool, "_UPSTREAM_HOSTS", frozenset({"127.0.0.1"}))
+        with patch.object(model_client, "OPENROUTER_API_KEY", "test-key"), upstream:
+            for _ in range(3):
+                result = client.call_json(model="m", messages=[], max_retries=0)
+                self.assertEqual(result["json"], {"entities": []})
+
+        stats = http_pool.pool_stats()["127.0.0.1"]
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 2)
+
+    def test_shared_session_is_process_wide(self):
+        """Verify that the default client uses the shared pooled session."""
+        self.assertIs(model_client.get_openrouter_client().session, http_pool.get_session())
+
+    def test_upstream_latency_errors_and_retries_are_counted(self):
+        client = OpenRouterClient(base_url=f"{self.server_url}/chat", session=self.session)
+        with patch.object(model_client, "OPENROUTER_API_KEY", "test-key"), patch.object(
+            model_client, "_retry_delay", return_value=0
+        ), patch.object(StubHandler, "status", 503):
+            with self.assertRaises(model_client.OpenRouterError):
+                client.call_json(model="m", messages=[], max_retries=2)
+
+        self.assertEqual(metrics.get("openrouter_retries_total", model="m"), 2)
+        self.assertEqual(metrics.get("openrouter_errors_total", model="m", error="OpenRouterError"), 3)
+        # The stub is not a configured upstream host.
+        self.assertEqual(metrics.get("http_upstream_errors_total", host="other", error="HTTP_503"), 3)
+        self.assertEqual(metrics.histogram("http_upstream_duration_seconds", host="other")["count"], 3)
+
+    def test_only_upstream_hosts_get_their_own_label(self):
+        openrouter = urlsplit(model_client.OPENROUTER_BASE_URL).hostname
+        self.assertEqual(http_pool.host_label(openrouter), openrouter)
+        self.assertEqual(http_pool.host_label("images.example.com"), "other")
+        self.assertEqual(http_pool.host_label(None), "other")
+
+
+class TestMetrics(SimpleTestCase):
+    """Histograms, node timings and the node-wide /metrics endpoint."""
+
+    def setUp(self):
+        metrics.reset()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.metrics_dir = tmp.name
+
+    def test_processes_are_summed_and_rendered(self):
+        metrics.incr("jobs_total", 2, status="done")
+        metrics.observe("step_seconds", 0.02, step="a")
+        metrics.observe("step_seconds", 3, step="a")
+        # Another worker's published file.
+        other = {
+            "counters": [["jobs_total", [["status", "done"]], 5]],
+            "histograms": [["step_seconds", [["step", "a"]], list(metrics.DURATION_BUCKETS), [1] + [0] * 13, 0.001]],
+        }
+        with open(os.path.join(self.metrics_dir, "1-other.json"), "w") as published:
+            json.dump(other, published)
+
+        text = metrics.render(*metrics.collect(self.metrics_dir))
+        self.assertIn('jobs_total{status="done"} 7', text)
+        self.assertIn('step_seconds_bucket{step="a",le="0.005"} 1', text)
+        self.assertIn('step_seconds_bucket{step="a",le="0.025"} 2', text)
+        self.assertIn('step_seconds_bucket{step="a",le="+Inf"} 3', text)
+        self.assertIn('step_seconds_count{step="a"} 3', text)
+
+    def test_nodes_are_timed_and_errors_counted(self):
+        def failing_node(state):
+            raise ValueError("bad state")
+
+        langgraph_service._instrument_node(lambda state: state, "ok")({})
+        with self.assertRaises(ValueError):
+            langgraph_service._instrument_node(failing_node, "failing")({})
+
+        self.assertEqual(metrics.histogram("langgraph_node_duration_seconds", node="ok")["count"], 1)
+        self.assertEqual(metrics.histogram("langgraph_node_duration_seconds", node="failing")["count"], 1)
+        self.assertEqual(metrics.get("langgraph_node_errors_total", node="failing", error="ValueError"), 1)
+
+    def test_metrics_endpoint(self):
+        metrics.incr("jobs_total")
+        with override_settings(METRICS_DIR=self.metrics_dir, METRICS_TOKEN="scrape-token"):
+            self.assertEqual(self.client.get("/metrics").status_code, 401)
+            response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape-token")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn("jobs_total 1", response.content.decode())
+
+
+class _RecordingHandler(StubHandler):
+    requests = []
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.requests.append(self.rfile.read(length))
+        self.send_response(self.status)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    do_POST = _reply
+
+
+class TestInlineImageRequestBody(LocalHTTPServerMixin, SimpleTestCase):
+    """Inline images are base64-streamed into the request body."""
+    handler_class = _RecordingHandler
+
+    def test_streamed_body_matches_plain_json_encoding(self):
+        image = bytes(range(256)) * 1000 + b"x"
+        part = model_client.make_image_part(model_client.InlineImage(image, "image/png"))
+        payload = {"model": "m", "messages": [{"role": "user", "content": [part]}]}
+
+        segments, length = model_client.encode_body(payload)
+        body = b"".join(model_client._iter_body(segments))
+
+        data_uri = "data:image/png;base64," + base64.b64encode(image).decode("ascii")
+        expected = {"model": "m", "messages": [{"role": "user", "content": [
+            {"type": "image_url", "image_url": data_uri},
+        ]}]}
+        self.assertEqual(len(body), length)
+        self.assertEqual(json.loads(body), expected)
+
+    def test_client_sends_the_image_with_a_content_length(self):
+        image = b"\xff\xd8" + bytes(200_000)
+        client = OpenRouterClient(base_url=f"{self.server_url}/chat", session=http_pool.build_session())
+        messages = [{"role": "user", "content": [
+            model_client.make_image_part(model_client.InlineImage(image)),
+        ]}]
+        with patch.object(model_client, "OPENROUTER_API_KEY", "test-key"):
+            client.call_json(model="m", messages=messages, max_retries=0)
+
+        sent = json.loads(_RecordingHandler.requests[-1])
+        data_uri = sent["messages"][0]["content"][0]["image_url"]
+        self.assertEqual(base64.b64decode(data_uri.split(",", 1)[1]), image)
+
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + b"\x00" * 2048
+
+
+class _ImageHandler(QuietHandler):
+    """Serves a PNG, an oversized body, HTML, redirects and a 404."""
+    routes = {
+        "/shirt.png": (200, PNG_BYTES),
+        "/huge.png": (200, PNG_BYTES + b"\x00" * 8192),
+        "/page.html": (200, b"<html>not an image</html>"),
+    }
+    redirects = {
+        "/moved.png": "/shirt.png",
+        "/metadata.png": "http://169.254.169.254/latest/meta-data/",
+    }
+
+    def do_GET(self):
+        if self.path in self.redirects:
+            self.send_response(302)
+            self.send_header("Location", self.redirects[self.path])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        status, body = self.routes.get(self.path, (404, b""))
+        if self.headers.get("If-None-Match") == '"v1"':
+            status, body = 304, b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("ETag", '"v1"')
+        if self.path == "/huge.png":
+            # No Content-Length: the cap must trip while streaming.
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(body)
+            self.close_connection = True
+            return
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@patch.object(url_guard, "OUTBOUND_ALLOW_PRIVATE_HOSTS", True)
+class TestImageFetch(LocalHTTPServerMixin, SimpleTestCase):
+    """Server-side image download with size caps and type sniffing."""
+    handler_class = _ImageHandler
+
+    def test_fetch_sniffs_type_and_keeps_validators(self):
+        """Verify the MIME type comes from the bytes, not the header."""
+        fetched = fetch_image(f"{self.server_url}/shirt.png")
+        self.assertEqual(fetched.content, PNG_BYTES)
+        self.assertEqual(fetched.content_type, "image/png")
+        self.assertEqual(fetched.etag, '"v1"')
+
+    def test_conditional_fetch_returns_not_modified(self):
+        fetched = fetch_image(f"{self.server_url}/shirt.png", etag='"v1"')
+        self.assertTrue(fetched.not_modified)
+        self.assertEqual(fetched.content, b"")
+
+    def test_size_cap_aborts_download(self):
+        with self.assertRaises(ImageRejectedError):
+            fetch_image(f"{self.server_url}/huge.png", max_bytes=4096)
+
+    def test_non_image_is_rejected(self):
+        with self.assertRaises(ImageRejectedError):
+            fetch_image(f"{self.server_url}/page.html")
+
+    def test_http_error_raises(self):
+        with self.assertRaises(ImageFetchError):
+            fetch_image(f"{self.server_url}/missing.png")
+
+    def test_node_hands_bytes_to_pipeline(self):
+        """Verify the graph node stores the bytes and falls back on errors."""
+        state = fetch_image_node({"image_url": f"{self.server_url}/shirt.png"})
+        self.assertEqual(state["image_bytes"], PNG_BYTES)
+        self.assertEqual(state["image_mime"], "image/png")
+
+        state = fetch_image_node({"image_url": f"{self.server_url}/missing.png"})
+        self.assertNotIn("image_bytes", state)
+
+    def test_node_does_not_retry_a_failed_caller_fetch(self):
+        state = {"image_url": f"{self.server_url}/shirt.png", "image_fetch_failed": True}
+        self.assertIs(fetch_image_node(state), state)
+
+    def test_redirect_is_followed(self):
+        self.assertEqual(fetch_image(f"{self.server_url}/moved.png").content, PNG_BYTES)
+
+    def test_private_and_non_http_urls_are_rejected(self):
+        urls = [
+            f"{self.server_url}/shirt.png",
+            "http://169.254.169.254/latest/meta-data/",
+            "http://[::ffff:10.0.0.1]/a.png",
+            "file:///etc/passwd",
+        ]
+        with patch.object(url_guard, "OUTBOUND_ALLOW_PRIVATE_HOSTS", False):
+            for url in urls:
+                with self.subTest(url=url), self.assertRaises(ImageRejectedError):
+                    fetch_image(url)
+
+    def test_redirect_to_private_address_is_rejected(self):
+        only_stub = patch.object(url_guard, "is_public_address", lambda address: address == "127.0.0.1")
+        with patch.object(url_guard, "OUTBOUND_ALLOW_PRIVATE_HOSTS", False), only_stub:
+            with self.assertRaisesMessage(ImageRejectedError, "169.254.169.254"):
+                fetch_image(f"{self.server_url}/metadata.png")
+
+    async def test_async_fetch_checks_each_redirect(self):
+        self.assertEqual((await afetch_image(f"{self.server_url}/moved.png")).content, PNG_BYTES)
+        only_stub = patch.object(url_guard, "is_public_address", lambda address: address == "127.0.0.1")
+        with patch.object(url_guard, "OUTBOUND_ALLOW_PRIVATE_HOSTS", False), only_stub:
+            with self.assertRaises(ImageRejectedError):
+                await afetch_image(f"{self.server_url}/metadata.png")
+        await http_pool.close_async_session()
+
+    def _rebinding_dns(self):
+        """The check sees a public address; the connection's own lookup gets loopback."""
+        answers = iter(["93.184.216.34", "127.0.0.1"])
+
+        def getaddrinfo(host, port, *args, **kwargs):
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (next(answers), port))]
+
+        return patch.object(url_guard.socket, "getaddrinfo", getaddrinfo)
+
+    def test_connection_checks_the_address_it_connects_to(self):
+        url = f"http://rebind.test:{self.server.server_port}/shirt.png"
+        with patch.object(url_guard, "OUTBOUND_ALLOW_PRIVATE_HOSTS", False), self._rebinding_dns():
+            with self.assertRaisesMessage(ImageRejectedError, "127.0.0.1"):
+                fetch_image(url)
+
+    async def test_async_connection_checks_the_address_it_connects_to(self):
+        url = f"http://rebind.test:{self.server.server_port}/shirt.png"
+        with patch.object(url_guard, "OUTBOUND_ALLOW_PRIVATE_HOSTS", False), self._rebinding_dns():
+            with self.assertRaisesMessage(ImageRejectedError, "127.0.0.1"):
+                await afetch_image(url)
+        await http_pool.close_async_session()
+
+    def test_clients_get_a_generic_fetch_error(self):
+        error = ImageRejectedError("http://10.0.0.5/a.png resolves to non-public address 10.0.0.5")
+        with patch.object(tagger, "tag_image", side_effect=error):
+            (item,) = tagger.tag_batch(["http://10.0.0.5/a.png"], concurrency=1)
+        self.assertEqual(item["error"], "Could not fetch image.")
+
+
+def _encode(img, fmt, **params):
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, **params)
+    return buf.getvalue()
+
+
+class TestImagePreprocess(SimpleTestCase):
+    """Images are normalised before the vision call."""
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_large_png_is_downscaled_to_jpeg(self):
+        png = _encode(Image.new("RGBA", (3000, 1500), (10, 20, 30, 255)), "PNG")
+        state = preprocess.preprocess_image_node({"image_bytes": png, "image_mime": "image/png"})
+
+        self.assertEqual(state["image_mime"], "image/jpeg")
+        with Image.open(io.BytesIO(state["image_bytes"])) as img:
+            self.assertEqual(img.size, (1024, 512))
+            self.assertEqual(img.mode, "RGB")
+        saved = metrics.total("image_preprocess_bytes_saved_total")
+        self.assertEqual(saved, len(png) - len(state["image_bytes"]))
+
+    def test_exif_orientation_is_applied(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees clockwise
+        jpeg = _encode(Image.new("RGB", (400, 200)), "JPEG", exif=exif)
+        data, mime = preprocess.preprocess_image(jpeg, output_format="webp")
+
+        self.assertEqual(mime, "image/webp")
+        with Image.open(io.BytesIO(data)) as img:
+            self.assertEqual(img.size, (200, 400))
+
+    def test_jpeg_drafted_to_max_edge_is_not_kept_as_original(self):
+        # draft() decodes this at exactly 1024px; it still needs the re-encoded copy.
+        noise = Image.frombytes("RGB", (2048, 2048), os.urandom(2048 * 2048 * 3))
+        jpeg = _encode(noise, "JPEG", quality=10)
+        data, mime = preprocess.preprocess_image(jpeg, quality=100)
+
+        self.assertNotEqual(data, jpeg)
+        with Image.open(io.BytesIO(data)) as img:
+            self.assertEqual(img.size, (1024, 1024))
+
+    def test_undecodable_bytes_pass_through(self):
+        state = preprocess.preprocess_image_node({"image_bytes": b"not an image"})
+        self.assertEqual(state["image_bytes"], b"not an image")
+
+
+@override_settings(TAGGING_BATCH_CONCURRENCY=3)
+class TestSerpAPICache(SimpleTestCase):
+    """Reverse-image results are cached per URL, failures only briefly."""
+
+    def setUp(self):
+        serpapi_search.clear_cache()
+        self.addCleanup(serpapi_search.clear_cache)
+
+    def test_ttl_cache_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+
+    def test_ttl_cache_entries_expire_after_their_own_ttl(self):
+        now = [0.0]
+        cache = TTLCache(maxsize=10, ttl=10, timer=lambda: now[0])
+        cache.set("long", 1)
+        cache.set("short", 2, ttl=1)
+        now[0] = 5
+        self.assertEqual((cache.get("long"), cache.get("short")), (1, None))
+        now[0] = 20
+        self.assertIsNone(cache.get("long"))
+
+    @patch.dict("os.environ", {"SERPAPI_API_KEY": "test"})
+    def test_repeated_url_is_searched_once(self):
+        response = patch.object(serpapi_search, "get_session").start().return_value.get.return_value
+        self.addCleanup(patch.stopall)
+        response.json.return_value = {"image_results": [{"title": "Blue shirt"}]}
+        state = {"image_url": "https://example.com/a.jpg"}
+
+        first = serpapi_search.serpapi_search_node(dict(state))["serpapi_results"]
+        second = serpapi_search.serpapi_search_node(dict(state))["serpapi_results"]
+
+        self.assertEqual(first, second)
+        self.assertEqual(serpapi_search.get_session.return_value.get.call_count, 1)
+
+    @patch.dict("os.environ", {"SERPAPI_API_KEY": "test"})
+    def test_failures_use_the_negative_ttl(self):
+        session = patch.object(serpapi_search, "get_session").start().return_value
+        self.addCleanup(patch.stopall)
+        session.get.side_effect = requests.ConnectionError("down")
+        state = {"image_url": "https://example.com/bad.jpg"}
+
+        with patch.object(serpapi_search._cache, "set", wraps=serpapi_search._cache.set) as cache_set:
+            serpapi_search.serpapi_search_node(dict(state))
+        serpapi_search.serpapi_search_node(dict(state))
+
+        self.assertEqual(session.get.call_count, 1)
+        self.assertEqual(cache_set.call_args.kwargs["ttl"], serpapi_search.SERPAPI_CACHE_NEGATIVE_TTL)
+
+
+class TestTranslationMemory(TestCase):
+    """translate_tags_node only asks the model for tags it has not learned yet."""
+
+    def setUp(self):
+        self.memory = translation_memory.DatabaseTranslationMemory(min_count=2, min_confidence=0.8, refresh=0)
+        translate_tags.set_translation_memory(self.memory)
+        self.addCleanup(translate_tags.set_translation_memory, None)
+        self.state = {
+            "image_tags_en": {"entities": [{"name": "color", "values": ["Blue", "white"]}]},
+            "serpapi_results": {},
+        }
+
+    def _translate(self, answer):
+        client = patch.object(translate_tags, "get_openrouter_client").start()
+        self.addCleanup(patch.stopall)
+        client.return_value.call_json.return_value = {"json": answer, "text": ""}
+        return translate_tags.translate_tags_node(self.state), client.return_value.call_json
+
+    def test_known_tags_skip_the_model(self):
+        self.memory.learn([("color", "", "رنگ"), ("color", "blue", "آبی"), ("color", "white", "سفید")])
+        self.memory.learn([("color", "", "رنگ"), ("color", "blue", "آبی"), ("color", "white", "سفید")])
+
+        state, call_json = self._translate(None)
+
+        call_json.assert_not_called()
+        self.assertEqual(
+            state["image_tags_fa"],
+            {"entities": [{"name": "رنگ", "values": ["آبی", "سفید"]}]},
+        )
+
+    def test_only_unknown_values_are_sent_and_then_learned(self):
+        self.memory.learn([("color", "", "رنگ"), ("color", "blue", "آبی")])
+        self.memory.learn([("color", "", "رنگ"), ("color", "blue", "آبی"), ("color", "white", "شیری")])
+        answer = {"entities": [{"source": "color", "name": "رنگ", "values": ["سفید"]}]}
+
+        state, call_json = self._translate(answer)
+
+        prompt = call_json.call_args.kwargs["messages"][0]["content"][0]["text"]
+        self.assertIn("'values': ['white']", prompt)
+        self.assertNotIn("Blue", prompt)
+        self.assertEqual(
+            state["image_tags_fa"],
+            {"entities": [{"name": "رنگ", "values": ["آبی", "سفید"]}]},
+        )
+        self.assertEqual(
+            TagTranslation.objects.get(entity_name="color", value_en="white", value_fa="سفید").count, 1
+        )
+
+
+TAGS = {"english": {"color": "red"}, "persian": {"color": "قرمز"}}
+
+
+@override_settings(TAGGING_RESULT_STORE_ENABLED=True, TAGGING_RESULT_TTL=60)
+class TestResultStore(LocalHTTPServerMixin, TestCase):
+    """Results are stored per image bytes and pipeline version."""
+    handler_class = _ImageHandler
+
+    def setUp(self):
+        metrics.reset()
+        self.image_hash = result_store.compute_image_hash(PNG_BYTES)
+
+    def test_hit_and_miss_update_the_stats(self):
+        self.assertIsNone(result_store.get_result(self.image_hash))
+        result_store.store_result(self.image_hash, TAGS)
+
+        self.assertEqual(result_store.get_result(self.image_hash), TAGS)
+        self.assertEqual(TaggingResult.objects.get().hit_count, 1)
+        stats = result_store.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_ratio"]), (1, 1, 0.5))
+        self.assertEqual(stats["entries"], 1)
+
+    def test_entries_expire_after_the_ttl(self):
+        result_store.store_result(self.image_hash, TAGS)
+        result_store.store_result("b" * 64, TAGS, ttl=0)
+        later = timezone.now() + timedelta(seconds=61)
+
+        with patch.object(timezone, "now", return_value=later):
+            self.assertIsNone(result_store.get_result(self.image_hash))
+            self.assertEqual(result_store.get_result("b" * 64), TAGS)  # ttl=0 never expires
+            self.assertEqual(result_store.purge_expired(), 1)
+
+    def test_invalidate_by_image_version_or_all(self):
+        for image_hash in ("a" * 64, "b" * 64):
+            result_store.store_result(image_hash, TAGS)
+            result_store.store_result(image_hash, TAGS, version="old")
+
+        self.assertEqual(result_store.invalidate(image_hash="a" * 64), 2)
+        self.assertEqual(result_store.invalidate(pipeline_version="old"), 1)
+        self.assertEqual(result_store.invalidate(), 1)
+        self.assertFalse(TaggingResult.objects.exists())
+
+    def test_model_or_prompt_change_starts_a_new_namespace(self):
+        result_store.store_result(self.image_hash, TAGS)
+        version = langgraph_service.pipeline_version()
+        changes = [
+            patch.object(langgraph_service, "VISION_MODEL", "another/vision-model"),
+            patch.object(langgraph_service, "TRANSLATE_MODEL", "another/translate-model"),
+            patch.object(langgraph_service, "build_prompt", return_value="A different prompt"),
+        ]
+        for change in changes:
+            with self.subTest(change=change.attribute), change:
+                self.assertNotEqual(langgraph_service.pipeline_version(), version)
+                self.assertIsNone(result_store.get_result(self.image_hash))
+        self.assertEqual(result_store.get_result(self.image_hash), TAGS)
+
+    @override_settings(TAGGING_URL_CACHE_ENABLED=False, TAGGING_NEAR_DUPLICATE_ENABLED=False)
+    def test_same_bytes_skip_the_pipeline(self):
+        url = f"{self.server_url}/shirt.png"
+        with patch.object(url_guard, "OUTBOUND_ALLOW_PRIVATE_HOSTS", True), patch.object(
+            tagger, "run_langgraph_on_url", return_value=TAGS
+        ) as pipeline:
+            self.assertEqual(tagger.tag_image(url), TAGS)
+            self.assertEqual(tagger.tag_image(url), TAGS)
+
+        pipeline.assert_called_once_with(url, PNG_BYTES, "image/png", False)
+        self.assertEqual(TaggingResult.objects.get().image_hash, self.image_hash)
+        self.assertEqual(metrics.total("tagging_result_store_hits_total"), 1)
+
+
+class _RevalidatingImageHandler(QuietHandler):
+    """Serves ``body`` with validators, answering 304 to a matching conditional GET."""
+    body = PNG_BYTES
+    etag = '"v1"'
+    last_modified = "Wed, 01 Jan 2025 00:00:00 GMT"
+    status = 200
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append(dict(self.headers))
+        status, body = self.status, self.body
+        if status == 200 and self.headers.get("If-None-Match") == self.etag:
+            status, body = 304, b""
+        self.send_response(status)
+        self.send_header("ETag", self.etag)
+        self.send_header("Last-Modified", self.last_modified)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@patch.object(url_guard, "OUTBOUND_ALLOW_PRIVATE_HOSTS", True)
+@override_settings(
+    TAGGING_RESULT_STORE_ENABLED=True,
+    TAGGING_URL_CACHE_ENABLED=True,
+    TAGGING_NEAR_DUPLICATE_ENABLED=False,
+    TAGGING_URL_CACHE_MAX_AGE=300,
+    TAGGING_URL_CACHE_MAX_STALE=3600,
+)
+class TestURLCache(LocalHTTPServerMixin, TestCase):
+    """URLs are revalidated with conditional GETs before their result is reused."""
+    handler_class = _RevalidatingImageHandler
+
+    def setUp(self):
+        metrics.reset()
+        _RevalidatingImageHandler.requests = []
+        self.url = f"{self.server_url}/shirt.png"
+        pipeline = patch.object(tagger, "run_langgraph_on_url", return_value=TAGS)
+        self.pipeline = pipeline.start()
+        self.addCleanup(pipeline.stop)
+        handler = patch.multiple(_RevalidatingImageHandler, body=PNG_BYTES, etag='"v1"', status=200)
+        handler.start()
+        self.addCleanup(handler.stop)
+
+    def _expire(self):
+        ImageURLCache.objects.update(validated_at=timezone.now() - timedelta(seconds=301))
+
+    def test_fresh_entry_skips_the_origin(self):
+        tagger.tag_image(self.url)
+        self.assertEqual(tagger.tag_image(self.url), TAGS)
+
+        self.assertEqual(len(_RevalidatingImageHandler.requests), 1)
+        self.assertEqual(metrics.total("tagging_url_cache_fresh_hits_total"), 1)
+        self.pipeline.assert_called_once()
+
+    def test_stale_entry_sends_validators_and_reuses_the_result_on_304(self):
+        tagger.tag_image(self.url)
+        self._expire()
+
+        self.assertEqual(tagger.tag_image(self.url), TAGS)
+
+        revalidation = _RevalidatingImageHandler.requests[-1]
+        self.assertEqual(revalidation["If-None-Match"], '"v1"')
+        self.assertEqual(revalidation["If-Modified-Since"], "Wed, 01 Jan 2025 00:00:00 GMT")
+        self.assertEqual(metrics.total("tagging_url_cache_revalidated_total"), 1)
+        self.pipeline.assert_called_once()
+
+    def test_changed_image_reruns_the_pipeline(self):
+        tagger.tag_image(self.url)
+        self._expire()
+        new_bytes = PNG_BYTES + b"\x01"
+        with patch.multiple(_RevalidatingImageHandler, body=new_bytes, etag='"v2"'):
+            tagger.tag_image(self.url)
+
+        self.assertEqual(self.pipeline.call_count, 2)
+        self.assertEqual(self.pipeline.call_args.args[1], new_bytes)
+        entry = ImageURLCache.objects.get()
+        self.assertEqual((entry.image_hash, entry.etag), (result_store.compute_image_hash(new_bytes), '"v2"'))
+
+    def test_unreachable_origin_serves_stale_entries_within_max_stale(self):
+        tagger.tag_image(self.url)
+        self._expire()
+        with patch.object(_RevalidatingImageHandler, "status", 503):
+            self.assertEqual(tagger.tag_image(self.url), TAGS)
+            self.pipeline.assert_called_once()
+
+            with override_settings(TAGGING_URL_CACHE_MAX_STALE=60):
+                tagger.tag_image(self.url)
+        self.assertEqual(self.pipeline.call_count, 2)
+        # The graph is told the origin already failed, so it does not fetch again.
+        self.assertEqual(self.pipeline.call_args.args, (self.url, None, None, True))
+        self.assertEqual(metrics.total("tagging_url_cache_stale_served_total"), 1)
+
+
+def _photo(seed, size=(640, 480)):
+    """A smooth, photo-like test image that differs per seed."""
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    return Image.fromarray(pixels).resize(size, Image.Resampling.BICUBIC)
+
+
+@override_settings(TAGGING_NEAR_DUPLICATE_MAX_DISTANCE=4)
+class TestNearDuplicates(SimpleTestCase):
+    """Perceptual hashes match re-encoded copies through the multi-index."""
+
+    def test_reencoded_and_resized_copies_match_unrelated_images_do_not(self):
+        original = _photo(1)
+        for algorithm in ("phash", "dhash"):
+            with self.subTest(algorithm=algorithm), override_settings(TAGGING_NEAR_DUPLICATE_ALGORITHM=algorithm):
+                index = near_duplicates.MultiIndexHashIndex(max_distance=4)
+                index.add(near_duplicates.fingerprint(_encode(original, "PNG")).hash, "original")
+                copies = [
+                    _encode(original, "JPEG", quality=40),
+                    _encode(original.resize((320, 240)), "JPEG", quality=70),
+                    _encode(original.resize((1280, 960)), "WEBP"),
+                ]
+                for copy in copies:
+                    self.assertEqual(index.search(near_duplicates.fingerprint(copy).hash)[0][1], "original")
+                self.assertEqual(index.search(near_duplicates.fingerprint(_encode(_photo(2), "PNG")).hash), [])
+
+    def test_undecodable_bytes_have_no_fingerprint(self):
+        self.assertIsNone(near_duplicates.fingerprint(b"not an image"))
+
+    def test_multi_index_search_equals_a_brute_force_scan(self):
+        rng = random.Random(7)
+        hashes = [rng.getrandbits(64) for _ in range(300)]
+        # Neighbours within and just beyond the radius of some stored hashes.
+        for base in hashes[:60]:
+            flipped = base
+            for bit in rng.sample(range(64), rng.randint(1, 6)):
+                flipped ^= 1 << bit
+            hashes.append(flipped)
+        index = near_duplicates.MultiIndexHashIndex(max_distance=4)
+        for i, value in enumerate(hashes):
+            index.add(value, str(i))
+
+        for query in hashes[:80] + [rng.getrandbits(64) for _ in range(20)]:
+            for radius in (None, 2):
+                expected = sorted(
+                    (near_duplicates.hamming(query, value), str(i))
+                    for i, value in enumerate(hashes)
+                    if near_duplicates.hamming(query, value) <= (4 if radius is None else radius)
+                )
+                self.assertEqual(index.search(query, max_distance=radius), expected)
+
+
+@override_settings(TAGGING_NEAR_DUPLICATE_MAX_DISTANCE=4, TAGGING_NEAR_DUPLICATE_MAX_COLOR_DISTANCE=0.1)
+class TestNearDuplicateLookup(TestCase):
+    """Stored fingerprints are matched by hash and then by colour."""
+
+    def setUp(self):
+        metrics.reset()
+        state = patch.multiple(
+            near_duplicates, _index=None, _last_loaded_id=0, _last_refresh=0.0, _colors={}, _added_since_refresh=set()
+        )
+        state.start()
+        self.addCleanup(state.stop)
+
+    def test_colour_variant_with_the_same_grayscale_is_not_reused(self):
+        original = _photo(1)
+        stored = near_duplicates.fingerprint(_encode(original, "PNG"))
+        near_duplicates.remember("original", stored)
+        near_duplicates.remember("original", stored)  # already known: no error, no second row
+        self.assertEqual(ImageFingerprint.objects.count(), 1)
+
+        copy = near_duplicates.fingerprint(_encode(original, "JPEG", quality=40))
+        self.assertEqual(near_duplicates.find_match(copy), "original")
+
+        gray = near_duplicates.fingerprint(_encode(original.convert("L").convert("RGB"), "PNG"))
+        self.assertLessEqual(near_duplicates.hamming(gray.hash, stored.hash), 4)
+        self.assertIsNone(near_duplicates.find_match(gray))
+        self.assertEqual(metrics.total("tagging_near_duplicate_color_rejects_total"), 1)
+
+
+class TestBatchTagEndpoint(APITestCase):
+    """POST /api/v1/tag/batch/ tags several images in one request."""
+
+    def setUp(self):
+        usage.buffer.drain()  # events left unflushed by earlier tests
+        self.user = User.objects.create_user(email="batch@example.com", password="testpass123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.endpoint = "/api/v1/tag/batch/"
+
+    def _fake_tag_image(self, image_url):
+        if "broken" in image_url:
+            raise RuntimeError("pipeline failed")
+        return {"english": {"url": image_url}, "persian": {}}
+
+    def test_results_keep_input_order_and_isolate_failures(self):
+        urls = [f"https://example.com/{name}.jpg" for name in ("a", "broken", "c", "d")]
+        with patch("fashion_tagger.services.tagger.tag_image", side_effect=self._fake_tag_image):
+            response = self.client.post(self.endpoint, {"image_urls": urls}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["succeeded"], 3)
+        self.assertEqual(response.data["failed"], 1)
+        self.assertEqual([item["image_url"] for item in response.data["results"]], urls)
+        self.assertIn("error", response.data["results"][1])
+        self.assertEqual(response.data["results"][3]["tags"]["english"]["url"], urls[3])
+
+    def test_quota_and_usage_log_charged_once_per_batch(self):
+        urls = [f"https://example.com/{i}.jpg" for i in range(4)]
+        with patch("fashion_tagger.services.tagger.tag_image", side_effect=self._fake_tag_image):
+            self.client.post(self.endpoint, {"image_urls": urls}, format="json")
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 4)
+        usage.flush()
+        self.assertEqual(UsageLog.objects.filter(user=self.user).count(), 1)
+
+    def test_batch_larger_than_remaining_quota_is_rejected(self):
+        self.user.daily_tagging_count = 14
+        self.user.daily_count_reset_at = timezone.now()
+        self.user.save()
+        urls = ["https://example.com/a.jpg", "https://example.com/b.jpg"]
+        with patch("fashion_tagger.services.tagger.tag_image") as tag_image:
+            response = self.client.post(self.endpoint, {"image_urls": urls}, format="json")
+
+        self.assertEqual(response.status_code, 429)
+        tag_image.assert_not_called()
+
+    @override_settings(TAGGING_BATCH_MAX_ITEMS=2)
+    def test_oversized_batch_returns_400(self):
+        urls = [f"https://example.com/{i}.jpg" for i in range(3)]
+        response = self.client.post(self.endpoint, {"image_urls": urls}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class TestImageUploadEndpoint(APITestCase):
+    """POST /api/v1/tag/upload/ tags a multipart image upload."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="upload@example.com", password="testpass123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.endpoint = "/api/v1/tag/upload/"
+
+    def _png(self, size=(64, 48)):
+        out = io.BytesIO()
+        Image.new("RGB", size, (200, 30, 30)).save(out, format="PNG")
+        out.name = "shirt.png"
+        out.seek(0)
+        return out
+
+    def test_upload_is_spooled_hashed_and_tagged(self):
+        image = self._png()
+        with patch("fashion_tagger.views.generate_upload_tags", return_value={"english": {}}) as tag:
+            response = self.client.post(self.endpoint, {"image": image}, format="multipart")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["filename"], "shirt.png")
+        upload = tag.call_args.args[0]
+        self.assertEqual(upload.sha256, hashlib.sha256(image.getvalue()).hexdigest())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 1)
+
+    @override_settings(TAGGING_UPLOAD_MAX_BYTES=100)
+    def test_oversized_upload_is_rejected_without_charging_quota(self):
+        with patch("fashion_tagger.views.generate_upload_tags") as tag:
+            response = self.client.post(self.endpoint, {"image": self._png()}, format="multipart")
+
+        self.assertEqual(response.status_code, 413)
+        tag.assert_not_called()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 0)
+
+    def test_non_image_upload_is_rejected(self):
+        text = io.BytesIO(b"not an image at all")
+        text.name = "notes.txt"
+        response = self.client.post(self.endpoint, {"image": text}, format="multipart")
+        self.assertEqual(response.status_code, 400)
+
+    def test_handler_stops_reading_once_the_limit_is_crossed(self):
+        handler = SpooledImageUploadHandler(max_bytes=10, spool_bytes=4)
+        handler.new_file("image", "a.png", "image/png", None)
+        handler.receive_data_chunk(b"12345678", 0)
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(b"12345678", 8)
+        self.assertTrue(handler.too_large)
+
+
+# Both tag views side by side, whichever one USE_ASGI routes to /api/v1/tag/.
+urlpatterns = [
+    path("sync/tag/", ImageTagView.as_view()),
+    path("async/tag/", AsyncImageTagView.as_view()),
+    path("async/upload/", AsyncImageUploadTagView.as_view()),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class TestAsyncImageTagView(TestCase):
+    """AsyncImageTagView answers exactly like ImageTagView."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="async-tag@example.com", password="testpass123")
+        self.user.daily_tagging_limit = 100
+        self.user.save()
+        self.raw_key, _ = generate_api_key(self.user)
+        self.exhausted = User.objects.create_user(email="async-tag-exhausted@example.com", password="testpass123")
+        self.exhausted.daily_tagging_limit = self.exhausted.daily_tagging_count = 2
+        self.exhausted.daily_count_reset_at = timezone.now()
+        self.exhausted.save()
+        self.exhausted_key, _ = generate_api_key(self.exhausted)
+        tags = patch("fashion_tagger.views.generate_tags", return_value=TAGS)
+        atags = patch("fashion_tagger.views.agenerate_tags", return_value=TAGS)
+        tags.start()
+        atags.start()
+        self.addCleanup(patch.stopall)
+
+    def _sync_post(self, headers, data):
+        return self.client.post("/sync/tag/", data, content_type="application/json", headers=headers)
+
+    async def _both(self, headers, data=None):
+        data = {"image_url": "https://example.com/a.jpg"} if data is None else data
+        expected = await sync_to_async(self._sync_post)(headers, data)
+        response = await self.async_client.post(
+            "/async/tag/", data, content_type="application/json", headers=headers
+        )
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.json(), expected.json())
+        self.assertEqual(response.get("WWW-Authenticate"), expected.get("WWW-Authenticate"))
+        return response
+
+    async def test_missing_api_key(self):
+        response = await self._both({})
+        self.assertEqual(response.status_code, 403)
+
+    async def test_invalid_api_key(self):
+        response = await self._both({"Api-Key": "fk_live_not-a-real-key"})
+        self.assertEqual(response.json(), {"detail": "Invalid API key."})
+
+    async def test_valid_api_key(self):
+        response = await self._both({"Api-Key": self.raw_key})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"image_url": "https://example.com/a.jpg", "tags": TAGS})
+        await self.user.arefresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 2)
+
+    async def test_missing_image_url(self):
+        response = await self._both({"Api-Key": self.raw_key}, data={})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_exhausted_quota(self):
+        response = await self._both({"Api-Key": self.exhausted_key})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {"detail": "Daily tagging limit reached (2 requests per day)."})
+
+    @override_settings(TAGGING_UPLOAD_MAX_BYTES=100)
+    async def test_declared_oversized_upload_is_rejected_before_parsing(self):
+        body = io.BytesIO(os.urandom(80 * 1024))
+        body.name = "big.png"
+        with patch("rest_framework.parsers.MultiPartParser.parse") as parse:
+            response = await self.async_client.post(
+                "/async/upload/", {"image": body}, headers={"Api-Key": self.raw_key}
+            )
+
+        self.assertEqual(response.status_code, 413)
+        parse.assert_not_called()
+        await self.user.arefresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 0)
+
+
+class TestTagStreamEndpoint(APITestCase):
+    """POST /api/v1/tag/stream/ streams partial results as Server-Sent Events."""
+
+    def setUp(self):
+        usage.buffer.drain()  # events left unflushed by earlier tests
+        self.user = User.objects.create_user(email="stream@example.com", password="testpass123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.endpoint = "/api/v1/tag/stream/"
+
+    def _events(self, response):
+        body = b"".join(response.streaming_content).decode("utf-8")
+        events = []
+        for message in body.strip().split("\n\n"):
+            name, data = message.split("\n")
+            events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+        return events
+
+    def test_partial_results_are_streamed_in_order(self):
+        partial = [
+            ("serpapi", {"titles": ["Red dress"]}),
+            ("english", {"color": "red"}),
+            ("persian", {"color": "قرمز"}),
+            ("result", {"english": {"color": "red"}, "persian": {"color": "قرمز"}}),
+        ]
+        with patch("fashion_tagger.views.stream_tags", return_value=iter(partial)):
+            response = self.client.post(
+                self.endpoint, {"image_url": "https://example.com/a.jpg"}, format="json"
+            )
+            events = self._events(response)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream; charset=utf-8")
+        self.assertEqual(events, partial)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 1)
+
+    def test_pipeline_failure_ends_with_error_event(self):
+        def failing(image_url):
+            yield "english", {"color": "red"}
+            raise RuntimeError("boom")
+
+        with patch("fashion_tagger.views.stream_tags", side_effect=failing):
+            response = self.client.post(
+                self.endpoint, {"image_url": "https://example.com/a.jpg"}, format="json"
+            )
+            events = self._events(response)
+
+        self.assertEqual(
+            events,
+            [("english", {"color": "red"}), ("error", {"detail": "Tagging failed."})],
+        )
+        usage.flush()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 0)
+        self.assertEqual(
+            list(UsageLog.objects.filter(user=self.user).values_list("success", flat=True)), [False]
+        )
+
+    def test_charged_and_logged_only_when_the_stream_finishes(self):
+        partial = [("english", {"color": "red"}), ("result", {"english": {"color": "red"}, "persian": {}})]
+        with patch("fashion_tagger.views.stream_tags", return_value=iter(partial)):
+            response = self.client.post(
+                self.endpoint, {"image_url": "https://example.com/a.jpg"}, format="json"
+            )
+            self.user.refresh_from_db()
+            self.assertEqual(self.user.daily_tagging_count, 0)
+            self._events(response)
+
+        usage.flush()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 1)
+        self.assertEqual(
+            list(UsageLog.objects.filter(user=self.user).values_list("success", flat=True)), [True]
+        )
+
+    def test_over_limit_is_rejected_before_streaming(self):
+        self.user.daily_tagging_limit = 1
+        self.user.daily_tagging_count = 1
+        self.user.daily_count_reset_at = timezone.now()
+        self.user.save()
+
+        with patch("fashion_tagger.views.stream_tags") as stream:
+            response = self.client.post(
+                self.endpoint, {"image_url": "https://example.com/a.jpg"}, format="json"
+            )
+
+        self.assertEqual(response.status_code, 429)
+        stream.assert_not_called()
+
+    def test_missing_image_url_is_rejected_before_streaming(self):
+        response = self.client.post(self.endpoint, {}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class TestTaggingJobs(APITestCase):
+    """Asynchronous tagging jobs: submit, claim, run and poll."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="jobs@example.com", password="testpass123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_submit_returns_job_and_status_url(self):
+        response = self.client.post(
+            "/api/v1/tag/jobs/", {"image_url": "https://example.com/a.jpg"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["status"], TaggingJob.STATUS_QUEUED)
+        status_response = self.client.get(f"/api/v1/tag/jobs/{response.data['id']}/")
+        self.assertEqual(status_response.data["status"], TaggingJob.STATUS_QUEUED)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.daily_tagging_count, 1)
+
+    def test_claims_are_exclusive_and_oldest_first(self):
+        submitted = [jobs.submit(self.user, f"https://example.com/{i}.jpg") for i in range(3)]
+
+        first = jobs.claim("worker-a", 2)
+        second = jobs.claim("worker-b", 2)
+
+        self.assertEqual([job.id for job in first], [job.id for job in submitted[:2]])
+        self.assertEqual([job.id for job in second], [submitted[2].id])
+        self.assertEqual(jobs.claim("worker-c", 2), [])
+
+    def test_run_job_records_result(self):
+        job = jobs.submit(self.user, "https://example.com/a.jpg")
+        jobs.claim("worker-a", 1)
+        with patch("fashion_tagger.services.jobs.tag_image", return_value={"english": {}, "persian": {}}):
+            jobs.run_job(job.id)
+
+        response = self.client.get(f"/api/v1/tag/jobs/{job.id}/")
+        self.assertEqual(response.data["status"], TaggingJob.STATUS_SUCCEEDED)
+        self.assertEqual(response.data["result"], {"english": {}, "persian": {}})
+
+    @override_settings(TAGGING_JOB_LEASE=60, TAGGING_JOB_MAX_ATTEMPTS=2)
+    def test_abandoned_job_is_reclaimed_then_failed(self):
+        job = jobs.submit(self.user, "https://example.com/a.jpg")
+        jobs.claim("worker-a", 1)
+        expired = timezone.now() - timedelta(seconds=120)
+        TaggingJob.objects.filter(pk=job.pk).update(started_at=expired)
+
+        self.assertEqual([j.id for j in jobs.claim("worker-b", 1)], [job.id])
+        TaggingJob.objects.filter(pk=job.pk).update(started_at=expired)
+        self.assertEqual(jobs.claim("worker-c", 1), [])
+        self.assertEqual(jobs.fail_exhausted(), 1)
+
+    def test_other_users_job_is_not_visible(self):
+        job = jobs.submit(self.user, "https://example.com/a.jpg")
+        other = User.objects.create_user(email="other@example.com", password="testpass123")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f"/api/v1/tag/jobs/{job.id}/").status_code, 404)
+
+
+class _WebhookReceiver(QuietHandler):
+    """Records webhook POSTs; answers 500 while ``failures`` is positive."""
+    received = []
+    signed = []
+    failures = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        cls = type(self)
+        if cls.failures > 0:
+            cls.failures -= 1
+            status = 500
+        else:
+            cls.received.append(json.loads(body))
+            cls.signed.append((body, self.headers.get("X-Webhook-Signature")))
+            status = 204
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+@patch.object(url_guard, "OUTBOUND_ALLOW_PRIVATE_HOSTS", True)
+@override_settings(TAGGING_WEBHOOK_COALESCE_WINDOW=0, TAGGING_WEBHOOK_RETRY_BASE=0)
+class TestWebhookDelivery(LocalHTTPServerMixin, APITestCase):
+    """Finished job results are POSTed to callback URLs from the outbox."""
+    handler_class = _WebhookReceiver
+
+    def setUp(self):
+        metrics.reset()
+        _WebhookReceiver.received = []
+        _WebhookReceiver.signed = []
+        _WebhookReceiver.failures = 0
+        self.user = User.objects.create_user(email="hooks@example.com", password="testpass123")
+        self.callback_url = f"{self.server_url}/hook"
+
+    def _finish_jobs(self, count):
+        submitted = jobs.submit_many(
+            self.user, [f"https://example.com/{i}.jpg" for i in range(count)], self.callback_url
+        )
+        jobs.claim("worker-a", count)
+        with patch("fashion_tagger.services.jobs.tag_image", return_value={"english": {}, "persian": {}}):
+            for job in submitted:
+                jobs.run_job(job.id)
+        return submitted
+
+    def test_results_for_one_url_are_coalesced(self):
+        submitted = self._finish_jobs(3)
+
+        self.assertEqual(webhooks.dispatch_due(), 1)
+
+        self.assertEqual(len(_WebhookReceiver.received), 1)
+        results = _WebhookReceiver.received[0]["results"]
+        self.assertEqual({r["job_id"] for r in results}, {str(job.id) for job in submitted})
+        self.assertEqual(results[0]["tags"], {"english": {}, "persian": {}})
+        self.assertEqual(metrics.total("webhook_results_delivered_total"), 3)
+        self.assertEqual(metrics.histogram("webhook_delivery_latency_seconds")["count"], 3)
+
+    @override_settings(TAGGING_WEBHOOK_SECRET="hook-secret")
+    def test_body_is_signed_with_the_secret(self):
+        self._finish_jobs(1)
+        webhooks.dispatch_due()
+
+        ((body, signature),) = _WebhookReceiver.signed
+        expected = hmac.new(b"hook-secret", body, hashlib.sha256).hexdigest()
+        self.assertEqual(signature, f"sha256={expected}")
+
+    def test_private_callback_url_is_not_posted_to(self):
+        self._finish_jobs(1)
+        with patch.object(url_guard, "OUTBOUND_ALLOW_PRIVATE_HOSTS", False):
+            self.assertEqual(webhooks.dispatch_due(), 0)
+
+        row = WebhookDelivery.objects.get()
+        self.assertEqual((row.status, row.attempts), (WebhookDelivery.STATUS_FAILED, 1))
+        self.assertIn("non-public address", row.last_error)
+        self.assertEqual(_WebhookReceiver.received, [])
+
+    def test_failed_delivery_is_retried(self):
+        self._finish_jobs(1)
+        _WebhookReceiver.failures = 1
+
+        webhooks.dispatch_due()
+        row = WebhookDelivery.objects.get()
+        self.assertEqual((row.status, row.attempts, row.last_error), ("pending", 1, "HTTP 500"))
+
+        webhooks.dispatch_due()
+        row.refresh_from_db()
+        self.assertEqual(row.status, WebhookDelivery.STATUS_DELIVERED)
+        self.assertEqual(len(_WebhookReceiver.received), 1)
+        self.assertEqual(metrics.get("webhook_deliveries_total", outcome="failed"), 1)
+
+    @override_settings(TAGGING_WEBHOOK_MAX_BATCH=1)
+    def test_lease_is_renewed_and_lost_rows_are_not_posted(self):
+        self._finish_jobs(2)
+        sent = []
+
+        def post(callback_url, batch):
+            (row,) = batch
+            sent.append(row.pk)
+            self.assertGreater(WebhookDelivery.objects.get(pk=row.pk).next_attempt_at, timezone.now())
+            # Another dispatcher takes over the rows not sent yet.
+            WebhookDelivery.objects.exclude(pk=row.pk).update(next_attempt_at=timezone.now())
+            return ""
+
+        with patch.object(webhooks, "_post", side_effect=post):
+            self.assertEqual(webhooks.dispatch_due(), 1)
+
+        other = WebhookDelivery.objects.exclude(pk__in=sent).get()
+        self.assertEqual((other.status, other.attempts), (WebhookDelivery.STATUS_PENDING, 0))
+
+    @override_settings(TAGGING_WEBHOOK_MAX_ATTEMPTS=2)
+    def test_delivery_gives_up_after_max_attempts(self):
+        self._finish_jobs(1)
+        _WebhookReceiver.failures = 2
+
+        webhooks.dispatch_due()
+        webhooks.dispatch_due()
+
+        self.assertEqual(WebhookDelivery.objects.get().status, WebhookDelivery.STATUS_FAILED)
+        self.assertEqual(metrics.total("webhook_results_failed_total"), 1)
@@ -0,0 +1,66 @@
+"""Streaming upload handling for the image upload endpoint.
+
+Multipart bodies are written chunk by chunk to a ``SpooledTemporaryFile``
+(kept in memory up to ``TAGGING_UPLOAD_SPOOL_BYTES``, then on disk), with
+the SHA-256 computed on the way in, so the upload is never held in memory
+as one ``bytes`` object. Files over ``TAGGING_UPLOAD_MAX_BYTES`` stop the
+upload as soon as the limit is crossed.
+"""
+
+import hashlib
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+
+class HashedUploadedFile(UploadedFile):
+    """Uploaded file backed by a spooled temp file, with its SHA-256."""
+
+    def __init__(self, file, name, content_type, size, charset, content_type_extra=None, sha256=""):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = sha256
+
+
+class SpooledImageUploadHandler(FileUploadHandler):
+    """Spool uploads to a temp file and enforce a byte limit.
+
+    After parsing, ``too_large`` tells the view whether a file was dropped
+    for exceeding ``max_bytes``.
+    """
+
+    def __init__(self, request=None, max_bytes=None, spool_bytes=None):
+        super().__init__(request)
+        self.max_bytes = settings.TAGGING_UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+        self.spool_bytes = settings.TAGGING_UPLOAD_SPOOL_BYTES if spool_bytes is None else spool_bytes
+        self.too_large = False
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes, suffix=".upload")
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > self.max_bytes:
+            self.too_large = True
+            self.file.close()
+            # Do not read the rest of an oversized body.
+            raise StopUpload(connection_reset=True)
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        return HashedUploadedFile(
+            file=self.file,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            sha256=self.hasher.hexdigest(),
+        )
@@ -1,7 +1,40 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import ImageTagView
+from .views import (
+    AsyncBatchImageTagView,
+    AsyncImageTagStreamView,
+    AsyncImageTagView,
+    AsyncImageUploadTagView,
+    BatchImageTagView,
+    ImageTagStreamView,
+    ImageTagView,
+    ImageUploadTagView,
+    TaggingJobDetailView,
+    TaggingJobSubmitView,
+)
 
 urlpatterns = [
-    path("tag/", ImageTagView.as_view(), name="image-tag"),
+    path(
+        "tag/",
+        (AsyncImageTagView if settings.USE_ASGI else ImageTagView).as_view(),
+        name="image-tag",
+    ),
+    path(
+        "tag/upload/",
+        (AsyncImageUploadTagView if settings.USE_ASGI else ImageUploadTagView).as_view(),
+        name="image-tag-upload",
+    ),
+    path(
+        "tag/stream/",
+        (AsyncImageTagStreamView if settings.USE_ASGI else ImageTagStreamView).as_view(),
+        name="image-tag-stream",
+    ),
+    path(
+        "tag/batch/",
+        (AsyncBatchImageTagView if settings.USE_ASGI else BatchImageTagView).as_view(),
+        name="image-tag-batch",
+    ),
+    path("tag/jobs/", TaggingJobSubmitView.as_view(), name="tagging-job-submit"),
+    path("tag/jobs/<uuid:job_id>/", TaggingJobDetailView.as_view(), name="tagging-job-detail"),
 ]
@@ -1,5 +1,17 @@
-from django.utils import timezone
-from rest_framework import status
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
@@ -9,8 +21,127 @@ from accounts.authentication import (
     CsrfExemptSessionAuthentication,
     DailyLimitChecker,
 )
-from accounts.models import UsageLog
-from .services.tagger import generate_tags
+from accounts.services import usage
+from .models import TaggingJob
+from .renderers import EventStreamRenderer, format_sse
+from .serializers import BatchTagSerializer, TaggingJobCreateSerializer, TaggingJobSerializer
+from .services import jobs
+from .services.langgraph_integration.image_fetch import ImageFetchError, sniff_image_type
+from .services.tagger import (
+    agenerate_tags,
+    agenerate_upload_tags,
+    astream_tags,
+    atag_batch,
+    generate_tags,
+    generate_upload_tags,
+    stream_tags,
+    tag_batch,
+)
+from .uploads import SpooledImageUploadHandler
+
+logger = logging.getLogger(__name__)
+
+
+def _event_stream_response(events) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(events, content_type="text/event-stream; charset=utf-8")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # let nginx pass events through unbuffered
+    return response
+
+
+def _stream_events(image_url, finish):
+    """SSE messages for ``stream_tags``; ``finish(success)`` runs when the stream ends."""
+    success = False
+    try:
+        for event, data in stream_tags(image_url):
+            success = success or event == "result"
+            yield format_sse(event, data)
+    except ImageFetchError as e:
+        logger.warning("Could not fetch %s for streaming: %s", image_url, e)
+        yield format_sse("error", {"detail": e.public_message})
+    except Exception as e:
+        logger.error("Error while streaming tags for %s: %s", image_url, e, exc_info=True)
+        yield format_sse("error", {"detail": "Tagging failed."})
+    finally:
+        finish(success)
+
+
+async def _astream_events(image_url, finish):
+    """Async variant of ``_stream_events``; ``finish`` is a coroutine function."""
+    success = False
+    try:
+        async for event, data in astream_tags(image_url):
+            success = success or event == "result"
+            yield format_sse(event, data)
+    except ImageFetchError as e:
+        logger.warning("Could not fetch %s for streaming: %s", image_url, e)
+        yield format_sse("error", {"detail": e.public_message})
+    except Exception as e:
+        logger.error("Error while streaming tags for %s: %s", image_url, e, exc_info=True)
+        yield format_sse("error", {"detail": "Tagging failed."})
+    finally:
+        await finish(success)
+
+
+def _charge_finished_stream(user) -> None:
+    try:
+        DailyLimitChecker.check_and_increment(user)
+    except exceptions.Throttled:
+        # Streams that finished first used up the quota; this result is already sent.
+        logger.warning("User %s went over the daily limit with a streamed tagging", user.pk)
+
+
+# Multipart boundaries and headers on top of the file itself.
+_UPLOAD_OVERHEAD_BYTES = 64 * 1024
+
+
+def _declared_upload_too_large(request) -> bool:
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return False
+    return length > settings.TAGGING_UPLOAD_MAX_BYTES + _UPLOAD_OVERHEAD_BYTES
+
+
+def _upload_error(upload, handler):
+    """Return ``(detail, status)`` if the parsed upload cannot be tagged."""
+    if handler.too_large:
+        return (
+            f"Image exceeds the {settings.TAGGING_UPLOAD_MAX_BYTES} byte upload limit.",
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+    if upload is None:
+        return "image file is required.", status.HTTP_400_BAD_REQUEST
+    header = upload.file.read(32)
+    upload.file.seek(0)
+    if not sniff_image_type(header):
+        return "Uploaded file is not a supported image.", status.HTTP_400_BAD_REQUEST
+    return None
+
+
+def _job_data(request, job):
+    data = TaggingJobSerializer(job).data
+    data["status_url"] = request.build_absolute_uri(
+        reverse("tagging-job-detail", kwargs={"job_id": job.id})
+    )
+    return data
+
+
+def _queued_batch_response_data(request, queued):
+    return {
+        "count": len(queued),
+        "jobs": [_job_data(request, job) for job in queued],
+    }
+
+
+def _batch_response_data(results):
+    failed = sum(1 for item in results if "error" in item)
+    return {
+        "count": len(results),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "results": results,
+    }
 
 
 class ImageTagView(APIView):
@@ -56,10 +187,371 @@ class ImageTagView(APIView):
         )
 
     def _log_usage(self, user, endpoint: str, success: bool):
-        """Log usage for analytics."""
-        UsageLog.objects.create(
-            user=user,
-            used_at=timezone.now(),
-            endpoint=endpoint,
-            success=success
+        """Log usage for analytics (buffered, see accounts.services.usage)."""
+        usage.record(user, endpoint, success)
+
+
+class ImageUploadTagView(ImageTagView):
+    """Tag an image sent as a multipart upload (file field ``image``).
+    
+    The body is streamed to a spooled temp file capped at
+    ``TAGGING_UPLOAD_MAX_BYTES``, and the image is downscaled straight from
+    that file before it reaches the pipeline. Same authentication and
+    daily limit as ImageTagView.
+    """
+    parser_classes = [MultiPartParser]
+
+    def initialize_request(self, request, *args, **kwargs):
+        self.upload_handler = SpooledImageUploadHandler(request)
+        request.upload_handlers = [self.upload_handler]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def post(self, request):
+        if _declared_upload_too_large(request):
+            self.upload_handler.too_large = True
+            upload = None
+        else:
+            upload = request.FILES.get("image")
+
+        error = _upload_error(upload, self.upload_handler)
+        if error:
+            self._log_usage(request.user, request.path, success=False)
+            detail, error_status = error
+            return Response({"detail": detail}, status=error_status)
+
+        try:
+            DailyLimitChecker.check_and_increment(request.user)
+        except Exception:
+            self._log_usage(request.user, request.path, success=False)
+            raise
+
+        tags = generate_upload_tags(upload)
+
+        self._log_usage(request.user, request.path, success=True)
+
+        return Response(
+            {"filename": upload.name, "size": upload.size, "tags": tags},
+            status=status.HTTP_200_OK
+        )
+
+
+class ImageTagStreamView(ImageTagView):
+    """Tag an image and stream partial results as Server-Sent Events.
+
+    Same request, authentication and daily limit as ImageTagView. Emits
+    ``english``, ``serpapi`` and ``persian`` events as the pipeline nodes
+    finish, then ``result`` with the full ``{"english", "persian"}`` tags,
+    or ``error`` if the pipeline fails.
+
+    The limit is checked before streaming, but the request is only charged
+    and logged as a success once ``result`` has been sent, so concurrent
+    streams can overshoot the limit by the streams in flight.
+    """
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def post(self, request):
+        image_url = request.data.get("image_url")
+
+        if not image_url:
+            self._log_usage(request.user, request.path, success=False)
+            return Response(
+                {"detail": "image_url is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            DailyLimitChecker.check_remaining(request.user)
+        except Exception:
+            self._log_usage(request.user, request.path, success=False)
+            raise
+
+        def finish(success):
+            if success:
+                _charge_finished_stream(request.user)
+            self._log_usage(request.user, request.path, success=success)
+
+        return _event_stream_response(_stream_events(image_url, finish))
+
+
+class BatchImageTagView(ImageTagView):
+    """Tag a list of images in one request.
+    
+    Authentication, the daily-limit charge (one unit per URL, all or
+    nothing) and usage logging happen once for the whole batch. Items run
+    through the pipeline concurrently (``TAGGING_BATCH_CONCURRENCY``) and
+    come back in input order, each with either ``tags`` or an ``error``.
+    
+    With a ``callback_url`` the items are queued as tagging jobs instead
+    (202), and their results are POSTed to the callback as they finish.
+    """
+
+    def post(self, request):
+        serializer = BatchTagSerializer(data=request.data)
+        if not serializer.is_valid():
+            self._log_usage(request.user, request.path, success=False)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        image_urls = serializer.validated_data["image_urls"]
+
+        try:
+            DailyLimitChecker.check_and_increment(request.user, count=len(image_urls))
+        except Exception:
+            self._log_usage(request.user, request.path, success=False)
+            raise
+
+        callback_url = serializer.validated_data.get("callback_url")
+        if callback_url:
+            queued = jobs.submit_many(request.user, image_urls, callback_url)
+            self._log_usage(request.user, request.path, success=True)
+            return Response(
+                _queued_batch_response_data(request, queued),
+                status=status.HTTP_202_ACCEPTED
+            )
+
+        results = tag_batch(image_urls, concurrency=settings.TAGGING_BATCH_CONCURRENCY)
+
+        self._log_usage(request.user, request.path, success=True)
+
+        return Response(_batch_response_data(results), status=status.HTTP_200_OK)
+
+
+class TaggingJobSubmitView(ImageTagView):
+    """Queue an image for tagging and return immediately.
+    
+    Same request body, authentication and daily limit as ImageTagView, but
+    the pipeline runs in ``manage.py tagging_worker``; poll the returned
+    ``status_url`` for the result, or pass a ``callback_url`` to have it
+    POSTed there.
+    """
+
+    def post(self, request):
+        serializer = TaggingJobCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            self._log_usage(request.user, request.path, success=False)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            DailyLimitChecker.check_and_increment(request.user)
+        except Exception:
+            self._log_usage(request.user, request.path, success=False)
+            raise
+
+        job = jobs.submit(
+            request.user,
+            serializer.validated_data["image_url"],
+            serializer.validated_data.get("callback_url", ""),
+        )
+
+        self._log_usage(request.user, request.path, success=True)
+
+        return Response(_job_data(request, job), status=status.HTTP_202_ACCEPTED)
+
+
+class TaggingJobDetailView(APIView):
+    """Status (and, once finished, result) of one of the user's jobs."""
+    authentication_classes = ImageTagView.authentication_classes
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(TaggingJob, pk=job_id, user=request.user)
+        return Response(TaggingJobSerializer(job).data)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncImageTagView(View):
+    """Async variant of ImageTagView for ASGI deployments.
+    
+    Same request/response contract as ImageTagView. Authentication, the
+    daily limit and usage logging run in worker threads; the LangGraph
+    pipeline is awaited on the event loop, so a single worker can serve
+    many in-flight taggings.
+    """
+    authentication_classes = ImageTagView.authentication_classes
+    permission_classes = ImageTagView.permission_classes
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
+
+    async def post(self, request):
+        try:
+            drf_request = await sync_to_async(self._initialize_request)(request)
+        except exceptions.APIException as exc:
+            return self._error_response(exc)
+
+        user = drf_request.user
+        image_url = drf_request.data.get("image_url")
+
+        if not image_url:
+            await self._alog_usage(user, request.path, success=False)
+            return self._json_response(
+                {"detail": "image_url is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            await DailyLimitChecker.acheck_and_increment(user)
+        except exceptions.APIException as exc:
+            await self._alog_usage(user, request.path, success=False)
+            return self._error_response(exc)
+
+        tags = await agenerate_tags(image_url)
+
+        await self._alog_usage(user, request.path, success=True)
+
+        return self._json_response(
+            {"image_url": image_url, "tags": tags},
+            status=status.HTTP_200_OK
+        )
+
+    def _json_response(self, data, status: int) -> JsonResponse:
+        # Keep Persian tags readable, like DRF's JSONRenderer does
+        return JsonResponse(data, status=status, json_dumps_params={"ensure_ascii": False})
+
+    def _initialize_request(self, request, parse=True) -> Request:
+        """Authenticate, check permissions and, if ``parse``, parse the body (blocking)."""
+        drf_request = Request(
+            request,
+            parsers=[parser() for parser in self.parser_classes],
+            authenticators=[auth() for auth in self.authentication_classes],
+        )
+        for permission in (perm() for perm in self.permission_classes):
+            if not permission.has_permission(drf_request, self):
+                if not drf_request.successful_authenticator:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied()
+        if parse:
+            drf_request.data  # parse while still off the event loop
+        return drf_request
+
+    def _error_response(self, exc: exceptions.APIException) -> JsonResponse:
+        """Mirror DRF's handle_exception() so both views answer alike."""
+        response = self._json_response({"detail": exc.detail}, status=exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            auth_header = self.authentication_classes[0]().authenticate_header(None)
+            if auth_header:
+                response["WWW-Authenticate"] = auth_header
+            else:
+                response.status_code = status.HTTP_403_FORBIDDEN
+        if getattr(exc, "wait", None):
+            response["Retry-After"] = str(int(exc.wait))
+        return response
+
+    async def _alog_usage(self, user, endpoint: str, success: bool):
+        """Log usage for analytics without blocking the event loop.
+
+        ``usage.record`` only appends to the in-memory buffer; the database
+        write happens on the buffer's thread.
+        """
+        usage.record(user, endpoint, success)
+
+
+class AsyncBatchImageTagView(AsyncImageTagView):
+    """Async variant of BatchImageTagView for ASGI deployments."""
+
+    async def post(self, request):
+        try:
+            drf_request = await sync_to_async(self._initialize_request)(request)
+        except exceptions.APIException as exc:
+            return self._error_response(exc)
+
+        user = drf_request.user
+        serializer = BatchTagSerializer(data=drf_request.data)
+        if not serializer.is_valid():
+            await self._alog_usage(user, request.path, success=False)
+            return self._json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        image_urls = serializer.validated_data["image_urls"]
+
+        try:
+            await DailyLimitChecker.acheck_and_increment(user, count=len(image_urls))
+        except exceptions.APIException as exc:
+            await self._alog_usage(user, request.path, success=False)
+            return self._error_response(exc)
+
+        callback_url = serializer.validated_data.get("callback_url")
+        if callback_url:
+            queued = await sync_to_async(jobs.submit_many)(user, image_urls, callback_url)
+            await self._alog_usage(user, request.path, success=True)
+            return self._json_response(
+                _queued_batch_response_data(drf_request, queued),
+                status=status.HTTP_202_ACCEPTED
+            )
+
+        results = await atag_batch(image_urls, concurrency=settings.TAGGING_BATCH_CONCURRENCY)
+
+        await self._alog_usage(user, request.path, success=True)
+
+        return self._json_response(_batch_response_data(results), status=status.HTTP_200_OK)
+
+
+class AsyncImageTagStreamView(AsyncImageTagView):
+    """Async variant of ImageTagStreamView for ASGI deployments; charged when the stream ends."""
+
+    async def post(self, request):
+        try:
+            drf_request = await sync_to_async(self._initialize_request)(request)
+        except exceptions.APIException as exc:
+            return self._error_response(exc)
+
+        user = drf_request.user
+        image_url = drf_request.data.get("image_url")
+
+        if not image_url:
+            await self._alog_usage(user, request.path, success=False)
+            return self._json_response(
+                {"detail": "image_url is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            await DailyLimitChecker.acheck_remaining(user)
+        except exceptions.APIException as exc:
+            await self._alog_usage(user, request.path, success=False)
+            return self._error_response(exc)
+
+        async def finish(success):
+            if success:
+                await sync_to_async(_charge_finished_stream)(user)
+            await self._alog_usage(user, request.path, success=success)
+
+        return _event_stream_response(_astream_events(image_url, finish))
+
+
+class AsyncImageUploadTagView(AsyncImageTagView):
+    """Async variant of ImageUploadTagView for ASGI deployments."""
+    parser_classes = [MultiPartParser]
+
+    async def post(self, request):
+        # The ASGI handler has already spooled the body; the handler still
+        # enforces the size limit while the multipart parser copies it.
+        self.upload_handler = SpooledImageUploadHandler(request)
+        request.upload_handlers = [self.upload_handler]
+        too_large = _declared_upload_too_large(request)
+        try:
+            drf_request = await sync_to_async(self._initialize_request)(request, parse=not too_large)
+        except exceptions.APIException as exc:
+            return self._error_response(exc)
+
+        user = drf_request.user
+        if too_large:
+            self.upload_handler.too_large = True
+            upload = None
+        else:
+            upload = drf_request.FILES.get("image")
+
+        error = await sync_to_async(_upload_error)(upload, self.upload_handler)
+        if error:
+            await self._alog_usage(user, request.path, success=False)
+            detail, error_status = error
+            return self._json_response({"detail": detail}, status=error_status)
+
+        try:
+            await DailyLimitChecker.acheck_and_increment(user)
+        except exceptions.APIException as exc:
+            await self._alog_usage(user, request.path, success=False)
+            return self._error_response(exc)
+
+        tags = await agenerate_upload_tags(upload)
+
+        await self._alog_usage(user, request.path, success=True)
+
+        return self._json_response(
+            {"filename": upload.name, "size": upload.size, "tags": tags},
+            status=status.HTTP_200_OK
         )
@@ -0,0 +1,88 @@
+"""Gunicorn configuration.
+
+Picked up automatically from the working directory. Command-line flags
+(Dockerfile, Procfile) still take precedence over the values below.
+
+Set USE_ASGI=true to serve ``backend.asgi`` with uvicorn workers, which
+also routes the tagging endpoint to its async view (see settings.USE_ASGI).
+"""
+
+import logging
+import os
+
+logger = logging.getLogger("gunicorn.error")
+
+if os.getenv("USE_ASGI", "False").lower() == "true":
+    wsgi_app = "backend.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "backend.wsgi:application"
+    worker_class = "sync"
+
+
+def on_starting(server):
+    """Drop metrics files left by workers of a previous server run."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    from django.conf import settings
+
+    from common import metrics
+
+    metrics.clear_published(settings.METRICS_DIR)
+
+
+def post_worker_init(worker):
+    """Prepare per-process resources before the worker accepts requests."""
+    from django.conf import settings
+
+    from common import metrics
+
+    metrics.start_publisher(settings.METRICS_DIR, settings.METRICS_PUBLISH_INTERVAL)
+
+    try:
+        from fashion_tagger.services.langgraph_integration.langgraph_service import (
+            warm_up_workflows,
+        )
+
+        warm_up_workflows()
+    except Exception:
+        logger.exception("LangGraph workflow warm-up failed; compiling lazily")
+
+    from fashion_tagger.services.langgraph_integration import http_pool
+    from fashion_tagger.services.langgraph_integration.config import HTTP_POOL_WARMUP
+
+    if HTTP_POOL_WARMUP:
+        http_pool.warm_up()
+
+
+def worker_exit(server, worker):
+    """Release per-process resources when the worker shuts down."""
+    from fashion_tagger.services.langgraph_integration import preprocess
+
+    preprocess.shutdown_executor()
+
+    from django.conf import settings
+
+    from accounts.services import usage
+    from accounts.services.api_key import last_used
+
+    for name, writer in (("API key last_used_at", last_used), ("usage log", usage.buffer)):
+        try:
+            writer.close()
+        except Exception:
+            logger.exception("Flushing %s on worker exit failed", name)
+
+    if settings.TAGGING_LOCAL_QUOTA_ENABLED:
+        from api_gateway.throttling import local_quota
+
+        try:
+            local_quota().flush()
+        except Exception:
+            logger.exception("Flushing local quota charges on worker exit failed")
+
+    if settings.METRICS_DIR:
+        from common import metrics
+
+        try:
+            metrics.publish(settings.METRICS_DIR)
+        except OSError:
+            logger.exception("Publishing metrics on worker exit failed")
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from logs.services import archive, partitions, rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the coming months' UsageLog partitions, then archive months older "
+        "than the retention window to gzipped JSONL and delete them. Run it daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention-days", type=int, default=settings.USAGE_LOG_RETENTION_DAYS,
+            help="Archive months that ended more than this many days ago.",
+        )
+        parser.add_argument(
+            "--months-ahead", type=int, default=settings.USAGE_LOG_PARTITIONS_AHEAD,
+            help="Months of partitions to create ahead of time (PostgreSQL).",
+        )
+
+    def handle(self, *args, **options):
+        for name in partitions.ensure_partitions(options["months_ahead"]):
+            self.stdout.write(f"Created partition {name}")
+        # Only rolled-up months are archived; fold whatever is settled first.
+        rollups.roll_up()
+        archived = archive.archive(options["retention_days"])
+        self.stdout.write(f"Archived {archived} usage events to {settings.USAGE_ARCHIVE_DIR}")
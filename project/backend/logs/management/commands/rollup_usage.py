@@ -0,0 +1,55 @@
+import logging
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+from logs.services import rollups
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Fold new UsageLog rows into the daily usage rollups."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=settings.USAGE_ROLLUP_INTERVAL,
+            help="Seconds between runs.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.USAGE_ROLLUP_BATCH,
+            help="UsageLog rows folded per transaction.",
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Roll up once and exit instead of running forever.",
+        )
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            # Two passes: the first settles the newest ids, the second folds them.
+            folded = rollups.roll_up(options["batch_size"]) + rollups.roll_up(options["batch_size"])
+            self.stdout.write(f"Rolled up {folded} usage events")
+            return
+
+        self._stopping = threading.Event()
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        self.stdout.write(f"Usage rollup started (every {options['interval']}s)")
+        while not self._stopping.is_set():
+            try:
+                folded = rollups.roll_up(options["batch_size"])
+            except DatabaseError:
+                logger.exception("Usage rollup failed")
+                connection.close()
+            else:
+                if folded:
+                    logger.info("Rolled up %s usage events", folded)
+            self._stopping.wait(options["interval"])
+        self.stdout.write("Usage rollup stopped")
+
+    def _stop(self, signum, frame):
+        self._stopping.set()
@@ -0,0 +1,98 @@
+# Generated migration for the monthly UsageLog partitions
+
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import migrations
+
+TABLE = "accounts_usagelog"
+MONTHS_AHEAD = 3
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _utc(month):
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def _rebuild(schema_editor, partitioned):
+    """Copy the table into a new one, partitioned by month or not, keeping ids and indexes.
+
+    PostgreSQL only; other databases keep the plain table.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    new = f"{TABLE}_new"
+    with schema_editor.connection.cursor() as cursor:
+        # Writers would otherwise insert rows the copy below never sees.
+        cursor.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+            [TABLE, f"{TABLE}_pkey"],
+        )
+        indexes = [indexdef for (indexdef,) in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f"SELECT MIN(used_at), MAX(id) FROM {TABLE}")
+        oldest, last_id = cursor.fetchone()
+
+        if partitioned:
+            # The partition key has to be part of the primary key.
+            cursor.execute(f"CREATE TABLE {new} (LIKE {TABLE}) PARTITION BY RANGE (used_at)")
+            cursor.execute(f"ALTER TABLE {new} ADD CONSTRAINT {new}_pkey PRIMARY KEY (id, used_at)")
+            now = datetime.now(dt_timezone.utc)
+            month = date((oldest or now).year, (oldest or now).month, 1)
+            last = date(now.year, now.month, 1)
+            for _ in range(MONTHS_AHEAD):
+                last = _next_month(last)
+            while month <= last:
+                cursor.execute(
+                    f"CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {new} FOR VALUES FROM (%s) TO (%s)",
+                    [_utc(month), _utc(_next_month(month))],
+                )
+                month = _next_month(month)
+            cursor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {new} DEFAULT")
+        else:
+            cursor.execute(f"CREATE TABLE {new} (LIKE {TABLE})")
+            cursor.execute(f"ALTER TABLE {new} ADD CONSTRAINT {new}_pkey PRIMARY KEY (id)")
+        cursor.execute(f"INSERT INTO {new} SELECT * FROM {TABLE}")
+
+        # The old id sequence belongs to the old table; give the new one its own.
+        cursor.execute(f"CREATE SEQUENCE {new}_id_seq")
+        if last_id is not None:
+            cursor.execute(f"SELECT setval('{new}_id_seq', %s)", [last_id])
+        cursor.execute(f"DROP TABLE {TABLE}")
+        cursor.execute(f"ALTER TABLE {new} RENAME TO {TABLE}")
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME CONSTRAINT {new}_pkey TO {TABLE}_pkey")
+        cursor.execute(f"ALTER SEQUENCE {new}_id_seq RENAME TO {TABLE}_id_seq")
+        cursor.execute(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+        for indexdef in indexes:
+            cursor.execute(indexdef)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+
+
+def partition(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=True)
+
+
+def unpartition(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_usagelog_user_used_at_id'),
+        ('logs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
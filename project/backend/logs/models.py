@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.db import models
+
+
+class UsageRollup(models.Model):
+    """``UsageLog`` counts per user, UTC day, endpoint and outcome.
+
+    Maintained incrementally by ``logs.services.rollups.roll_up``.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="usage_rollups")
+    day = models.DateField()
+    endpoint = models.CharField(max_length=255)
+    success = models.BooleanField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "day", "endpoint", "success"],
+                name="unique_usage_rollup",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day} {self.endpoint} success={self.success}: {self.count}"
+
+
+class RollupWatermark(models.Model):
+    """How far a rollup has read its source table, by primary key."""
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0, help_text="Rows with id <= last_id are rolled up")
+    settled_id = models.BigIntegerField(
+        default=0, help_text="Highest id seen by the previous run; rolled up by the next one"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
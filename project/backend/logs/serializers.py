@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers
+
+from accounts.models import UsageLog
+
+
+class UsageHistoryQuerySerializer(serializers.Serializer):
+    """``start`` and ``end`` (inclusive UTC days); the last 30 days by default."""
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        end = attrs.get("end") or timezone.now().date()
+        start = attrs.get("start") or end - timedelta(days=29)
+        if start > end:
+            raise serializers.ValidationError("start must not be after end.")
+        max_days = settings.USAGE_HISTORY_MAX_DAYS
+        if (end - start).days + 1 > max_days:
+            raise serializers.ValidationError(f"At most {max_days} days per request.")
+        return {"start": start, "end": end}
+
+
+class UsageEventsQuerySerializer(serializers.Serializer):
+    cursor = serializers.CharField(required=False, allow_blank=True)
+    limit = serializers.IntegerField(required=False, min_value=1)
+
+    def validate_limit(self, value):
+        return min(value, settings.USAGE_HISTORY_MAX_PAGE_SIZE)
+
+
+class UsageEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UsageLog
+        fields = ['id', 'used_at', 'endpoint', 'success']
+        read_only_fields = fields
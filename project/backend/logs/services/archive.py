@@ -0,0 +1,151 @@
+"""Retention for ``UsageLog``: archive old months to gzipped JSONL, then delete them.
+
+A month is archived once it ended more than ``USAGE_LOG_RETENTION_DAYS``
+ago. Each archive is one file in ``USAGE_ARCHIVE_DIR``, named
+``usagelog-<YYYY-MM>-<last id>.jsonl.gz``, with one JSON object per event.
+The file is written and fsynced under a temporary name and renamed before
+any row is deleted.
+
+On a partitioned table (``logs.services.partitions``) a month's partition
+is detached, archived and dropped. Old rows left in the default partition,
+and every old row on other databases, are archived month by month and
+deleted with one ``DELETE``.
+
+A month is only archived once ``roll_up()`` has folded all of its rows, so
+``UsageRollup`` still counts every archived event.
+"""
+
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+from accounts.models import UsageLog
+from common import metrics
+from logs.services import partitions, rollups
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("id", "user_id", "used_at", "endpoint", "success")
+_CHUNK = 2000
+
+
+def archive_path(month: date, last_id: int) -> str:
+    return os.path.join(settings.USAGE_ARCHIVE_DIR, f"usagelog-{month:%Y-%m}-{last_id}.jsonl.gz")
+
+
+def write_archive(path: str, rows: Iterable[tuple]) -> int:
+    """Write ``FIELDS`` tuples to ``path``; return how many were written."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f"{path}.partial"
+    written = 0
+    with open(partial, "wb") as raw:
+        with gzip.GzipFile(filename=os.path.basename(path)[:-3], mode="wb", fileobj=raw) as archive:
+            for row in rows:
+                event = dict(zip(FIELDS, row))
+                event["used_at"] = event["used_at"].isoformat()
+                archive.write(json.dumps(event).encode("utf-8") + b"\n")
+                written += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(partial, path)
+    return written
+
+
+def read_archive(path: str) -> List[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        return [json.loads(line) for line in archive]
+
+
+def cutoff_month(retention_days: int, now: Optional[datetime] = None) -> date:
+    """Months before the returned one ended more than ``retention_days`` ago."""
+    return partitions.month_start((now or datetime.now(dt_timezone.utc)) - timedelta(days=retention_days))
+
+
+def _fetched(cursor):
+    while True:
+        rows = cursor.fetchmany(_CHUNK)
+        if not rows:
+            return
+        yield from rows
+
+
+def _archive_table(name: str, month: date) -> int:
+    """Archive a detached partition and drop it."""
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MAX(id) FROM {qn(name)}")
+        last_id = cursor.fetchone()[0]
+    written = 0
+    if last_id is not None:
+        # A server-side cursor streams the partition; it needs a transaction.
+        with transaction.atomic(), connection.chunked_cursor() as cursor:
+            cursor.execute(f"SELECT {', '.join(FIELDS)} FROM {qn(name)} ORDER BY id")
+            written = write_archive(archive_path(month, last_id), _fetched(cursor))
+    partitions.drop(name)
+    return written
+
+
+def _archive_partitions(before: date, watermark: int) -> int:
+    archived = 0
+    for name, month in partitions.detached_partitions():
+        archived += _archive_table(name, month)
+    qn = connection.ops.quote_name
+    for name, month in partitions.attached_partitions():
+        if month >= before:
+            break
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT MAX(id) FROM {qn(name)}")
+            last_id = cursor.fetchone()[0] or 0
+        if last_id > watermark:
+            logger.warning("Not archiving %s: it has rows that are not rolled up yet", name)
+            continue
+        partitions.detach(name)
+        archived += _archive_table(name, month)
+    return archived
+
+
+def _archive_rows(before: date, watermark: int) -> int:
+    """Archive and delete rows older than ``before`` one month at a time."""
+    end = partitions.month_bounds(before)[0]
+    archived = 0
+    while True:
+        oldest = UsageLog.objects.filter(used_at__lt=end).aggregate(oldest=Min("used_at"))["oldest"]
+        if oldest is None:
+            return archived
+        month = partitions.month_start(oldest.astimezone(dt_timezone.utc))
+        start, end_of_month = partitions.month_bounds(month)
+        month_rows = UsageLog.objects.filter(used_at__gte=start, used_at__lt=end_of_month)
+        last_id = month_rows.aggregate(last_id=Max("id"))["last_id"]
+        if last_id > watermark:
+            logger.warning("Not archiving usage for %s: it has rows that are not rolled up yet", f"{month:%Y-%m}")
+            return archived
+        # Rows inserted from here on wait for the next run.
+        rows = month_rows.filter(id__lte=last_id)
+        with transaction.atomic():
+            written = write_archive(
+                archive_path(month, last_id),
+                rows.order_by("id").values_list(*FIELDS).iterator(chunk_size=_CHUNK),
+            )
+            rows.delete()
+        archived += written
+
+
+def archive(retention_days: Optional[int] = None, now: Optional[datetime] = None) -> int:
+    """Archive and delete every month past retention; return how many events were archived."""
+    if retention_days is None:
+        retention_days = settings.USAGE_LOG_RETENTION_DAYS
+    before = cutoff_month(retention_days, now)
+    watermark = rollups.watermark()
+    archived = 0
+    if partitions.is_partitioned():
+        archived += _archive_partitions(before, watermark)
+    archived += _archive_rows(before, watermark)
+    metrics.incr("usage_log_events_total", archived, outcome="archived")
+    return archived
@@ -0,0 +1,136 @@
+"""Monthly range partitions of the ``UsageLog`` table on PostgreSQL.
+
+``logs`` migration 0002 turns ``accounts_usagelog`` into a table partitioned
+by ``used_at``, with one partition per UTC month (``accounts_usagelog_p202601``)
+and a default partition for rows no monthly partition covers. Queries that
+filter on ``used_at`` only read the partitions in range, and old months are
+dropped whole instead of deleted row by row (see ``logs.services.archive``).
+
+``ensure_partitions()`` creates the coming months' partitions ahead of time.
+Other databases (SQLite in tests) keep one plain table; every function here
+is then a no-op.
+"""
+
+import re
+from datetime import date, datetime, timezone as dt_timezone
+from typing import List, Optional, Tuple
+
+from django.db import connection, transaction
+
+from accounts.models import UsageLog
+
+TABLE = UsageLog._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+_NAME = re.compile(rf"^{TABLE}_p(\d{{4}})(\d{{2}})$")
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def month_bounds(month: date) -> Tuple[datetime, datetime]:
+    """The UTC ``[start, end)`` range of ``month``'s rows."""
+    return (
+        datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc),
+        datetime.combine(next_month(month), datetime.min.time(), tzinfo=dt_timezone.utc),
+    )
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = _NAME.match(name)
+    return date(int(match[1]), int(match[2]), 1) if match else None
+
+
+def is_partitioned() -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE])
+        return cursor.fetchone() is not None
+
+
+def _monthly(names) -> List[Tuple[str, date]]:
+    months = [(name, partition_month(name)) for name in names]
+    return sorted((name, month) for name, month in months if month is not None)
+
+
+def attached_partitions() -> List[Tuple[str, date]]:
+    """``(name, month)`` of each monthly partition, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass",
+            [TABLE],
+        )
+        return _monthly(name for (name,) in cursor.fetchall())
+
+
+def detached_partitions() -> List[Tuple[str, date]]:
+    """Monthly partitions detached by an archive run that did not finish."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname FROM pg_class "
+            "WHERE relkind = 'r' AND relname LIKE %s AND NOT relispartition "
+            "AND relnamespace = (SELECT relnamespace FROM pg_class WHERE oid = %s::regclass)",
+            [f"{TABLE}\\_p%", TABLE],
+        )
+        return _monthly(name for (name,) in cursor.fetchall())
+
+
+def create_partition(month: date) -> None:
+    """Add ``month``'s partition, moving its rows out of the default partition."""
+    qn = connection.ops.quote_name
+    name, start, end = qn(partition_name(month)), *month_bounds(month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT 1 FROM {qn(DEFAULT_PARTITION)} WHERE used_at >= %s AND used_at < %s LIMIT 1",
+            [start, end],
+        )
+        strays = cursor.fetchone() is not None
+        if strays:
+            # A new partition may not overlap rows already in the default one.
+            cursor.execute(f"ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(DEFAULT_PARTITION)}")
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF {qn(TABLE)} FOR VALUES FROM (%s) TO (%s)", [start, end]
+        )
+        if strays:
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {qn(DEFAULT_PARTITION)} WHERE used_at >= %s AND used_at < %s "
+                f"RETURNING *) INSERT INTO {name} SELECT * FROM moved",
+                [start, end],
+            )
+            cursor.execute(f"ALTER TABLE {qn(TABLE)} ATTACH PARTITION {qn(DEFAULT_PARTITION)} DEFAULT")
+
+
+def ensure_partitions(months_ahead: int, today: Optional[date] = None) -> List[str]:
+    """Create the partitions from this month to ``months_ahead`` months out; return new names."""
+    if not is_partitioned():
+        return []
+    existing = {month for _, month in attached_partitions()}
+    month, created = month_start(today or datetime.now(dt_timezone.utc)), []
+    for _ in range(months_ahead + 1):
+        if month not in existing:
+            create_partition(month)
+            created.append(partition_name(month))
+        month = next_month(month)
+    return created
+
+
+def detach(name: str) -> None:
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(name)}")
+
+
+def drop(name: str) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
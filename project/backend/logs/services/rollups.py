@@ -0,0 +1,145 @@
+"""Incremental daily usage rollups and the usage history queries.
+
+``roll_up()`` folds new ``UsageLog`` rows into ``UsageRollup`` by primary
+key. The ``usage_log`` watermark remembers the last id folded. Ids are
+handed out before rows commit, so a run only folds up to the highest id
+the previous run saw (``settled_id``): by then every lower id has either
+committed or been rolled back. ``daily_history()`` adds the not yet folded
+tail from ``UsageLog`` to the rollups, so it is exact at any time.
+"""
+
+import base64
+import binascii
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import TruncDate
+
+from accounts.models import UsageLog
+from logs.models import RollupWatermark, UsageRollup
+
+USAGE_LOG = "usage_log"
+
+
+def _grouped(rows) -> Counter:
+    groups = (
+        rows.annotate(day=TruncDate("used_at", tzinfo=dt_timezone.utc))
+        .values_list("user_id", "day", "endpoint", "success")
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    return Counter({(user_id, day, endpoint, success): n for user_id, day, endpoint, success, n in groups})
+
+
+def _fold(counts: Counter) -> None:
+    existing = {
+        (row.user_id, row.day, row.endpoint, row.success): row
+        for row in UsageRollup.objects.filter(
+            user_id__in={key[0] for key in counts}, day__in={key[1] for key in counts}
+        )
+    }
+    changed, created = [], []
+    for key, n in counts.items():
+        row = existing.get(key)
+        if row is None:
+            user_id, day, endpoint, success = key
+            created.append(UsageRollup(user_id=user_id, day=day, endpoint=endpoint, success=success, count=n))
+        else:
+            row.count += n
+            changed.append(row)
+    UsageRollup.objects.bulk_update(changed, ["count"])
+    UsageRollup.objects.bulk_create(created)
+
+
+def roll_up(batch_size: Optional[int] = None) -> int:
+    """Fold settled ``UsageLog`` rows into ``UsageRollup``; return how many were folded.
+
+    Each batch of ``batch_size`` ids commits with its watermark, under the
+    watermark's row lock, so concurrent runs never fold a row twice.
+    """
+    batch_size = batch_size or settings.USAGE_ROLLUP_BATCH
+    RollupWatermark.objects.get_or_create(name=USAGE_LOG)
+    folded = 0
+    while True:
+        with transaction.atomic():
+            mark = RollupWatermark.objects.select_for_update().get(name=USAGE_LOG)
+            if mark.last_id >= mark.settled_id:
+                newest = UsageLog.objects.aggregate(newest=Max("id"))["newest"] or 0
+                mark.settled_id = max(newest, mark.last_id)
+                mark.save(update_fields=["settled_id", "updated_at"])
+                return folded
+            upper = min(mark.settled_id, mark.last_id + batch_size)
+            rows = UsageLog.objects.filter(id__gt=mark.last_id, id__lte=upper)
+            counts = _grouped(rows)
+            _fold(counts)
+            folded += sum(counts.values())
+            mark.last_id = upper
+            mark.save(update_fields=["last_id", "updated_at"])
+
+
+def watermark() -> int:
+    """The id up to which ``UsageLog`` rows are rolled up."""
+    return RollupWatermark.objects.filter(name=USAGE_LOG).values_list("last_id", flat=True).first() or 0
+
+
+def daily_history(user, start: date, end: date) -> List[Dict]:
+    """Per-day counts for ``user`` from ``start`` to ``end`` (inclusive), newest first.
+
+    Reads at most one rollup row per day, endpoint and outcome, plus the
+    user's rows newer than the watermark.
+    """
+    last_id = watermark()
+    counts: Counter = Counter()
+    rollups = UsageRollup.objects.filter(user=user, day__range=(start, end)).values_list(
+        "user_id", "day", "endpoint", "success", "count"
+    )
+    for user_id, day, endpoint, success, n in rollups:
+        counts[(user_id, day, endpoint, success)] += n
+    tail = UsageLog.objects.filter(
+        id__gt=last_id,
+        user=user,
+        used_at__gte=datetime.combine(start, time.min, tzinfo=dt_timezone.utc),
+        used_at__lt=datetime.combine(end + timedelta(days=1), time.min, tzinfo=dt_timezone.utc),
+    )
+    counts.update(_grouped(tail))
+    return [
+        {"day": day, "endpoint": endpoint, "success": success, "count": n}
+        for (_, day, endpoint, success), n in sorted(
+            counts.items(), key=lambda item: (item[0][1], item[0][2], item[0][3]), reverse=True
+        )
+    ]
+
+
+def encode_cursor(row: UsageLog) -> str:
+    raw = f"{row.used_at.isoformat()}|{row.pk}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raise ``ValueError`` for a cursor this module did not produce."""
+    try:
+        used_at, pk = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(used_at), int(pk)
+    except (UnicodeError, TypeError, ValueError, binascii.Error) as exc:
+        raise ValueError("Invalid cursor.") from exc
+
+
+def event_page(user, cursor: Optional[str], limit: int) -> Tuple[List[UsageLog], Optional[str]]:
+    """One page of ``user``'s raw events, newest first, and the cursor of the next page.
+
+    Keyset pagination on ``(used_at, id)`` walks the ``usagelog_user_used_at_id``
+    index, so every page costs the same however deep it is.
+    """
+    rows = UsageLog.objects.filter(user=user).order_by("-used_at", "-id")
+    if cursor:
+        used_at, pk = decode_cursor(cursor)
+        rows = rows.filter(Q(used_at__lt=used_at) | Q(used_at=used_at, id__lt=pk))
+    page = list(rows[: limit + 1])
+    if len(page) <= limit:
+        return page, None
+    page = page[:limit]
+    return page, encode_cursor(page[-1])
@@ -0,0 +1,99 @@
+import os
+import tempfile
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import UsageLog, User
+
+from .models import UsageRollup
+from .services import archive, rollups
+
+
+class TestUsageHistory(APITestCase):
+    """Daily rollups plus the raw tail, and keyset pages of raw events."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="usage-history@example.com", password="testpass123")
+        self.client.force_authenticate(self.user)
+        now = timezone.now()
+        self.today, self.yesterday = now.date(), (now - timedelta(days=1)).date()
+        UsageLog.objects.bulk_create(
+            [UsageLog(user=self.user, endpoint="/api/v1/tag/", success=True) for _ in range(3)]
+            + [UsageLog(user=self.user, endpoint="/api/v1/tag/", success=False)]
+        )
+        UsageLog.objects.update(used_at=now)
+        UsageLog.objects.filter(success=False).update(used_at=now - timedelta(days=1))
+
+    def _history(self):
+        response = self.client.get(
+            "/api/v1/usage/history/", {"start": self.yesterday.isoformat(), "end": self.today.isoformat()}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [(row["day"], row["success"], row["count"]) for row in response.data["days"]]
+
+    def test_history_is_exact_before_and_after_rolling_up(self):
+        expected = [(self.today, True, 3), (self.yesterday, False, 1)]
+        self.assertEqual(self._history(), expected)
+
+        rollups.roll_up()  # settles the current ids
+        UsageLog.objects.create(user=self.user, endpoint="/api/v1/tag/", success=True)
+        self.assertEqual(rollups.roll_up(), 4)
+        self.assertEqual(UsageRollup.objects.get(user=self.user, day=self.today).count, 3)
+        self.assertEqual(self._history(), [(self.today, True, 4), (self.yesterday, False, 1)])
+
+        self.assertEqual(rollups.roll_up(), 1)
+        self.assertEqual(self._history(), [(self.today, True, 4), (self.yesterday, False, 1)])
+
+    def test_events_are_paged_by_keyset(self):
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 3} if cursor is None else {"limit": 3, "cursor": cursor}
+            response = self.client.get("/api/v1/usage/history/events/", params)
+            self.assertEqual(response.status_code, 200)
+            seen += [event["id"] for event in response.data["results"]]
+            cursor = response.data["next"]
+            if cursor is None:
+                break
+        newest_first = UsageLog.objects.order_by("-used_at", "-id").values_list("id", flat=True)
+        self.assertEqual(seen, list(newest_first))
+
+    def test_bad_requests(self):
+        response = self.client.get("/api/v1/usage/history/events/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/v1/usage/history/", {"start": "2020-01-01", "end": "2026-01-01"})
+        self.assertEqual(response.status_code, 400)
+
+class TestUsageArchive(TestCase):
+    """Months past retention move to gzipped JSONL once they are rolled up."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="usage-archive@example.com", password="testpass123")
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.archive_dir = tmp.name
+        settings_patch = override_settings(USAGE_ARCHIVE_DIR=self.archive_dir)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        self.now = timezone.now()
+        for used_at in (self.now - timedelta(days=200), self.now - timedelta(days=200), self.now):
+            UsageLog.objects.create(user=self.user, endpoint="/api/v1/tag/", used_at=used_at)
+
+    def test_old_months_are_archived_and_deleted(self):
+        rollups.roll_up()
+        rollups.roll_up()
+        self.assertEqual(archive.archive(retention_days=90), 2)
+
+        self.assertEqual(list(UsageLog.objects.values_list("used_at", flat=True)), [self.now])
+        (name,) = os.listdir(self.archive_dir)
+        events = archive.read_archive(os.path.join(self.archive_dir, name))
+        self.assertEqual([event["user_id"] for event in events], [self.user.pk, self.user.pk])
+        history = rollups.daily_history(self.user, (self.now - timedelta(days=200)).date(), self.now.date())
+        self.assertEqual(sum(row["count"] for row in history), 3)
+
+    def test_months_not_rolled_up_are_kept(self):
+        self.assertEqual(archive.archive(retention_days=90), 0)
+        self.assertEqual(UsageLog.objects.count(), 3)
+        self.assertEqual(os.listdir(self.archive_dir), [])
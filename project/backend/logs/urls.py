@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import UsageEventsView, UsageHistoryView
+
+urlpatterns = [
+    path('usage/history/', UsageHistoryView.as_view(), name='usage-history'),
+    path('usage/history/events/', UsageEventsView.as_view(), name='usage-history-events'),
+]
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .serializers import UsageEventSerializer, UsageEventsQuerySerializer, UsageHistoryQuerySerializer
+from .services import rollups
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class UsageHistoryView(APIView):
+    """Daily usage counts per endpoint and outcome for the current user.
+
+    Served from ``UsageRollup`` plus the rows not rolled up yet, so the cost
+    depends on the date range, not on how many events the user has.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = UsageHistoryQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        start, end = query.validated_data["start"], query.validated_data["end"]
+        return Response(
+            {"start": start, "end": end, "days": rollups.daily_history(request.user, start, end)},
+            status=status.HTTP_200_OK,
+        )
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class UsageEventsView(APIView):
+    """The current user's raw usage events, newest first, one page at a time.
+
+    Pass the returned ``next`` cursor back as ``cursor`` to get the next page;
+    ``next`` is null on the last page.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = UsageEventsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        limit = query.validated_data.get("limit", settings.USAGE_HISTORY_PAGE_SIZE)
+        try:
+            page, next_cursor = rollups.event_page(request.user, query.validated_data.get("cursor"), limit)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {"results": UsageEventSerializer(page, many=True).data, "next": next_cursor},
+            status=status.HTTP_200_OK,
+        )